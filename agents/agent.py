@@ -5,8 +5,8 @@ import os
 from flask import Flask, current_app as app
 from db import Database
 from logger import Logger
-from qbittorrent import QBittorrentClient
-from auth import AuthManager
+from qbittorrent import (QBittorrentClient, get_qbittorrent_client, list_qbittorrent_instances,
+                         group_hashes_by_instance, DEFAULT_INSTANCE)
 from sse import ServerSentEvent
 from scanner import perform_series_scan
 from datetime import datetime, timezone
@@ -15,6 +15,56 @@ from rule_engine import RuleEngine
 from filename_formatter import FilenameFormatter
 from logic.renaming_processor import process_and_rename_torrent_files
 
+
+class TorrentTaskState:
+    """
+    Компактная запись задачи агента. Хранит только поля торрента, которые читает машина стадий,
+    вместо полного фрагмента maindata (десятки полей на торрент).
+    """
+    __slots__ = ('torrent_hash', 'series_id', 'torrent_id', 'old_torrent_id', 'stage',
+                 'state', 'total_size', 'progress', 'amount_left',
+                 'last_logged_str', 'recheck_initiated', 'recheck_started_at')
+
+    def __init__(self, torrent_hash: str, series_id: int, torrent_id: str, old_torrent_id: str, stage: str):
+        self.torrent_hash = torrent_hash
+        self.series_id = series_id
+        self.torrent_id = torrent_id
+        self.old_torrent_id = old_torrent_id
+        self.stage = stage
+        self.state = None
+        self.total_size = 0
+        self.progress = 0.0
+        self.amount_left = 0
+        self.last_logged_str = ''
+        self.recheck_initiated = False
+        self.recheck_started_at = 0.0
+
+    @classmethod
+    def from_db(cls, task_data: dict) -> 'TorrentTaskState':
+        return cls(task_data['torrent_hash'], task_data['series_id'], task_data['torrent_id'],
+                   task_data['old_torrent_id'], task_data['stage'])
+
+    def update_info(self, torrent_data: dict):
+        """Копирует из данных qBittorrent (полной записи или дельты) только поля, нужные машине стадий."""
+        get = torrent_data.get
+        self.state = get('state', self.state)
+        self.total_size = get('total_size', self.total_size)
+        self.progress = get('progress', self.progress)
+        self.amount_left = get('amount_left', self.amount_left)
+
+    def to_db_dict(self) -> dict:
+        return {
+            'torrent_hash': self.torrent_hash,
+            'series_id': self.series_id,
+            'torrent_id': self.torrent_id,
+            'old_torrent_id': self.old_torrent_id,
+            'stage': self.stage,
+        }
+
+    def to_queue_dict(self) -> dict:
+        return {'hash': self.torrent_hash, **self.to_db_dict(), 'state': self.state}
+
+
 class Agent(threading.Thread):
     def __init__(self, app: Flask, logger: Logger, db: Database, broadcaster: ServerSentEvent, status_manager: StatusManager):
         super().__init__(daemon=True)
@@ -28,7 +78,27 @@ class Agent(threading.Thread):
         self.lock = threading.RLock()
         self.shutdown_flag = threading.Event()
         self.RECONNECT_DELAY = 10 
+        # Без активных задач зеркало состояния qBittorrent обновляется реже
+        self.IDLE_POLL_INTERVAL = 5
         self.qb_client = None
+        # Клиенты всех экземпляров qBittorrent; список перечитывается из БД раз в INSTANCE_REFRESH_INTERVAL секунд
+        self.qb_clients = {}
+        self.INSTANCE_REFRESH_INTERVAL = 60
+        self.last_instance_refresh = 0
+        # Общее зеркало состояния qBittorrent: этот агент - единственный, кто опрашивает sync/maindata
+        self.qb_state = app.qb_state
+        # Хеши, которые нужно обработать на ближайшем такте (пришли в дельте maindata или сменили стадию)
+        self.dirty_hashes = set()
+        # Время последней обработки задачи: по истечении таймера стадия проверяется даже без дельты
+        self.last_dispatch_times = {}
+        self.STAGE_TIMER_INTERVAL = 30
+        # Размер пачки хешей в одном запросе addTags при переносе старых торрентов под тег
+        self.SCOPE_MIGRATION_BATCH = 200
+        # Команды resume/pause/recheck копятся за такт и отправляются одним запросом на тип команды
+        self.pending_actions = {'resume': [], 'pause': [], 'recheck': []}
+        self.CONTROL_BATCH_SIZE = 200
+        # Сколько ждать после отправки recheck, прежде чем доверять состоянию торрента
+        self.RECHECK_SETTLE_DELAY = 1
 
         self.POST_RECHECK_TARGET_STATES = {
             'queuedUP', 'queuedDL', 'stalledUP', 'stalledDL', 
@@ -66,12 +136,8 @@ class Agent(threading.Thread):
                 'stage': initial_stage,
             }
 
-            self.processing_torrents[torrent_hash] = {
-                **db_task_data,
-                'last_info': {},
-                'last_logged_str': '',
-                'recheck_initiated': False
-            }
+            self.processing_torrents[torrent_hash] = TorrentTaskState.from_db(db_task_data)
+            self.dirty_hashes.add(torrent_hash)
             self.db.add_or_update_agent_task(db_task_data)
             self.logger.info("agent", f"Новая задача добавлена для хеша {torrent_hash[:8]} на стадии '{initial_stage}'.")
             
@@ -83,11 +149,13 @@ class Agent(threading.Thread):
             return self._get_queue_info_unsafe()
             
     def _get_queue_info_unsafe(self):
-        return [{'hash': h, **d} for h, d in self.processing_torrents.items()]
+        return [task.to_queue_dict() for task in self.processing_torrents.values()]
 
     def clear_queue(self):
         with self.lock, self.app.app_context():
             self.processing_torrents.clear()
+            self.dirty_hashes.clear()
+            self.last_dispatch_times.clear()
             all_tasks = self.db.get_all_agent_tasks()
             series_ids_to_update = {t['series_id'] for t in all_tasks}
 
@@ -104,17 +172,22 @@ class Agent(threading.Thread):
         with self.lock:
             task = self.processing_torrents.get(torrent_hash)
             if not task: return
+            self.last_dispatch_times[torrent_hash] = time.time()
             
-            current_info = task.get('last_info', {})
-            stage = task.get('stage')
-            last_logged_str = task.get('last_logged_str', '')
-
-        current_log_str = f"[{torrent_hash[:8]}] Стадия: {stage}, Статус qBit: {current_info.get('state')}"
+            stage = task.stage
+            current_state = task.state
+            total_size = task.total_size
+            recheck_initiated = task.recheck_initiated
+            recheck_started_at = task.recheck_started_at
+            series_id = task.series_id
+            last_logged_str = task.last_logged_str
+
+        current_log_str = f"[{torrent_hash[:8]}] Стадия: {stage}, Статус qBit: {current_state}"
         if app.debug_manager.is_debug_enabled('agent') and current_log_str != last_logged_str:
             self.logger.debug("agent", current_log_str)
             with self.lock:
                 if self.processing_torrents.get(torrent_hash):
-                    self.processing_torrents[torrent_hash]['last_logged_str'] = current_log_str
+                    self.processing_torrents[torrent_hash].last_logged_str = current_log_str
         
         try:
             next_stage = None
@@ -122,17 +195,16 @@ class Agent(threading.Thread):
 
             if stage == 'awaiting_metadata':
                 self.logger.info("agent", f"[{torrent_hash[:8]}] Снятие с паузы для получения метаданных.")
-                self.qb_client.resume_torrents([torrent_hash])
+                self._queue_action('resume', torrent_hash)
                 next_stage = 'polling_for_size'
             
             elif stage == 'polling_for_size':
-                if current_info.get('total_size', 0) > 0:
+                if (total_size or 0) > 0:
                     self.logger.info("agent", f"[{torrent_hash[:8]}] Метаданные получены. Постановка на паузу.")
-                    self.qb_client.pause_torrents([torrent_hash])
+                    self._queue_action('pause', torrent_hash)
                     next_stage = 'awaiting_pause_before_rename'
 
             elif stage == 'awaiting_pause_before_rename':
-                current_state = current_info.get('state')
                 if current_state in self.STABLE_PAUSED_STATES:
                     if app.debug_manager.is_debug_enabled('agent'):
                         self.logger.debug("agent", f"[{torrent_hash[:8]}] Торрент в стабильном состоянии паузы. Переход к переименованию.")
@@ -140,14 +212,14 @@ class Agent(threading.Thread):
                     # Выполняем переименование файлов с распределением по сезонам
                     try:
                         self.logger.info("agent", f"[{torrent_hash[:8]}] Выполнение переименования файлов с распределением по сезонам.")
-                        process_and_rename_torrent_files(self.app, task['series_id'], torrent_hash)
+                        process_and_rename_torrent_files(self.app, series_id, torrent_hash, self._client_for(torrent_hash))
                     except Exception as e:
                         self.logger.error("agent", f"Ошибка при переименовании файлов с распределением по сезонам для {torrent_hash}: {e}", exc_info=True)
                     
                     next_stage = 'renaming'
                 elif current_state:
                     self.logger.warning("agent", f"[{torrent_hash[:8]}] Торрент в неожиданном состоянии '{current_state}' вместо паузы. Принудительная остановка.")
-                    self.qb_client.pause_torrents([torrent_hash])
+                    self._queue_action('pause', torrent_hash)
 
             elif stage == 'renaming':
                 self.logger.info("agent", f"[{torrent_hash[:8]}] Запуск централизованной функции переименования файлов.")
@@ -160,30 +232,31 @@ class Agent(threading.Thread):
                 next_stage = 'rechecking'
 
             elif stage == 'rechecking':
-                current_state = current_info.get('state')
-                recheck_initiated = task.get('recheck_initiated', False)
 
                 if not recheck_initiated:
                     self.logger.info("agent", f"[{torrent_hash[:8]}] Инициация recheck.")
-                    self.qb_client.recheck_torrents([torrent_hash])
+                    self._queue_action('recheck', torrent_hash)
                     with self.lock:
                         if self.processing_torrents.get(torrent_hash):
-                            self.processing_torrents[torrent_hash]['recheck_initiated'] = True
-                    time.sleep(1) 
+                            self.processing_torrents[torrent_hash].recheck_initiated = True
                 
+                elif time.time() - recheck_started_at < self.RECHECK_SETTLE_DELAY:
+                    # qBittorrent мог еще не перевести торрент в checking - проверим на следующем такте
+                    with self.lock:
+                        self.dirty_hashes.add(torrent_hash)
+
                 else:
                     if current_state in self.POST_RECHECK_TARGET_STATES and current_state not in self.CHECKING_STATES:
                         self.logger.info("agent", f"[{torrent_hash[:8]}] Recheck завершен. Переход на 'activating'.")
                         next_stage = 'activating'
                 
             elif stage == 'activating':
-                state = current_info.get('state')
-                if state in self.ACTIVATING_RUNNING_STATES:
+                if current_state in self.ACTIVATING_RUNNING_STATES:
                     self.logger.info("agent", f"[{torrent_hash[:8]}] Торрент активен. Задача выполнена.")
                     task_completed = True
-                elif state in self.ACTIVATING_PAUSED_STATES:
+                elif current_state in self.ACTIVATING_PAUSED_STATES:
                     self.logger.info("agent", f"[{torrent_hash[:8]}] Торрент на паузе. Запуск и завершение.")
-                    self.qb_client.resume_torrents([torrent_hash])
+                    self._queue_action('resume', torrent_hash)
                     task_completed = True
 
             with self.lock, self.app.app_context():
@@ -191,21 +264,23 @@ class Agent(threading.Thread):
                 if not current_task_in_memory: return
 
                 if next_stage:
-                    current_task_in_memory['stage'] = next_stage
-                    db_task_data = {k: v for k, v in current_task_in_memory.items() if k in ['torrent_hash', 'series_id', 'torrent_id', 'old_torrent_id', 'stage']}
+                    current_task_in_memory.stage = next_stage
+                    # Новая стадия может требовать действия сразу, не дожидаясь дельты от qBittorrent
+                    self.dirty_hashes.add(torrent_hash)
                     
-                    self.db.add_or_update_agent_task(db_task_data)
-                    self.status_manager.sync_agent_statuses(task['series_id'])
+                    self.db.add_or_update_agent_task(current_task_in_memory.to_db_dict())
+                    self.status_manager.sync_agent_statuses(series_id)
                     self._broadcast_queue_update()
 
                 if task_completed:
                     del self.processing_torrents[torrent_hash]
+                    self._forget_hash_unsafe(torrent_hash)
                     self.db.remove_agent_task(torrent_hash)
                     
-                    self.status_manager.sync_agent_statuses(task['series_id'])
+                    self.status_manager.sync_agent_statuses(series_id)
                     self._broadcast_queue_update()
                     
-                    self.db.update_series(task['series_id'], {'last_scan_time': datetime.now(timezone.utc)})
+                    self.db.update_series(series_id, {'last_scan_time': datetime.now(timezone.utc)})
                     torrent_entry = self.db.get_torrent_by_hash(torrent_hash)
                     if torrent_entry: self.db.update_torrent_by_id(torrent_entry['id'], {'is_active': True})
 
@@ -214,12 +289,78 @@ class Agent(threading.Thread):
             with self.lock, self.app.app_context():
                 if torrent_hash in self.processing_torrents:
                     del self.processing_torrents[torrent_hash]
+                    self._forget_hash_unsafe(torrent_hash)
                     self.db.remove_agent_task(torrent_hash)
                 
-                self.status_manager.set_status(task['series_id'], 'error', True)
-                self.status_manager.sync_agent_statuses(task['series_id'])
+                self.status_manager.set_status(series_id, 'error', True)
+                self.status_manager.sync_agent_statuses(series_id)
                 self._broadcast_queue_update()
 
+    def _refresh_instances(self, force: bool = False):
+        """Перечитывает список экземпляров qBittorrent: новые подхватываются без перезапуска агента."""
+        if not force and time.time() - self.last_instance_refresh < self.INSTANCE_REFRESH_INTERVAL:
+            return
+        self.last_instance_refresh = time.time()
+        names = list_qbittorrent_instances(self.db)
+        if set(names) != set(self.qb_clients):
+            self.logger.info("agent", f"Опрашиваемые экземпляры qBittorrent: {', '.join(names)}.")
+        self.qb_clients = {name: get_qbittorrent_client(self.db, self.logger, name) for name in names}
+        self.qb_client = self.qb_clients[DEFAULT_INSTANCE]
+        self.qb_state.set_instances(names)
+
+    def _client_for(self, torrent_hash: str) -> QBittorrentClient:
+        """Клиент экземпляра, в котором зеркало видело торрент (основной, если торрент еще не виден)."""
+        instance = self.qb_state.get_instance(torrent_hash)
+        return self.qb_clients.get(instance) or self.qb_client
+
+    def _sync_state_mirror(self) -> bool:
+        """
+        Запрашивает дельты sync/maindata всех экземпляров и применяет их к общему зеркалу.
+        Возвращает False, только если не ответил ни один экземпляр.
+        """
+        any_success = False
+        for instance, client in self.qb_clients.items():
+            updates = client.sync_main_data(self.qb_state.get_rid(instance))
+            if updates is None:
+                self.qb_state.reset(instance)
+                if len(self.qb_clients) > 1:
+                    self.logger.warning("agent", f"Не удалось получить состояние {instance}, его торренты будут обновлены на следующем такте.")
+                continue
+            any_success = True
+
+            changed_hashes = self.qb_state.apply_update(updates, instance)
+            with self.lock:
+                if updates.get('full_update'):
+                    self.dirty_hashes.update(self.processing_torrents.keys())
+                for h in changed_hashes:
+                    task = self.processing_torrents.get(h)
+                    if task:
+                        self.qb_state.read_torrent(h, task.update_info)
+                        self.dirty_hashes.add(h)
+        return any_success
+
+    def _apply_torrent_scope(self):
+        """
+        Ограничивает зеркало торрентами series-tracker (по тегу) и один раз помечает тегом
+        торренты, добавленные до его введения. Хеши из БД отслеживаются в любом случае.
+        """
+        scope_tag = self.qb_client.get_scope_tag()
+        self.qb_state.set_scope(scope_tag)
+        known_hashes = set(self.db.get_all_torrent_hashes()) | {t['torrent_hash'] for t in self.db.get_all_agent_tasks()}
+        self.qb_state.adopt(list(known_hashes))
+        if not scope_tag or self.db.get_setting('qbittorrent_tag_migrated') == scope_tag:
+            return
+
+        self.logger.info("agent", f"Перенос {len(known_hashes)} существующих торрентов под тег '{scope_tag}'.")
+        for instance, hashes in group_hashes_by_instance(self.db, sorted(known_hashes)).items():
+            client = self.qb_clients.get(instance) or self.qb_client
+            for i in range(0, len(hashes), self.SCOPE_MIGRATION_BATCH):
+                if not client.add_tags(hashes[i:i + self.SCOPE_MIGRATION_BATCH], scope_tag):
+                    self.logger.warning("agent", f"Не удалось пометить торренты тегом в {instance}, перенос будет повторен при следующем запуске.")
+                    return
+        self.db.set_setting('qbittorrent_tag_migrated', scope_tag)
+        self.logger.info("agent", f"Перенос торрентов под тег '{scope_tag}' завершен.")
+
     def _recover_agent_tasks_from_db(self, qb_client: QBittorrentClient):
         self.logger.info("agent", "Запуск восстановления незавершенных ЗАДАЧ АГЕНТА из БД.")
         restored_tasks = self.db.get_all_agent_tasks()
@@ -232,30 +373,32 @@ class Agent(threading.Thread):
         
         with self.lock:
             for task_data in restored_tasks:
-                self.processing_torrents[task_data['torrent_hash']] = {
-                    **task_data,
-                    'last_info': {},
-                    'last_logged_str': '',
-                    'recheck_initiated': False
-                }
+                self.processing_torrents[task_data['torrent_hash']] = TorrentTaskState.from_db(task_data)
+                self.dirty_hashes.add(task_data['torrent_hash'])
         
         hashes_to_check = [task['torrent_hash'] for task in restored_tasks]
-        current_infos = qb_client.get_torrents_info(hashes_to_check)
-        info_map = {info['hash']: info for info in current_infos} if current_infos else {}
+        # Первичный снимок состояния берется из зеркала: полный maindata заменяет отдельный запрос torrents/info
+        current_infos = self.qb_state.get_torrents_info(hashes_to_check) if self._sync_state_mirror() else None
+        if current_infos is None:
+            self.logger.warning("agent", "Не удалось получить состояние qBittorrent при восстановлении. Задачи сохранены до следующей синхронизации.")
+        info_map = {info['hash']: info for info in current_infos} if current_infos is not None else None
 
         series_ids_to_sync = set()
         for task_data in restored_tasks:
             h = task_data['torrent_hash']
             series_ids_to_sync.add(task_data['series_id'])
+            if info_map is None:
+                continue
             if h not in info_map:
                 self.logger.warning("agent", f"Задача агента для хеша {h} найдена в БД, но торрент отсутствует в qBittorrent. Удаление устаревшей задачи.")
                 with self.lock:
                     if h in self.processing_torrents: del self.processing_torrents[h]
+                    self._forget_hash_unsafe(h)
                     self.db.remove_agent_task(h)
                 continue
             
             with self.lock:
-                if self.processing_torrents.get(h): self.processing_torrents[h]['last_info'] = info_map[h]
+                if self.processing_torrents.get(h): self.processing_torrents[h].update_info(info_map[h])
         
         self.logger.info("agent", "Восстановление задач агента завершено. Синхронизация статусов...")
         with self.app.app_context():
@@ -292,83 +435,126 @@ class Agent(threading.Thread):
 
     def run(self):
         self.logger.info("agent", "Агент запущен.")
-        rid = 0
         
         with self.app.app_context():
-            auth_manager = AuthManager(self.db, self.logger)
-            self.qb_client = QBittorrentClient(auth_manager, self.db, self.logger)
+            self._refresh_instances(force=True)
+            self._apply_torrent_scope()
             self._recover_tasks(self.qb_client)
 
         self.logger.info("agent", "Переход в штатный режим Long-Polling.")
         while not self.shutdown_flag.is_set():
             with self.app.app_context():
-                if self.processing_torrents:
-                    updates = self.qb_client.sync_main_data(rid)
-
-                    if self.shutdown_flag.is_set(): 
+                self._refresh_instances()
+                # Зеркало обновляется всегда: его читают сканер и агент мониторинга, даже когда очередь пуста
+                if not self._sync_state_mirror():
+                    if self.shutdown_flag.is_set():
                         break
-                    
-                    if updates is None:
-                        self.logger.warning("agent", "Ошибка или таймаут long-polling, повторная попытка.")
-                        time.sleep(self.RECONNECT_DELAY) 
-                        rid = 0
-                        continue
+                    self.logger.warning("agent", "Ошибка или таймаут long-polling, повторная попытка.")
+                    self.shutdown_flag.wait(self.RECONNECT_DELAY)
+                    continue
 
-                    rid = updates.get('server_state', {}).get('rid', rid)
-                    
-                    # --- НАЧАЛО ИЗМЕНЕНИЯ ---
-                    # 1. Сначала обновляем информацию о торрентах, по которым пришли изменения
-                    updated_torrents = updates.get('torrents', {})
-                    with self.lock:
-                        for h, torrent_data in updated_torrents.items():
-                            if h in self.processing_torrents:
-                                self.processing_torrents[h]['last_info'].update(torrent_data)
-
-                    # 2. Затем проходим по ВСЕМ задачам в очереди и обрабатываем каждую
-                    # Создаем копию ключей, чтобы избежать проблем при изменении словаря во время итерации
-                    current_tasks_hashes = []
-                    with self.lock:
-                        current_tasks_hashes = list(self.processing_torrents.keys())
+                if self.shutdown_flag.is_set(): 
+                    break
 
-                    for torrent_hash in current_tasks_hashes:
-                        self._process_task_update(torrent_hash)
-                    # --- КОНЕЦ ИЗМЕНЕНИЯ ---
+                # Обрабатываем только изменившиеся задачи и те, у которых истек таймер стадии
+                for torrent_hash in self._collect_hashes_to_dispatch():
+                    self._process_task_update(torrent_hash)
+                self._flush_actions()
             
-            self.shutdown_flag.wait(1)
+            self.shutdown_flag.wait(1 if self.processing_torrents else self.IDLE_POLL_INTERVAL)
 
         self.logger.info(f"{self.name} был остановлен.")
     
+    def _collect_hashes_to_dispatch(self):
+        """Забирает накопленные 'грязные' хеши и добавляет к ним задачи с истекшим таймером стадии."""
+        now = time.time()
+        with self.lock:
+            for h in self.processing_torrents:
+                if now - self.last_dispatch_times.get(h, 0) >= self.STAGE_TIMER_INTERVAL:
+                    self.dirty_hashes.add(h)
+            hashes = [h for h in self.dirty_hashes if h in self.processing_torrents]
+            self.dirty_hashes.clear()
+        if app.debug_manager.is_debug_enabled('agent') and hashes:
+            self.logger.debug("agent", f"Такт: к обработке {len(hashes)} из {len(self.processing_torrents)} задач.")
+        return hashes
+
+    def _queue_action(self, action: str, torrent_hash: str):
+        with self.lock:
+            if torrent_hash not in self.pending_actions[action]:
+                self.pending_actions[action].append(torrent_hash)
+
+    def _flush_actions(self):
+        """Отправляет накопленные за такт команды: по одному запросу на тип команды (пачками по CONTROL_BATCH_SIZE)."""
+        with self.lock:
+            pending = {action: hashes for action, hashes in self.pending_actions.items() if hashes}
+            self.pending_actions = {'resume': [], 'pause': [], 'recheck': []}
+        if not pending:
+            return
+
+        for action, hashes in pending.items():
+            # Команда уходит в тот экземпляр qBittorrent, где находится торрент
+            by_client = {}
+            for h in hashes:
+                by_client.setdefault(self._client_for(h), []).append(h)
+            for client, client_hashes in by_client.items():
+                sender = {'resume': client.resume_torrents, 'pause': client.pause_torrents, 'recheck': client.recheck_torrents}[action]
+                for i in range(0, len(client_hashes), self.CONTROL_BATCH_SIZE):
+                    sender(client_hashes[i:i + self.CONTROL_BATCH_SIZE])
+            if app.debug_manager.is_debug_enabled('agent'):
+                self.logger.debug("agent", f"Такт: команда {action} отправлена для {len(hashes)} торрентов.")
+
+        if 'recheck' in pending:
+            now = time.time()
+            with self.lock:
+                for h in pending['recheck']:
+                    task = self.processing_torrents.get(h)
+                    if task:
+                        task.recheck_started_at = now
+                        self.dirty_hashes.add(h)
+
+    def _forget_hash_unsafe(self, torrent_hash):
+        self.dirty_hashes.discard(torrent_hash)
+        self.last_dispatch_times.pop(torrent_hash, None)
+
     def add_recheck_task(self, torrent_hash: str, series_id: int, torrent_id: str):
         """
         Добавляет задачу на перепроверку (recheck) для существующего торрента.
         Задача сразу начинается со стадии 'rechecking'.
         """
+        self.add_recheck_tasks(series_id, [(torrent_hash, torrent_id)])
+
+    def add_recheck_tasks(self, series_id: int, torrents: list):
+        """
+        Добавляет задачи на перепроверку для нескольких торрентов сериала [(хеш, torrent_id), ...].
+        Сами команды recheck уйдут в qBittorrent одним запросом на ближайшем такте агента.
+        """
+        initial_stage = 'rechecking'
         with self.lock, self.app.app_context():
-            if torrent_hash in self.processing_torrents:
-                self.logger.warning("agent", f"Задача на recheck для хеша {torrent_hash} не добавлена, т.к. он уже обрабатывается.")
-                return
+            added_hashes = []
+            for torrent_hash, torrent_id in torrents:
+                if torrent_hash in self.processing_torrents:
+                    self.logger.warning("agent", f"Задача на recheck для хеша {torrent_hash} не добавлена, т.к. он уже обрабатывается.")
+                    continue
+
+                db_task_data = {
+                    'torrent_hash': torrent_hash,
+                    'series_id': series_id,
+                    'torrent_id': torrent_id,
+                    'old_torrent_id': 'None',
+                    'stage': initial_stage,
+                }
 
-            initial_stage = 'rechecking'
+                self.processing_torrents[torrent_hash] = TorrentTaskState.from_db(db_task_data)
+                self.dirty_hashes.add(torrent_hash)
+                self.db.add_or_update_agent_task(db_task_data)
+                self.logger.info("agent", f"Новая задача на RECHECK добавлена для хеша {torrent_hash[:8]} на стадии '{initial_stage}'.")
+                added_hashes.append(torrent_hash)
 
-            db_task_data = {
-                'torrent_hash': torrent_hash,
-                'series_id': series_id,
-                'torrent_id': torrent_id,
-                'old_torrent_id': 'None',
-                'stage': initial_stage,
-            }
+            if not added_hashes:
+                return
 
-            self.processing_torrents[torrent_hash] = {
-                **db_task_data,
-                'last_info': {},
-                'last_logged_str': '',
-                'recheck_initiated': False
-            }
-            self.db.add_or_update_agent_task(db_task_data)
-            self.logger.info("agent", f"Новая задача на RECHECK добавлена для хеша {torrent_hash[:8]} на стадии '{initial_stage}'.")
-            
             # Обновляем статусы файлов с 'missing' на 'rechecking'
-            self.db.update_torrent_files_status_by_hashes([torrent_hash], 'missing', 'rechecking')
+            self.db.update_torrent_files_status_by_hashes(added_hashes, 'missing', 'rechecking')
 
             self.status_manager.sync_agent_statuses(series_id)
             self._broadcast_queue_update()
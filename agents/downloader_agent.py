@@ -28,6 +28,14 @@ class DownloaderAgent(threading.Thread):
         self.broadcaster = broadcaster
         self.status_manager = status_manager
         self._shutdown_pipe_r, self._shutdown_pipe_w = os.pipe()
+        # Отдельный pipe для пробуждения при появлении приоритетной работы
+        self._wakeup_pipe_r, self._wakeup_pipe_w = os.pipe()
+        # Приоритетная полоса: загрузки сериалов, сканирование которых запустил пользователь,
+        # выполняются отдельным пулом и не ждут освобождения планового
+        self.PRIORITY_WORKERS = 1
+        self.priority_executor = ThreadPoolExecutor(max_workers=self.PRIORITY_WORKERS, thread_name_prefix='downloader_priority')
+        self.priority_task_ids = set()
+        app.priority_lane.register_wakeup('series', self.wake)
         self._last_update_times = {} # {task_id: timestamp}
         self.UPDATE_THROTTLE_SECONDS = 2.0 # Обновляем БД не чаще, чем раз в 2 сек
 
@@ -117,18 +125,71 @@ class DownloaderAgent(threading.Thread):
             with self.lock:
                 if task_id in self.active_futures:
                     del self.active_futures[task_id]
+                self.priority_task_ids.discard(task_id)
             self.logger.info("downloader_agent", f"Задача {task_id} завершена и удалена из активного списка.")
             self._broadcast_queue_update()
         except Exception as e:
             self.logger.error("downloader_agent", f"Ошибка в колбэке завершения задачи: {e}", exc_info=True)
 
+    def wake(self):
+        """Пробуждает агента для немедленного такта (например, при появлении приоритетной работы)."""
+        try:
+            os.write(self._wakeup_pipe_w, b'x')
+        except OSError:
+            pass
+
+    def _submit_task(self, task, executor, is_priority=False):
+        task_id = task['id']
+        # Используем правильное имя поля 'task_key'
+        task_key = task['task_key']
+        series_id = task['series_id']
+        
+        self.db.update_download_task_status(task_id, 'downloading')
+        self.db.update_media_item_download_status(task_key, 'downloading')
+        
+        future = executor.submit(
+            self._download_task_worker,
+            task_id, task['video_url'], task['save_path'], task_key, series_id
+        )
+        
+        with self.lock:
+            self.active_futures[task_id] = future
+            if is_priority:
+                self.priority_task_ids.add(task_id)
+        future.add_done_callback(self._task_done_callback)
+        
+        if is_priority:
+            self.app.priority_lane.report_start('series', series_id)
+            self.logger.info("downloader_agent", f"Задача ID {task_id} (ключ {task_key}) отправлена в приоритетный пул.")
+        else:
+            self.logger.info("downloader_agent", f"Задача ID {task_id} (ключ {task_key}) отправлена в пул на выполнение.")
+
+    def _dispatch_priority_tasks(self):
+        priority_series = self.app.priority_lane.promoted_keys('series')
+        if not priority_series:
+            return False
+
+        with self.lock:
+            free_slots = self.PRIORITY_WORKERS - len(self.priority_task_ids)
+        if free_slots <= 0:
+            return False
+
+        with self.app.app_context():
+            pending_tasks = self.db.get_pending_download_tasks(free_slots, series_ids=list(priority_series))
+            for task in pending_tasks:
+                self._submit_task(task, self.priority_executor, is_priority=True)
+        return bool(pending_tasks)
+
     def _tick(self):
         self._broadcast_queue_update()
         self.broadcaster.broadcast('agent_heartbeat', {'name': 'downloader'})
         self._update_executor()
 
+        if self._dispatch_priority_tasks():
+            self._broadcast_queue_update()
+
         with self.lock:
-            current_downloads = len(self.active_futures)
+            current_downloads = len(self.active_futures) - len(self.priority_task_ids)
         
         limit = self.executor._max_workers
         if current_downloads >= limit:
@@ -141,24 +202,7 @@ class DownloaderAgent(threading.Thread):
                 
                 if pending_tasks:
                     for task in pending_tasks:
-                        task_id = task['id']
-                        # Используем правильное имя поля 'task_key'
-                        task_key = task['task_key']
-                        series_id = task['series_id']
-                        
-                        self.db.update_download_task_status(task_id, 'downloading')
-                        self.db.update_media_item_download_status(task_key, 'downloading')
-                        
-                        future = self.executor.submit(
-                            self._download_task_worker,
-                            task_id, task['video_url'], task['save_path'], task_key, series_id
-                        )
-                        future.add_done_callback(self._task_done_callback)
-                        
-                        with self.lock:
-                            self.active_futures[task_id] = future
-                        
-                        self.logger.info("downloader_agent", f"Задача ID {task_id} (ключ {task_key}) отправлена в пул на выполнение.")
+                        self._submit_task(task, self.executor)
                     
                     self._broadcast_queue_update()
     
@@ -177,9 +221,11 @@ class DownloaderAgent(threading.Thread):
 
         while not self.shutdown_flag.is_set():
             # 3. Заменяем shutdown_flag.wait() на select()
-            readable, _, _ = select.select([self._shutdown_pipe_r], [], [], self.CHECK_INTERVAL)
-            if readable:
+            readable, _, _ = select.select([self._shutdown_pipe_r, self._wakeup_pipe_r], [], [], self.CHECK_INTERVAL)
+            if self._shutdown_pipe_r in readable:
                 break
+            if self._wakeup_pipe_r in readable:
+                os.read(self._wakeup_pipe_r, 1024)
 
             try:
                 self._tick()
@@ -191,10 +237,13 @@ class DownloaderAgent(threading.Thread):
             # Принудительная остановка без ожидания, чтобы сервис мог быстро закрыться.
             # Задачи продолжат выполняться, но основной поток не будет заблокирован.
             self.executor.shutdown(wait=False)
+        self.priority_executor.shutdown(wait=False)
             
         # 4. Очищаем ресурсы pipe после выхода из цикла
         os.close(self._shutdown_pipe_r)
         os.close(self._shutdown_pipe_w)
+        os.close(self._wakeup_pipe_r)
+        os.close(self._wakeup_pipe_w)
         self.logger.info(f"{self.name} был остановлен.")
 
     def shutdown(self):
@@ -12,13 +12,14 @@ from db import Database
 from logger import Logger
 from scanner import perform_series_scan
 from sse import ServerSentEvent
-from auth import AuthManager
-from qbittorrent import QBittorrentClient
+from qbittorrent import get_qbittorrent_client, qbittorrent_breaker, get_breaker_states
 from status_manager import StatusManager
 from filename_formatter import FilenameFormatter
 from utils.chapter_parser import get_chapters
 # --- ИЗМЕНЕНИЕ: Импортируем централизованную функцию ---
 from logic.metadata_processor import build_final_metadata
+from utils.mirror_hedging import get_hedge_delay
+from utils.mirror_health import probe_due_mirrors
 
 class MonitoringAgent(threading.Thread):
     def __init__(self, app: Flask, logger: Logger, db: Database, broadcaster: ServerSentEvent, status_manager: StatusManager):
@@ -35,12 +36,19 @@ class MonitoringAgent(threading.Thread):
         self.CHECK_INTERVAL = 10 
         self.STATUS_UPDATE_INTERVAL = 5
         self.FILE_VERIFY_INTERVAL = 60
+        self.MIRROR_PROBE_INTERVAL = 60
+        self.last_mirror_probe_time = 0
+        self.mirror_probe_thread = None
         self.last_status_update_time = time.time()
         self.last_file_verify_time = time.time()
         self.qb_client = None
         self._shutdown_pipe_r, self._shutdown_pipe_w = os.pipe()
         self.relocation_event = threading.Event()
         self.last_relocation_check_time = 0
+        # Сериалы, сканируемые в приоритетной полосе (запуск из UI)
+        self.priority_scans = set()
+        self.priority_lock = threading.Lock()
+        self.PRIORITY_START_TIMEOUT = 1.0
 
     def trigger_relocation_check(self):
         """Метод для 'пробуждения' агента для немедленной проверки задач на перемещение."""
@@ -111,11 +119,13 @@ class MonitoringAgent(threading.Thread):
 
                 elif series.get('source_type') == 'torrent':
                     active_torrents = self.db.get_torrents(series_id, is_active=True)
-                    active_hashes = [t['qb_hash'] for t in active_torrents if t.get('qb_hash')]
-                    if active_hashes:
-                        for qb_hash in active_hashes:
-                            if not self.qb_client.set_location(qb_hash, new_base_path):
-                                raise Exception(f"qBittorrent не смог переместить торрент {qb_hash[:8]}.")
+                    for torrent in active_torrents:
+                        qb_hash = torrent.get('qb_hash')
+                        if not qb_hash:
+                            continue
+                        qb_client = get_qbittorrent_client(self.db, self.logger, torrent.get('qb_instance'))
+                        if not qb_client.set_location(qb_hash, new_base_path):
+                            raise Exception(f"qBittorrent не смог переместить торрент {qb_hash[:8]}.")
                     self.db.update_series(series_id, {'save_path': new_base_path})
                 
                 # Завершаем задачу
@@ -205,12 +215,19 @@ class MonitoringAgent(threading.Thread):
             except (ValueError, TypeError):
                 next_scan_time = None
 
+        with self.priority_lock:
+            priority_scans = sorted(self.priority_scans)
+
         return {
             'scanner_enabled': self.db.get_setting('scanner_agent_enabled', 'false') == 'true',
             'scan_interval': int(self.db.get_setting('scan_interval_minutes', 60)),
             'is_scanning': self.scan_in_progress_flag.is_set(),
             'is_awaiting_tasks': self.awaiting_tasks_flag.is_set(),
             'next_scan_time': next_scan_time.isoformat() if next_scan_time else None,
+            'priority_scans': priority_scans,
+            'qbittorrent_breaker': qbittorrent_breaker.get_state(),
+            'qbittorrent_breakers': get_breaker_states(),
+            'mirror_hedge_delay': get_hedge_delay(self.db),
         }
         
     def sync_single_series_filesystem(self, series_id):
@@ -283,8 +300,6 @@ class MonitoringAgent(threading.Thread):
             for series in all_vk_series:
                 self.status_manager.sync_vk_statuses(series['id'])
 
-            if not self.qb_client: return
-
             all_series_for_torrents = [s for s in self.db.get_all_series() if s['source_type'] == 'torrent']
             if not all_series_for_torrents:
                 for series in all_series_for_torrents:
@@ -299,9 +314,11 @@ class MonitoringAgent(threading.Thread):
                     self.status_manager.sync_torrent_statuses(series['id'])
                 return
 
-            all_torrents_info = self.qb_client.get_torrents_info(list(all_hashes))
+            # Состояние читается из общего зеркала, которое поддерживает StatefulAgent через sync/maindata
+            all_torrents_info = self.app.qb_state.get_torrents_info(list(all_hashes))
             if all_torrents_info is None:
-                self.logger.warning("monitoring_agent", "Не удалось получить информацию о торрентах от qBittorrent.")
+                if self.app.debug_manager.is_debug_enabled('monitoring_agent'):
+                    self.logger.debug("monitoring_agent", "Зеркало состояния qBittorrent еще не синхронизировано, обновление статусов пропущено.")
                 return
 
             info_map = {info['hash']: info for info in all_torrents_info}
@@ -325,8 +342,7 @@ class MonitoringAgent(threading.Thread):
         time.sleep(5)
 
         with self.app.app_context():
-            auth_manager = AuthManager(self.db, self.logger)
-            self.qb_client = QBittorrentClient(auth_manager, self.db, self.logger)
+            self.qb_client = get_qbittorrent_client(self.db, self.logger)
             self.logger.info("monitoring_agent", "Выполнение первоначальной проверки статусов файлов...")
             self._periodic_filesystem_sync()
             self.logger.info("monitoring_agent", "Первоначальная проверка завершена.")
@@ -361,6 +377,10 @@ class MonitoringAgent(threading.Thread):
                         self.last_file_verify_time = now
                         self.broadcaster.broadcast('agent_heartbeat', {'name': 'monitoring', 'activity': 'file_verify'})
                     
+                    if (now - self.last_mirror_probe_time) >= self.MIRROR_PROBE_INTERVAL:
+                        self._start_mirror_probe()
+                        self.last_mirror_probe_time = now
+
                     # Периодическая проверка задач на перемещение (запасной механизм)
                     if (now - self.last_relocation_check_time) >= 60: # Проверяем раз в минуту
                        self._process_relocation_task()
@@ -374,6 +394,23 @@ class MonitoringAgent(threading.Thread):
         os.close(self._shutdown_pipe_w)
         self.logger.info(f"{self.name} был остановлен.")
 
+    def _start_mirror_probe(self):
+        """Проверяет упавшие зеркала трекеров в отдельном потоке: таймауты проверок не задерживают такт агента."""
+        if self.mirror_probe_thread and self.mirror_probe_thread.is_alive():
+            return
+
+        def probe():
+            with self.app.app_context():
+                try:
+                    probed = probe_due_mirrors(self.db, self.logger)
+                    if probed and self.app.debug_manager.is_debug_enabled('mirror_health'):
+                        self.logger.debug("mirror_health", f"Проверено зеркал после паузы: {probed}")
+                except Exception as e:
+                    self.logger.error("mirror_health", f"Ошибка фоновой проверки зеркал: {e}", exc_info=True)
+
+        self.mirror_probe_thread = threading.Thread(target=probe, name="MirrorProbe", daemon=True)
+        self.mirror_probe_thread.start()
+
     def handle_startup_scan(self):
         with self.app.app_context():
             status = self.get_status()
@@ -447,6 +484,60 @@ class MonitoringAgent(threading.Thread):
         scan_thread = threading.Thread(target=self._perform_full_scan, args=(final_debug_force_replace,))
         scan_thread.start()
 
+    def trigger_priority_scan(self, series_id: int, debug_force_replace: bool = False) -> dict:
+        """
+        Запускает сканирование сериала по запросу пользователя в отдельном потоке,
+        не дожидаясь планового цикла. Возвращает результат сразу после старта.
+        """
+        with self.priority_lock:
+            if series_id in self.priority_scans:
+                return {"success": False, "error": "Сканирование этого сериала уже запущено."}
+            self.priority_scans.add(series_id)
+
+        lane = self.app.priority_lane
+        lane.promote('scan', series_id)
+        # Загрузки и переименования, порожденные этим сканированием, тоже пойдут вне очереди
+        lane.promote('series', series_id)
+        started_event = threading.Event()
+        start_info = {}
+
+        def _run_priority_scan():
+            start_info['latency'] = lane.report_start('scan', series_id)
+            started_event.set()
+            result = {}
+            try:
+                result = perform_series_scan(series_id, self.status_manager, self.app, debug_force_replace)
+                if not result.get('success'):
+                    self.logger.warning("monitoring_agent", f"Приоритетное сканирование сериала {series_id} завершилось с ошибкой: {result.get('error')}")
+            except Exception as e:
+                self.logger.error("monitoring_agent", f"Ошибка при приоритетном сканировании сериала {series_id}: {e}", exc_info=True)
+                self.status_manager.set_status(series_id, 'error', True)
+                result = {"success": False, "error": str(e)}
+            finally:
+                lane.release('scan', series_id)
+                # Без новых задач обходу лимитов загрузки и переименования не на что распространяться
+                if not result.get('success') or not result.get('tasks_created'):
+                    lane.release('series', series_id)
+                with self.priority_lock:
+                    self.priority_scans.discard(series_id)
+            # Маршрут сканирования отвечает сразу после старта, поэтому итог сообщается интерфейсу через SSE
+            if result.get('success'):
+                message = f"Создано задач для агента: {result['tasks_created']}." if result.get('tasks_created') else "Сканирование завершено."
+            else:
+                message = result.get('error') or "Ошибка сканирования."
+            self.broadcaster.broadcast('scan_finished', {'series_id': series_id, 'success': bool(result.get('success')), 'message': message})
+
+        threading.Thread(target=_run_priority_scan, name=f"PriorityScan-{series_id}", daemon=True).start()
+        started_event.wait(self.PRIORITY_START_TIMEOUT)
+        latency = start_info.get('latency')
+
+        return {
+            "success": True,
+            "started": started_event.is_set(),
+            "start_latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "message": "Сканирование запущено."
+        }
+
     def _perform_full_scan(self, debug_force_replace: bool):
         with self.app.app_context():
             self.logger.info("monitoring_agent", "Начало полного цикла сканирования.")
@@ -463,6 +554,13 @@ class MonitoringAgent(threading.Thread):
 
                 series_id = series['id']
 
+                with self.priority_lock:
+                    in_priority_lane = series_id in self.priority_scans
+                if in_priority_lane:
+                    if self.app.debug_manager.is_debug_enabled('monitoring_agent'):
+                        self.logger.debug("monitoring_agent", f"Пропуск сканирования для '{series['name']}' (ID: {series_id}): сериал сканируется в приоритетной полосе.")
+                    continue
+
                 if self.db.get_all_agent_tasks_for_series(series_id):
                     # --- ИСПРАВЛЕНИЕ: app заменен на self.app ---
                     if self.app.debug_manager.is_debug_enabled('monitoring_agent'):
@@ -3,6 +3,8 @@ import time
 import os
 import json
 from flask import Flask
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from db import Database
 from logger import Logger
 from filename_formatter import FilenameFormatter
@@ -21,6 +23,21 @@ class RenamingAgent(threading.Thread):
         self.db = db
         self.shutdown_flag = threading.Event()
         self.trigger_event = threading.Event()
+        self.CHECK_INTERVAL = 10
+        self.executor = None
+        self.lock = threading.Lock()
+        # {task_id: series_id} - задачи, отправленные в пул
+        self.active_tasks = {}
+        # Приоритетная полоса: задачи сериалов, работу по которым запустил пользователь,
+        # идут отдельным пулом и не ждут освобождения планового
+        self.PRIORITY_WORKERS = 1
+        self.priority_executor = ThreadPoolExecutor(max_workers=self.PRIORITY_WORKERS, thread_name_prefix='renaming_priority')
+        self.priority_task_ids = set()
+        app.priority_lane.register_wakeup('series', self.trigger)
+        # Мьютексы по сериалам: задачи одного сериала выполняются строго по очереди
+        self.series_locks = {}
+        # {task_type: {'count', 'errors', 'wait_total', 'wait_max', 'run_total', 'run_max'}}
+        self.metrics = {}
 
     def trigger(self):
         """Пробуждает агент для проверки очереди задач."""
@@ -34,6 +51,129 @@ class RenamingAgent(threading.Thread):
                 self.logger.info("renaming_agent", f"Возвращено в очередь {requeued_count} 'зависших' задач.")
                 self.trigger()
 
+    def _update_executor(self):
+        with self.app.app_context():
+            try:
+                limit = int(self.db.get_setting('max_parallel_renaming', 3))
+            except (ValueError, TypeError):
+                limit = 3
+        limit = max(1, limit)
+
+        if self.executor is None or self.executor._max_workers != limit:
+            if self.executor:
+                self.logger.info("renaming_agent", f"Изменение лимита параллельного переименования на {limit}. Пересоздание пула.")
+                self.executor.shutdown(wait=True)
+            self.executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='renaming_worker')
+            self.logger.info("renaming_agent", f"Пул потоков переименования создан с лимитом {limit} воркеров.")
+
+    def _get_series_lock(self, series_id):
+        with self.lock:
+            if series_id not in self.series_locks:
+                self.series_locks[series_id] = threading.Lock()
+            return self.series_locks[series_id]
+
+    def _record_metrics(self, task_type, wait_seconds, run_seconds, success):
+        with self.lock:
+            m = self.metrics.setdefault(task_type, {
+                'count': 0, 'errors': 0,
+                'wait_total': 0.0, 'wait_max': 0.0,
+                'run_total': 0.0, 'run_max': 0.0
+            })
+            m['count'] += 1
+            if not success:
+                m['errors'] += 1
+            m['wait_total'] += wait_seconds
+            m['wait_max'] = max(m['wait_max'], wait_seconds)
+            m['run_total'] += run_seconds
+            m['run_max'] = max(m['run_max'], run_seconds)
+
+    def get_metrics(self) -> dict:
+        """Возвращает метрики ожидания в очереди и времени выполнения по типам задач."""
+        with self.lock:
+            result = {}
+            for task_type, m in self.metrics.items():
+                result[task_type] = {
+                    'count': m['count'],
+                    'errors': m['errors'],
+                    'avg_wait_seconds': round(m['wait_total'] / m['count'], 3),
+                    'max_wait_seconds': round(m['wait_max'], 3),
+                    'avg_run_seconds': round(m['run_total'] / m['count'], 3),
+                    'max_run_seconds': round(m['run_max'], 3),
+                }
+            return {'active_tasks': len(self.active_tasks), 'task_types': result}
+
+    def _renaming_task_worker(self, task):
+        task_type = task.get('task_type', 'single_vk')
+        created_at = task.get('created_at')
+        wait_seconds = 0.0
+        if created_at:
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            wait_seconds = max(0.0, (datetime.now(timezone.utc) - created_at).total_seconds())
+
+        with self._get_series_lock(task['series_id']):
+            start_time = time.time()
+            with self.app.app_context():
+                success = self._process_task(task)
+            self._record_metrics(task_type, wait_seconds, time.time() - start_time, success)
+        return task['id']
+
+    def _task_done_callback(self, future):
+        try:
+            task_id = future.result()
+            with self.lock:
+                series_id = self.active_tasks.pop(task_id, None)
+                self.priority_task_ids.discard(task_id)
+                series_busy = series_id in self.active_tasks.values()
+
+            if series_id is not None and not series_busy:
+                with self.app.app_context():
+                    if not self.db.get_all_renaming_tasks(series_id):
+                        self.logger.info("renaming_agent", f"Отправка сигнала о завершении переименования для series_id: {series_id}")
+                        self.app.sse_broadcaster.broadcast('renaming_complete', {'series_id': series_id})
+        except Exception as e:
+            self.logger.error("renaming_agent", f"Ошибка в колбэке завершения задачи: {e}", exc_info=True)
+        finally:
+            # Освободился воркер или сериал: следующая задача этого сериала может быть взята сразу
+            self.trigger()
+
+    def _dispatch_pending_tasks(self):
+        self._update_executor()
+        limit = self.executor._max_workers
+        priority_series = self.app.priority_lane.promoted_keys('series')
+
+        with self.app.app_context():
+            pending_tasks = self.db.get_pending_renaming_tasks()
+        # Задачи приоритетных сериалов рассматриваются первыми, порядок внутри групп сохраняется
+        pending_tasks.sort(key=lambda t: t['series_id'] not in priority_series)
+
+        dispatched = 0
+        for task in pending_tasks:
+            is_priority = task['series_id'] in priority_series
+            with self.lock:
+                # Для каждого сериала в работу берется только самая старая задача:
+                # следующая будет взята после ее завершения, сохраняя порядок
+                if task['id'] in self.active_tasks or task['series_id'] in self.active_tasks.values():
+                    continue
+                if is_priority:
+                    if len(self.priority_task_ids) >= self.PRIORITY_WORKERS:
+                        continue
+                    self.priority_task_ids.add(task['id'])
+                elif len(self.active_tasks) - len(self.priority_task_ids) >= limit:
+                    continue
+                self.active_tasks[task['id']] = task['series_id']
+
+            with self.app.app_context():
+                self.db.update_renaming_task(task['id'], {'status': 'in_progress'})
+            executor = self.priority_executor if is_priority else self.executor
+            future = executor.submit(self._renaming_task_worker, task)
+            future.add_done_callback(self._task_done_callback)
+            if is_priority:
+                self.app.priority_lane.report_start('series', task['series_id'])
+            dispatched += 1
+
+        return dispatched
+
     def run(self):
         """Основной цикл работы агента."""
         self.logger.info(f"{self.name} запущен.")
@@ -41,30 +181,22 @@ class RenamingAgent(threading.Thread):
         self.recover_tasks()
 
         while not self.shutdown_flag.is_set():
-            self.trigger_event.wait()
+            self.trigger_event.wait(self.CHECK_INTERVAL)
             if self.shutdown_flag.is_set():
                 break
+            self.trigger_event.clear()
 
-            self.logger.info("renaming_agent", "Агент пробудился. Проверка очереди задач...")
-            processed_series_ids = set()
+            try:
+                dispatched = self._dispatch_pending_tasks()
+                if dispatched:
+                    self.logger.info("renaming_agent", f"В пул отправлено {dispatched} задач на переименование.")
+            except Exception as e:
+                self.logger.error("renaming_agent", f"Критическая ошибка при распределении задач: {e}", exc_info=True)
 
-            with self.app.app_context():
-                while True:
-                    task = self.db.get_pending_renaming_task()
-                    if not task:
-                        break
-                    
-                    processed_series_ids.add(task['series_id'])
-                    self._process_task(task)
-            
-            if processed_series_ids:
-                with self.app.app_context():
-                    for series_id in processed_series_ids:
-                        self.logger.info("renaming_agent", f"Отправка сигнала о завершении переименования для series_id: {series_id}")
-                        self.app.sse_broadcaster.broadcast('renaming_complete', {'series_id': series_id})
-            
-            self.trigger_event.clear()
-            self.logger.info("renaming_agent", "Очередь обработана. Агент уходит в режим ожидания.")
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        self.priority_executor.shutdown(wait=False)
+        self.logger.info(f"{self.name} был остановлен.")
 
     def shutdown(self):
         self.logger.info(f"{self.name}: получен сигнал на остановку.")
@@ -77,7 +209,6 @@ class RenamingAgent(threading.Thread):
         task_type = task.get('task_type', 'single_vk')
 
         self.logger.info("renaming_agent", f"Обработка задачи ID {task_id}, тип: {task_type}")
-        self.db.update_renaming_task(task_id, {'status': 'in_progress'})
 
         try:
             if task_type == 'mass_torrent_reprocess':
@@ -87,10 +218,12 @@ class RenamingAgent(threading.Thread):
             
             self.db.delete_renaming_task(task_id)
             self.logger.info("renaming_agent", f"Задача ID {task_id} успешно завершена.")
+            return True
 
         except Exception as e:
             self.logger.error("renaming_agent", f"Ошибка при обработке задачи ID {task_id}: {e}", exc_info=True)
             self.db.update_renaming_task(task_id, {'status': 'error', 'error_message': str(e)})
+            return False
 
     def _process_mass_vk_task(self, task):
         """Обрабатывает пакетную задачу для VK-файлов с расширенным логированием."""
@@ -8,6 +8,7 @@ import re
 import select
 import subprocess
 from flask import Flask
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from db import Database
 from logger import Logger
@@ -29,6 +30,16 @@ class SlicingAgent(threading.Thread):
         self.CHECK_INTERVAL = 5
         self.status_manager = status_manager
         self._shutdown_pipe_r, self._shutdown_pipe_w = os.pipe()
+        self.executor = None
+        self.lock = threading.Lock()
+        # {task_id: {'future': ..., 'device': ..., 'series_id': ..., 'priority': bool}}
+        self.active_tasks = {}
+        # Приоритетная полоса: нарезка, запущенная пользователем, идет отдельным пулом
+        # в обход общего лимита и лимита на устройство
+        self._wakeup_pipe_r, self._wakeup_pipe_w = os.pipe()
+        self.PRIORITY_WORKERS = 1
+        self.priority_executor = ThreadPoolExecutor(max_workers=self.PRIORITY_WORKERS, thread_name_prefix='slicing_priority')
+        app.priority_lane.register_wakeup('slicing', self.wake)
 
     def recover_tasks(self):
         """Восстанавливает прерванные задачи при старте."""
@@ -189,29 +200,158 @@ class SlicingAgent(threading.Thread):
             # Синхронизируем статусы VK-сериала после ошибки
             self.status_manager.sync_vk_statuses(series_id)
         finally:
-            self.status_manager.set_status(series_id, 'slicing', False)
+            with self.lock:
+                # Задача убирается из активных здесь, а не в колбэке: иначе две одновременно завершившиеся
+                # задачи сериала видят друг друга активными и ни одна не снимает статус 'slicing'
+                self.active_tasks.pop(task_id, None)
+                other_active = any(t['series_id'] == series_id for t in self.active_tasks.values())
+            if not other_active:
+                self.status_manager.set_status(series_id, 'slicing', False)
             self._broadcast_queue_update()
 
+    def _update_executor(self):
+        with self.app.app_context():
+            try:
+                limit = int(self.db.get_setting('max_parallel_slicing', 2))
+            except (ValueError, TypeError):
+                limit = 2
+        limit = max(1, limit)
+
+        if self.executor is None or self.executor._max_workers != limit:
+            if self.executor:
+                self.logger.info("slicing_agent", f"Изменение лимита параллельной нарезки на {limit}. Пересоздание пула.")
+                self.executor.shutdown(wait=True)
+            self.executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='slicing_worker')
+            self.logger.info("slicing_agent", f"Пул потоков нарезки создан с лимитом {limit} воркеров.")
+
+    def _get_device_key(self, series):
+        """Определяет устройство, на котором лежат файлы сериала (исходник и нарезка пишутся в save_path)."""
+        try:
+            return os.stat(series['save_path']).st_dev
+        except (OSError, TypeError):
+            # Путь недоступен: ограничиваем по самому пути, задача все равно упадет с понятной ошибкой
+            return series.get('save_path')
+
+    def _slicing_task_worker(self, task):
+        with self.app.app_context():
+            self._process_task(task)
+        return task['id']
+
+    def _task_done_callback(self, future):
+        try:
+            task_id = future.result()
+            with self.lock:
+                if task_id in self.active_tasks:
+                    del self.active_tasks[task_id]
+            self.logger.info("slicing_agent", f"Задача нарезки {task_id} завершена и удалена из активного списка.")
+        except Exception as e:
+            self.logger.error("slicing_agent", f"Ошибка в колбэке завершения задачи нарезки: {e}", exc_info=True)
+
+    def wake(self):
+        """Пробуждает агента для немедленного такта (например, при ручном запуске нарезки)."""
+        try:
+            os.write(self._wakeup_pipe_w, b'x')
+        except OSError:
+            pass
+
+    def _submit_task(self, task, executor, device, is_priority=False):
+        # Помечаем задачу до отправки в пул, чтобы следующий такт не взял ее повторно
+        self.db.update_slicing_task(task['id'], {'status': 'slicing'})
+        with self.lock:
+            future = executor.submit(self._slicing_task_worker, task)
+            self.active_tasks[task['id']] = {'future': future, 'device': device, 'series_id': task['series_id'], 'priority': is_priority}
+        future.add_done_callback(self._task_done_callback)
+
+        if is_priority:
+            self.app.priority_lane.report_start('slicing', task['id'])
+            self.app.priority_lane.release('slicing', task['id'])
+            self.logger.info("slicing_agent", f"Взята в работу приоритетная задача на нарезку ID: {task['id']}")
+        else:
+            self.logger.info("slicing_agent", f"Взята в работу задача на нарезку ID: {task['id']} (устройство: {device})")
+
+    def _tick(self):
+        self.broadcaster.broadcast('agent_heartbeat', {'name': 'slicing'})
+        self._update_executor()
+
+        priority_ids = self.app.priority_lane.promoted_keys('slicing')
+        with self.lock:
+            free_priority_slots = self.PRIORITY_WORKERS - sum(1 for t in self.active_tasks.values() if t['priority'])
+
+        with self.app.app_context():
+            pending_tasks = self.db.get_pending_slicing_tasks()
+
+            if priority_ids and free_priority_slots > 0:
+                for task in pending_tasks:
+                    if free_priority_slots <= 0:
+                        break
+                    if task['id'] in priority_ids:
+                        series = self.db.get_series(task['series_id'])
+                        device = self._get_device_key(series) if series else None
+                        self._submit_task(task, self.priority_executor, device, is_priority=True)
+                        free_priority_slots -= 1
+                pending_tasks = [t for t in pending_tasks if t['id'] not in self.active_tasks]
+
+        with self.lock:
+            current_count = sum(1 for t in self.active_tasks.values() if not t['priority'])
+            device_load = {}
+            for t in self.active_tasks.values():
+                if not t['priority']:
+                    device_load[t['device']] = device_load.get(t['device'], 0) + 1
+
+        limit = self.executor._max_workers
+        if current_count >= limit:
+            return
+
+        with self.app.app_context():
+            try:
+                per_device_limit = max(1, int(self.db.get_setting('max_slicing_per_device', 1)))
+            except (ValueError, TypeError):
+                per_device_limit = 1
+
+            for task in pending_tasks:
+                if current_count >= limit:
+                    break
+                if task['id'] in priority_ids:
+                    # Ждет освобождения приоритетного воркера
+                    continue
+
+                series = self.db.get_series(task['series_id'])
+                device = self._get_device_key(series) if series else None
+                if device_load.get(device, 0) >= per_device_limit:
+                    if self.app.debug_manager.is_debug_enabled('slicing_agent'):
+                        self.logger.debug("slicing_agent", f"Задача ID {task['id']} ждет: лимит нарезки для устройства {device} исчерпан.")
+                    continue
+
+                self._submit_task(task, self.executor, device)
+                device_load[device] = device_load.get(device, 0) + 1
+                current_count += 1
+
     def run(self):
         self.logger.info(f"{self.name} запущен.")
         time.sleep(10)
         self.recover_tasks()
 
         while not self.shutdown_flag.is_set():
-            readable, _, _ = select.select([self._shutdown_pipe_r], [], [], self.CHECK_INTERVAL)
-            if readable:
+            readable, _, _ = select.select([self._shutdown_pipe_r, self._wakeup_pipe_r], [], [], self.CHECK_INTERVAL)
+            if self._shutdown_pipe_r in readable:
                 break
+            if self._wakeup_pipe_r in readable:
+                os.read(self._wakeup_pipe_r, 1024)
                 
-            with self.app.app_context():
-                self.broadcaster.broadcast('agent_heartbeat', {'name': 'slicing'})
-                task = self.db.get_pending_slicing_task()
-            
-                if task:
-                    self.logger.info("slicing_agent", f"Взята в работу задача на нарезку ID: {task['id']}")
-                    self._process_task(task)
+            try:
+                self._tick()
+            except Exception as e:
+                self.logger.error("slicing_agent", f"Критическая ошибка в такте: {e}", exc_info=True)
         
+        if self.executor:
+            # Прерванные задачи вернутся в очередь при следующем запуске (recover_tasks), прогресс по главам сохранен в БД
+            self.executor.shutdown(wait=False)
+        self.priority_executor.shutdown(wait=False)
+
         os.close(self._shutdown_pipe_r)
         os.close(self._shutdown_pipe_w)
+        os.close(self._wakeup_pipe_r)
+        os.close(self._wakeup_pipe_w)
         self.logger.info(f"{self.name} был остановлен.")
 
     def shutdown(self):
@@ -1,13 +1,17 @@
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Optional, Dict
 import requests
-import cloudscraper
 import time
-from bs4 import BeautifulSoup
 from db import Database
 from logger import Logger
 from dataclasses import dataclass
 from flask import current_app as app
 from urllib.parse import urlparse
+from utils.rate_limiter import get_rate_limiter
+from utils.session_store import get_session_store
+
+if TYPE_CHECKING:
+    # Только для аннотаций: в рантайме cloudscraper импортируется лениво в get_scraper
+    import cloudscraper
 
 @dataclass
 class AuthCredentials:
@@ -17,26 +21,25 @@ class AuthCredentials:
 
 class AuthManager:
     DEBUG = True
+    # Фрагменты формы входа в шапке страниц трекера, которые видит только гость
+    LOGGED_OUT_MARKERS = {
+        'kinozal': ('takelogin.php',),
+        'rutracker': ('name="login_username"',),
+    }
 
     def __init__(self, db: Database, logger: Logger):
         self.db = db
         self.logger = logger
-        # --- ИЗМЕНЕНИЕ: Заменяем одиночную сессию на словарь для поддержки нескольких доменов ---
-        self.kinozal_sessions: Dict[str, requests.Session] = {}
-        self.rutracker_sessions: Dict[str, requests.Session] = {}
-        # ------------------------------------------------------------------------------------
+        # Сессии Kinozal и RuTracker хранятся в общем хранилище (utils/session_store): они переживают
+        # отдельные сканирования и перезапуски, вход выполняется только после отказа в авторизации
         self.qb_session: Optional[requests.Session] = None
         self.qb_sid: Optional[str] = None
-        self.scraper: Optional[cloudscraper.CloudScraper] = None
+        self.scraper: Optional["cloudscraper.CloudScraper"] = None
 
     def get_kinozal_session(self, url: str) -> Optional[requests.Session]:
         """
-        Получает или создает и КЭШИРУЕТ валидную сессию для Kinozal.
-        Теперь с циклом повторных попыток при авторизации.
+        Возвращает сессию Kinozal для домена из URL: сохраненную (в памяти или в базе) или после нового входа.
         """
-        MAX_LOGIN_RETRIES = 5
-        RETRY_LOGIN_DELAY = 5
-
         if app.debug_manager.is_debug_enabled('auth'):
             self.logger.debug("auth", f"[get_kinozal_session] Вызван для URL {url} из AuthManager ID: {id(self)}")
 
@@ -48,16 +51,21 @@ class AuthManager:
             self.logger.error("auth", f"Не удалось распарсить URL '{url}' для получения сессии: {e}")
             return None
 
-        if domain in self.kinozal_sessions:
-            session = self.kinozal_sessions[domain]
-            if app.debug_manager.is_debug_enabled('auth'):
-                self.logger.debug("auth", f"Использована кэшированная сессия ID: {id(session)} для {domain}")
-            return session
-
-        self.logger.info("auth", f"Создание новой сессии для домена {domain}")
         credentials = self.db.get_auth("kinozal")
         if not credentials: return None
 
+        session = get_session_store(self.db, self.logger).get(
+            "kinozal", domain, credentials, lambda: self._login_kinozal(domain, base_url, credentials))
+        if session and app.debug_manager.is_debug_enabled('auth'):
+            self.logger.debug("auth", f"Использована сессия ID: {id(session)} для {domain}")
+        return session
+
+    def _login_kinozal(self, domain: str, base_url: str, credentials: Dict) -> Optional[requests.Session]:
+        """Вход на Kinozal с повторными попытками. Вызывается хранилищем сессий, только если сохраненной сессии нет."""
+        MAX_LOGIN_RETRIES = 5
+        RETRY_LOGIN_DELAY = 5
+
+        self.logger.info("auth", f"Создание новой сессии для домена {domain}")
         # --- НАЧАЛО ИЗМЕНЕНИЙ: Добавлен цикл повторных попыток ---
         for attempt in range(MAX_LOGIN_RETRIES):
             try:
@@ -65,6 +73,7 @@ class AuthManager:
                 login_url = f"{base_url}/takelogin.php"
                 self.logger.info("auth", f"Попытка авторизации на {domain} (попытка {attempt + 1}/{MAX_LOGIN_RETRIES})...")
                 
+                get_rate_limiter(self.db, self.logger).acquire(login_url)
                 response = session.post(
                     login_url, 
                     data={"username": credentials["username"], "password": credentials["password"], "returnto": ""}, 
@@ -81,7 +90,6 @@ class AuthManager:
                 if app.debug_manager.is_debug_enabled('auth'):
                     self.logger.debug("auth", f"[ОТЛАДКА] Cookies ПОСЛЕ ЛОГИНА: {session.cookies.get_dict()}")
 
-                self.kinozal_sessions[domain] = session
                 return session
 
             except requests.RequestException as e:
@@ -97,11 +105,8 @@ class AuthManager:
         
     def get_rutracker_session(self, url: str) -> Optional[requests.Session]:
         """
-        Получает или создает и КЭШИРУЕТ валидную сессию для RuTracker.
+        Возвращает сессию RuTracker для домена из URL: сохраненную (в памяти или в базе) или после нового входа.
         """
-        MAX_LOGIN_RETRIES = 5
-        RETRY_LOGIN_DELAY = 5
-
         if app.debug_manager.is_debug_enabled('auth'):
             self.logger.debug("auth", f"[get_rutracker_session] Вызван для URL {url} из AuthManager ID: {id(self)}")
 
@@ -113,16 +118,22 @@ class AuthManager:
             self.logger.error("auth", f"Не удалось распарсить URL '{url}' для получения сессии: {e}")
             return None
 
-        if domain in self.rutracker_sessions:
-            session = self.rutracker_sessions[domain]
-            if app.debug_manager.is_debug_enabled('auth'):
-                self.logger.debug("auth", f"Использована кэшированная сессия ID: {id(session)} для {domain}")
-            return session
-
-        self.logger.info("auth", f"Создание новой сессии для домена {domain}")
         credentials = self.db.get_auth("rutracker")
         if not credentials: return None
 
+        session = get_session_store(self.db, self.logger).get(
+            "rutracker", domain, credentials, lambda: self._login_rutracker(domain, base_url, credentials))
+        if session and app.debug_manager.is_debug_enabled('auth'):
+            self.logger.debug("auth", f"Использована сессия ID: {id(session)} для {domain}")
+        return session
+
+    def _login_rutracker(self, domain: str, base_url: str, credentials: Dict) -> Optional[requests.Session]:
+        """Вход на RuTracker (страница формы входа и отправка формы) с повторными попытками."""
+        MAX_LOGIN_RETRIES = 5
+        RETRY_LOGIN_DELAY = 5
+
+        self.logger.info("auth", f"Создание новой сессии для домена {domain}")
+
         for attempt in range(MAX_LOGIN_RETRIES):
             try:
                 session = requests.Session()
@@ -131,7 +142,9 @@ class AuthManager:
                 self.logger.info("auth", f"Попытка авторизации на {domain} (попытка {attempt + 1}/{MAX_LOGIN_RETRIES})...")
                 
                 # Сначала получаем страницу логина, чтобы получить возможные скрытые поля
+                get_rate_limiter(self.db, self.logger).acquire(login_url)
                 login_page_response = session.get(login_url, timeout=15)
+                from bs4 import BeautifulSoup
                 login_page_soup = BeautifulSoup(login_page_response.text, 'html.parser')
                 
                 # Находим форму логина
@@ -157,6 +170,7 @@ class AuthManager:
                 if "login" not in form_data:
                     form_data["login"] = "Вход"
 
+                get_rate_limiter(self.db, self.logger).acquire(login_url)
                 response = session.post(
                     login_url,
                     data=form_data,
@@ -195,7 +209,6 @@ class AuthManager:
                         # Возможно, авторизация прошла успешно, но нужно проверить другой признак
                         self.logger.info("auth", f"Возможно, успешная авторизация на {domain} (проверка по другим признакам).")
                
-                self.rutracker_sessions[domain] = session
                 return session
 
             except requests.RequestException as e:
@@ -208,8 +221,22 @@ class AuthManager:
         
         return None  # На всякий случай, если цикл завершится без возврата
         
-    def get_scraper(self) -> cloudscraper.CloudScraper:
+    def is_logged_out_page(self, auth_type: str, html: str) -> bool:
+        """Признак ответа для гостя: на странице есть форма входа, которой нет у авторизованного пользователя."""
+        markers = self.LOGGED_OUT_MARKERS.get(auth_type)
+        return bool(markers and html and any(marker in html for marker in markers))
+
+    def invalidate_session(self, auth_type: str, url: str, reason: str):
+        """Сбрасывает сохраненную сессию трекера после отказа в авторизации; следующий запрос сессии выполнит вход."""
+        domain = urlparse(url).netloc.replace('www.', '')
+        if auth_type == 'kinozal':
+            domain = domain.replace('dl.', '')
+        get_session_store(self.db, self.logger).invalidate(auth_type, domain, reason)
+
+    def get_scraper(self) -> "cloudscraper.CloudScraper":
         if self.scraper is None:
+            # cloudscraper нужен только для Astar: импортируется при первом обращении, а не при старте воркера
+            import cloudscraper
             if app.debug_manager.is_debug_enabled('auth'):
                 self.logger.debug("auth", "Создание нового экземпляра CloudScraper")
             self.scraper = cloudscraper.create_scraper()
@@ -238,9 +265,11 @@ class AuthManager:
             # Для RuTracker используем get_rutracker_session(url)
             return {"success": True, "message": "Для получения сессии используйте get_rutracker_session(url)"}
 
-        elif auth_type == "qbittorrent":
+        elif auth_type == "qbittorrent" or auth_type.startswith("qbittorrent_"):
+            # Дополнительные экземпляры qBittorrent хранятся как 'qbittorrent_<имя>', у каждого свой SID
+            sid_setting = f"{auth_type}_sid"
             try:
-                saved_sid = self.db.get_setting("qbittorrent_sid")
+                saved_sid = self.db.get_setting(sid_setting)
                 if saved_sid and not self.qb_session:
                     self.qb_session = requests.Session()
                     self.qb_session.cookies.set("SID", saved_sid, domain=self._parse_domain(creds.url))
@@ -248,7 +277,7 @@ class AuthManager:
                         self.logger.debug("auth", "Попытка использовать существующий SID для qBittorrent")
                     response = self.qb_session.get(f"{creds.url}/api/v2/app/version")
                     if response.status_code == 200:
-                        self.logger.info("auth", "Использован существующий SID для qBittorrent")
+                        self.logger.info("auth", f"Использован существующий SID для {auth_type}")
                         return {"success": True, "session": self.qb_session}
 
                 self.qb_session = requests.Session()
@@ -261,16 +290,20 @@ class AuthManager:
                 if response.status_code == 200 and response.text == "Ok.":
                     self.qb_sid = response.cookies.get("SID")
                     if self.qb_sid:
-                        self.db.set_setting("qbittorrent_sid", self.qb_sid)
-                        self.logger.info("auth", "Успешная авторизация qBittorrent")
+                        self.db.set_setting(sid_setting, self.qb_sid)
+                        self.logger.info("auth", f"Успешная авторизация {auth_type}")
                         return {"success": True, "session": self.qb_session}
                     self.logger.error("auth", "SID не получен от qBittorrent")
                     return {"error": "Не удалось авторизоваться в qBittorrent"}
+                if response.status_code >= 500:
+                    self.logger.error("auth", f"qBittorrent ответил на вход статусом {response.status_code}")
+                    return {"error": f"qBittorrent недоступен (HTTP {response.status_code})", "unreachable": True}
                 self.logger.error("auth", "Не удалось авторизоваться в qBittorrent")
                 return {"error": "Не удалось авторизоваться в qBittorrent"}
             except requests.RequestException as e:
                 self.logger.error("auth", f"Ошибка авторизации qBittorrent: {str(e)}", exc_info=e)
-                return {"error": "Не удалось подключиться к qBittorrent"}
+                # 'unreachable' отличает недоступный экземпляр от неверных учетных данных
+                return {"error": "Не удалось подключиться к qBittorrent", "unreachable": True}
 
         self.logger.error("auth", f"Неизвестный тип авторизации: {auth_type}")
         return {"error": f"Неизвестный тип авторизации: {auth_type}"}
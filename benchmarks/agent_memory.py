@@ -0,0 +1,110 @@
+# Файл: benchmarks/agent_memory.py
+"""
+Память и стоимость обновления записей задач StatefulAgent.
+
+Сравнивает прежнее представление (dict задачи с полной копией фрагмента maindata в 'last_info')
+с компактной записью TorrentTaskState на N отслеживаемых торрентах (по умолчанию 5000).
+
+Пример:  python benchmarks/agent_memory.py --count 5000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.agent import TorrentTaskState
+
+# Набор полей торрента в ответе sync/maindata qBittorrent 4.x
+MAINDATA_FIELDS = (
+    'added_on', 'amount_left', 'auto_tmm', 'availability', 'category', 'completed', 'completion_on',
+    'content_path', 'dl_limit', 'dlspeed', 'download_path', 'downloaded', 'downloaded_session', 'eta',
+    'f_l_piece_prio', 'force_start', 'infohash_v1', 'infohash_v2', 'last_activity', 'magnet_uri',
+    'max_ratio', 'max_seeding_time', 'name', 'num_complete', 'num_incomplete', 'num_leechs', 'num_seeds',
+    'priority', 'progress', 'ratio', 'ratio_limit', 'save_path', 'seeding_time', 'seeding_time_limit',
+    'seen_complete', 'seq_dl', 'size', 'state', 'super_seeding', 'tags', 'time_active', 'total_size',
+    'tracker', 'trackers_count', 'up_limit', 'uploaded', 'uploaded_session', 'upspeed',
+)
+
+
+def _maindata_fragment(index: int) -> dict:
+    torrent_hash = f"{index:040x}"
+    fragment = {}
+    for field in MAINDATA_FIELDS:
+        if field in ('name', 'content_path', 'save_path', 'download_path', 'tracker', 'magnet_uri', 'tags', 'category'):
+            fragment[field] = f"/downloads/series/{field}/{torrent_hash}"
+        elif field in ('progress', 'ratio', 'availability', 'max_ratio', 'ratio_limit'):
+            fragment[field] = 0.5 + index * 1e-6
+        elif field == 'state':
+            fragment[field] = 'pausedDL'
+        else:
+            fragment[field] = 1_000_000 + index
+    fragment['infohash_v1'] = torrent_hash
+    return fragment
+
+
+def _legacy_task(index: int, fragment: dict) -> dict:
+    return {
+        'torrent_hash': f"{index:040x}",
+        'series_id': 1 + index % 50,
+        'torrent_id': f"t{index:08d}",
+        'old_torrent_id': 'None',
+        'stage': 'rechecking',
+        'last_info': dict(fragment),
+        'last_logged_str': '',
+        'recheck_initiated': False,
+    }
+
+
+def _compact_task(index: int, fragment: dict) -> TorrentTaskState:
+    task = TorrentTaskState(f"{index:040x}", 1 + index % 50, f"t{index:08d}", 'None', 'rechecking')
+    task.update_info(fragment)
+    return task
+
+
+def _measure_memory(builder, fragments):
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    tasks = {i: builder(i, fragments[i]) for i in range(len(fragments))}
+    current = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in current.compare_to(baseline, 'filename'))
+    return tasks, size
+
+
+def run_benchmark(count: int, rounds: int) -> dict:
+    fragments = [_maindata_fragment(i) for i in range(count)]
+    legacy_tasks, legacy_bytes = _measure_memory(_legacy_task, fragments)
+    compact_tasks, compact_bytes = _measure_memory(_compact_task, fragments)
+
+    # Обновление записи после дельты: прежний путь копировал всю запись зеркала, новый - только нужные поля
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i, task in legacy_tasks.items():
+            task['last_info'] = dict(fragments[i])
+    legacy_update = (time.perf_counter() - start) / (rounds * count)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i, task in compact_tasks.items():
+            task.update_info(fragments[i])
+    compact_update = (time.perf_counter() - start) / (rounds * count)
+
+    return {
+        'torrents': count,
+        'legacy': {'total_bytes': legacy_bytes, 'bytes_per_task': round(legacy_bytes / count), 'update_us': round(legacy_update * 1e6, 3)},
+        'compact': {'total_bytes': compact_bytes, 'bytes_per_task': round(compact_bytes / count), 'update_us': round(compact_update * 1e6, 3)},
+        'memory_ratio': round(legacy_bytes / compact_bytes, 2) if compact_bytes else None,
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Память записей задач StatefulAgent')
+    arg_parser.add_argument('--count', type=int, default=5000, help='Количество отслеживаемых торрентов')
+    arg_parser.add_argument('--rounds', type=int, default=20, help='Количество проходов обновления')
+    args = arg_parser.parse_args()
+    print(json.dumps(run_benchmark(args.count, args.rounds), ensure_ascii=False, indent=2))
@@ -0,0 +1,312 @@
+# Файл: benchmarks/agent_throughput.py
+"""
+Нагрузочный тест StatefulAgent против имитатора qBittorrent (benchmarks/fake_qbittorrent.py).
+
+Создает временную БД, добавляет в имитатор N торрентов на паузе, ставит их в очередь агента
+и ждет, пока все задачи пройдут стадии до 'activating'. В отчете: общее время, пропускная способность,
+перцентили задержки на задачу, средняя длительность каждой стадии и число запросов к WebAPI.
+Прогон считается проваленным (код выхода 1, список в 'checks.failures'), если за время прогона в лог
+записаны ошибки, не все задачи завершились или файлы торрентов в имитаторе не переименованы.
+
+С --instances N поднимается N имитаторов, торренты раскладываются между ними политикой размещения
+(choose_qbittorrent_instance), а агент опрашивает все экземпляры. Запросы и переименования считаются
+по каждому экземпляру ('checks.per_instance'): торрент должен быть переименован в том имитаторе, где он размещен.
+
+Пример:  python benchmarks/agent_throughput.py --count 1000 --link-type file --instances 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'benchmarks'))
+
+from fake_qbittorrent import FakeQBittorrentServer, SimulatorConfig
+
+SAMPLE_INTERVAL = 0.02
+# Исходные имена файлов имитатора (FakeQBittorrent._make_files): после стадии переименования их быть не должно
+FAKE_FILE_PREFIX = 'Fake.Torrent.'
+
+
+class _ErrorCounter(logging.Handler):
+    """Считает ошибки в логе за время прогона: сбой стадии агента не должен выглядеть как завершенная задача."""
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+        self.samples = []
+
+    def emit(self, record):
+        self.count += 1
+        if len(self.samples) < 5:
+            self.samples.append(record.getMessage())
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _fake_torrent_bytes(index: int) -> bytes:
+    """Минимальный валидный bencode .torrent: уникальный info-словарь на каждый индекс."""
+    name = f"Bench.Torrent.{index:05d}".encode()
+    pieces = index.to_bytes(20, 'big')
+    info = (b'd6:lengthi1048576e4:name' + str(len(name)).encode() + b':' + name +
+            b'12:piece lengthi16384e6:pieces20:' + pieces + b'e')
+    return b'd4:info' + info + b'e'
+
+
+def _instance_name(index: int) -> str:
+    return 'qbittorrent' if index == 0 else f'qbittorrent_{index + 1}'
+
+
+def _build_app(work_dir: str, qb_urls: list, config: SimulatorConfig):
+    # Логи и БД создаются во временном каталоге, чтобы не трогать рабочие файлы проекта
+    os.chdir(work_dir)
+    from flask import Flask
+    from db import Database
+    from logger import Logger
+    from sse import sse_broadcaster
+    from debug_manager import DebugManager
+    from status_manager import StatusManager
+    from qbittorrent_state import QBittorrentStateMirror
+    from priority_lane import PriorityLane
+
+    app = Flask('benchmark')
+    app.logger = Logger('benchmark')
+    # В консоль выводятся только предупреждения и ошибки, иначе вывод агента заглушит отчет
+    for handler in app.logger.logger.handlers:
+        if not hasattr(handler, 'baseFilename'):
+            handler.setLevel('WARNING')
+    app.db = Database(f"sqlite:///{os.path.join(work_dir, 'bench.db')}", logger=app.logger)
+    app.debug_manager = DebugManager(app.db)
+    app.sse_broadcaster = sse_broadcaster
+    app.status_manager = StatusManager(app, app.db, app.sse_broadcaster, app.logger)
+    app.qb_state = QBittorrentStateMirror(app.logger)
+    app.priority_lane = PriorityLane(app.logger)
+
+    for index, qb_url in enumerate(qb_urls):
+        app.db.add_auth(_instance_name(index), config.username, config.password, qb_url)
+    return app
+
+
+def _prepare_series(app) -> int:
+    with app.app_context():
+        profile_id = app.db.create_parser_profile('benchmark')
+        app.db.add_rule_to_profile(profile_id, {
+            'name': 'Серия из .Exx',
+            'conditions': [],
+            'action_pattern': json.dumps([{
+                'action_type': 'extract_single',
+                'action_pattern': json.dumps([{'type': 'text', 'value': '.E'}, {'type': 'number'}]),
+            }]),
+        })
+        return app.db.add_series({
+            'url': 'http://example.invalid/bench',
+            'name': 'Бенчмарк',
+            'name_en': 'Benchmark',
+            'site': 'example.invalid',
+            'save_path': '/downloads/bench',
+            'season': 's01',
+            'parser_profile_id': profile_id,
+        })
+
+
+def _seed_foreign_torrents(server: FakeQBittorrentServer, count: int):
+    """Чужие торренты общего сидбокса: без тега series-tracker, раздаются независимо от агента."""
+    for i in range(count):
+        server.sim.add([], [f"magnet:?xt=urn:btih:{'f' * 8}{i + 1:032x}"], {'savepath': '/downloads/other'})
+
+
+def _enqueue_torrents(app, servers: dict, series_id: int, count: int, link_type: str):
+    from utils.torrent_hash import infohash_from_torrent_bytes
+    from qbittorrent import DEFAULT_SCOPE_TAG, DEFAULT_INSTANCE, choose_qbittorrent_instance
+    hashes = []
+    placement = {}
+    for i in range(count):
+        with app.app_context():
+            instance = choose_qbittorrent_instance(app.db, app.logger, '/downloads/bench', series_id)
+        server = servers[instance]
+        torrent_id = f"bench{i:05d}"
+        fields = {'savepath': '/downloads/bench', 'tags': DEFAULT_SCOPE_TAG, 'paused': 'true'}
+        if link_type == 'magnet':
+            torrent_hash = f"{i + 1:040x}"
+            link = f"magnet:?xt=urn:btih:{torrent_hash}"
+            server.sim.add([], [link], fields)
+        else:
+            data = _fake_torrent_bytes(i)
+            torrent_hash = infohash_from_torrent_bytes(data)
+            link = f"http://example.invalid/download/{torrent_id}.torrent"
+            server.sim.add([data], [], fields)
+        with app.app_context():
+            # Активная запись учитывается политикой least_loaded при выборе экземпляра для следующего торрента
+            app.db.add_torrent(series_id, {'torrent_id': torrent_id, 'link': link}, is_active=True, qb_hash=torrent_hash,
+                               qb_instance=None if instance == DEFAULT_INSTANCE else instance)
+        hashes.append((torrent_hash, torrent_id))
+        placement[torrent_hash] = instance
+    return hashes, placement
+
+
+def _unrenamed_torrents(server: FakeQBittorrentServer, torrent_hashes: list) -> list:
+    """Хеши торрентов, у которых в имитаторе нет файлов или остались исходные имена файлов."""
+    unrenamed = []
+    for torrent_hash in torrent_hashes:
+        files = server.sim.torrent_files(torrent_hash)
+        if not files or any(os.path.basename(f['name']).startswith(FAKE_FILE_PREFIX) for f in files):
+            unrenamed.append(torrent_hash)
+    return unrenamed
+
+
+def _check_run(result: dict, error_counter: _ErrorCounter, servers: dict, placement: dict) -> dict:
+    """
+    Проверяет, что все стадии отработали. Переименование проверяется на том экземпляре, куда торрент
+    размещен: так видно, что запросы к файлам торрента маршрутизируются в его экземпляр.
+    """
+    failures = []
+    if error_counter.count:
+        failures.append(f"В лог записано ошибок: {error_counter.count}")
+    if result['completed'] < result['torrents']:
+        failures.append(f"Завершено задач: {result['completed']} из {result['torrents']}")
+
+    per_instance = {}
+    for name, server in servers.items():
+        torrent_hashes = [h for h, instance in placement.items() if instance == name]
+        requests = result['qbittorrent_server'][name]['requests']
+        rename_requests = requests.get('/api/v2/torrents/renameFile', 0)
+        unrenamed = _unrenamed_torrents(server, torrent_hashes)
+        per_instance[name] = {
+            'torrents': len(torrent_hashes),
+            'requests': sum(requests.values()),
+            'rename_requests': rename_requests,
+            'unrenamed_torrents': len(unrenamed),
+        }
+        if len(servers) > 1 and len(placement) >= len(servers) and not torrent_hashes:
+            failures.append(f"{name}: не размещено ни одного торрента")
+        if rename_requests < len(torrent_hashes):
+            failures.append(f"{name}: запросов renameFile {rename_requests}, торрентов {len(torrent_hashes)}")
+        if unrenamed:
+            failures.append(f"{name}: файлы не переименованы у {len(unrenamed)} торрентов (например, {unrenamed[0][:8]})")
+
+    return {
+        'errors_logged': error_counter.count,
+        'error_samples': error_counter.samples,
+        'rename_requests': sum(i['rename_requests'] for i in per_instance.values()),
+        'unrenamed_torrents': sum(i['unrenamed_torrents'] for i in per_instance.values()),
+        'per_instance': per_instance,
+        'failures': failures,
+    }
+
+
+def run_benchmark(count: int, link_type: str, timeout: float, config: SimulatorConfig, foreign: int = 0, instances: int = 1) -> dict:
+    servers = {_instance_name(i): FakeQBittorrentServer(config=config).start() for i in range(max(1, instances))}
+    work_dir = tempfile.mkdtemp(prefix='agent_bench_')
+    app = _build_app(work_dir, [server.url for server in servers.values()], config)
+    error_counter = _ErrorCounter()
+    app.logger.logger.addHandler(error_counter)
+    from agents.agent import Agent
+
+    series_id = _prepare_series(app)
+    for server in servers.values():
+        _seed_foreign_torrents(server, foreign)
+    hashes, placement = _enqueue_torrents(app, servers, series_id, count, link_type)
+
+    agent = Agent(app, app.logger, app.db, app.sse_broadcaster, app.status_manager)
+    app.agent = agent
+
+    added_at = {}
+    stage_seen = {h: {} for h, _ in hashes}
+    completed_at = {}
+
+    start = time.time()
+    for torrent_hash, torrent_id in hashes:
+        agent.add_task(torrent_hash, series_id, torrent_id, 'None', link_type)
+        added_at[torrent_hash] = time.time()
+    enqueue_seconds = time.time() - start
+    agent.start()
+
+    # Сэмплирование очереди агента: фиксируем момент первого появления каждой стадии и момент завершения
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        now = time.time()
+        with agent.lock:
+            snapshot = {h: task.stage for h, task in agent.processing_torrents.items()}
+        for torrent_hash, _ in hashes:
+            if torrent_hash in completed_at:
+                continue
+            stage = snapshot.get(torrent_hash)
+            if stage is None:
+                completed_at[torrent_hash] = now
+            else:
+                stage_seen[torrent_hash].setdefault(stage, now)
+        if len(completed_at) == count:
+            break
+        time.sleep(SAMPLE_INTERVAL)
+
+    total_seconds = time.time() - start
+    agent.shutdown()
+
+    latencies = [completed_at[h] - added_at[h] for h in completed_at]
+    stage_durations = {}
+    for torrent_hash, seen in stage_seen.items():
+        ordered = sorted(seen.items(), key=lambda item: item[1])
+        end_time = completed_at.get(torrent_hash)
+        for i, (stage, seen_at) in enumerate(ordered):
+            next_time = ordered[i + 1][1] if i + 1 < len(ordered) else end_time
+            if next_time is not None:
+                stage_durations.setdefault(stage, []).append(next_time - seen_at)
+
+    from qbittorrent import get_qbittorrent_client
+    with app.app_context():
+        client_metrics = {name: get_qbittorrent_client(app.db, app.logger, name).get_metrics() for name in servers}
+
+    result = {
+        'torrents': count,
+        'foreign_torrents': foreign,
+        'instances': len(servers),
+        'link_type': link_type,
+        'completed': len(completed_at),
+        'enqueue_seconds': round(enqueue_seconds, 3),
+        'total_seconds': round(total_seconds, 3),
+        'throughput_per_second': round(len(completed_at) / total_seconds, 2) if total_seconds else 0,
+        'latency_seconds': {
+            'p50': round(_percentile(latencies, 50), 3),
+            'p95': round(_percentile(latencies, 95), 3),
+            'p99': round(_percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3) if latencies else 0,
+        },
+        'stage_avg_seconds': {stage: round(sum(v) / len(v), 3) for stage, v in stage_durations.items()},
+        'qbittorrent_client': client_metrics,
+        'qbittorrent_server': {name: server.sim.get_stats() for name, server in servers.items()},
+        'state_mirror': app.qb_state.get_status(),
+    }
+    result['checks'] = _check_run(result, error_counter, servers, placement)
+    app.logger.logger.removeHandler(error_counter)
+    for server in servers.values():
+        server.stop()
+    return result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Пропускная способность StatefulAgent на имитаторе qBittorrent')
+    arg_parser.add_argument('--count', type=int, default=1000, help='Количество торрентов')
+    arg_parser.add_argument('--link-type', choices=['file', 'magnet'], default='file')
+    arg_parser.add_argument('--foreign', type=int, default=0, help='Количество чужих торрентов в каждом имитаторе')
+    arg_parser.add_argument('--instances', type=int, default=1, help='Количество экземпляров qBittorrent')
+    arg_parser.add_argument('--timeout', type=float, default=3600, help='Максимальное время ожидания, с')
+    arg_parser.add_argument('--recheck-delay', type=float, default=SimulatorConfig.recheck_delay)
+    arg_parser.add_argument('--metadata-delay', type=float, default=SimulatorConfig.metadata_delay)
+    args = arg_parser.parse_args()
+
+    sim_config = SimulatorConfig(recheck_delay=args.recheck_delay, metadata_delay=args.metadata_delay)
+    report = run_benchmark(args.count, args.link_type, args.timeout, sim_config, args.foreign, args.instances)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report['checks']['failures']:
+        sys.exit(1)
@@ -0,0 +1,468 @@
+# Файл: benchmarks/fake_qbittorrent.py
+"""
+Легковесный имитатор qBittorrent WebAPI v2 для нагрузочных тестов агентов без реального клиента.
+
+Поддерживаются эндпоинты, которые использует проект: auth/login, app/version,
+torrents/add|info|files|renameFile|renameFolder|pause|resume|stop|start|recheck|delete|setLocation|
+addTags|removeTags|createCategory|setCategory|filePrio и sync/maindata с дельтами по rid.
+
+Переходы состояний торрентов задаются задержками в SimulatorConfig, например:
+resume -> metaDL -> (metadata_delay) -> downloading, recheck -> checkingDL -> (recheck_delay) -> pausedDL.
+
+Запуск отдельно:  python benchmarks/fake_qbittorrent.py --port 18080
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.torrent_hash import infohash_from_magnet, infohash_from_torrent_bytes
+
+
+@dataclass
+class SimulatorConfig:
+    username: str = 'admin'
+    password: str = 'adminadmin'
+    metadata_delay: float = 0.2      # получение метаданных после resume (для magnet и файлов без размера)
+    pause_delay: float = 0.05        # переход в pausedDL после pause
+    recheck_delay: float = 0.3       # длительность checkingDL
+    resume_delay: float = 0.05       # переход в downloading/stalledDL после resume
+    files_per_torrent: int = 12
+    file_size: int = 700 * 1024 * 1024
+    # Торренты, добавленные как файл, сразу имеют метаданные (как в qBittorrent)
+    file_has_metadata: bool = True
+
+
+class FakeQBittorrent:
+    """Состояние имитатора. Потокобезопасно: все обращения идут под одной блокировкой."""
+
+    TORRENT_FIELDS = ('name', 'state', 'progress', 'total_size', 'size', 'amount_left', 'save_path',
+                      'tags', 'category', 'added_on', 'dlspeed', 'upspeed', 'content_path')
+
+    def __init__(self, config: SimulatorConfig = None):
+        self.config = config or SimulatorConfig()
+        self.lock = threading.RLock()
+        self.sids = set()
+        self.torrents = {}
+        self.files = {}
+        self.pending = {}            # hash -> [(apply_at, {field: value})]
+        self.rid = 0
+        self.field_rids = {}         # hash -> {field: rid последнего изменения}
+        self.removed = []            # [(rid, hash)]
+        self.categories = {}
+        self.request_counts = {}
+        self.response_bytes = {}
+        self.logins = 0
+
+    # --- Внутренняя модель ---
+
+    def _set_fields(self, torrent_hash, fields):
+        torrent = self.torrents.get(torrent_hash)
+        if torrent is None:
+            return
+        changed = {k: v for k, v in fields.items() if torrent.get(k) != v}
+        if not changed:
+            return
+        self.rid += 1
+        torrent.update(changed)
+        field_rids = self.field_rids.setdefault(torrent_hash, {})
+        for k in changed:
+            field_rids[k] = self.rid
+
+    def _schedule(self, torrent_hash, delay, fields):
+        self.pending.setdefault(torrent_hash, []).append((time.time() + delay, fields))
+
+    def _advance(self):
+        """Применяет созревшие переходы состояний."""
+        now = time.time()
+        for torrent_hash in list(self.pending.keys()):
+            queue = self.pending[torrent_hash]
+            due = [item for item in queue if item[0] <= now]
+            if not due:
+                continue
+            self.pending[torrent_hash] = [item for item in queue if item[0] > now]
+            for _, fields in sorted(due, key=lambda item: item[0]):
+                self._set_fields(torrent_hash, fields)
+
+    def _make_files(self, name):
+        cfg = self.config
+        return [{
+            'index': i,
+            'name': f"{name}/{name}.E{i + 1:02d}.mkv",
+            'size': cfg.file_size,
+            'progress': 0,
+            'priority': 1,
+        } for i in range(cfg.files_per_torrent)]
+
+    def _resolve_hashes(self, hashes_param):
+        if hashes_param in (None, ''):
+            return []
+        if hashes_param == 'all':
+            return list(self.torrents.keys())
+        return [h.lower() for h in hashes_param.split('|') if h.lower() in self.torrents]
+
+    # --- Операции API ---
+
+    def login(self, username, password):
+        with self.lock:
+            self.logins += 1
+            if username == self.config.username and password == self.config.password:
+                sid = uuid.uuid4().hex
+                self.sids.add(sid)
+                return sid
+            return None
+
+    def add(self, torrent_bytes_list, urls, fields):
+        with self.lock:
+            added = 0
+            sources = [('file', data) for data in torrent_bytes_list] + [('magnet', u) for u in urls]
+            for kind, source in sources:
+                if kind == 'file':
+                    torrent_hash = infohash_from_torrent_bytes(source) or hashlib.sha1(source).hexdigest()
+                else:
+                    torrent_hash = infohash_from_magnet(source) or hashlib.sha1(source.encode()).hexdigest()
+                if torrent_hash in self.torrents:
+                    continue
+                name = f"Fake.Torrent.{torrent_hash[:8]}"
+                has_metadata = kind == 'file' and self.config.file_has_metadata
+                total_size = self.config.files_per_torrent * self.config.file_size if has_metadata else 0
+                paused = fields.get('paused', fields.get('stopped', 'false')) == 'true'
+                self.torrents[torrent_hash] = {'hash': torrent_hash}
+                self.files[torrent_hash] = self._make_files(name) if has_metadata else []
+                self._set_fields(torrent_hash, {
+                    'name': name,
+                    'state': 'pausedDL' if paused else ('downloading' if has_metadata else 'metaDL'),
+                    'progress': 0,
+                    'total_size': total_size,
+                    'size': total_size,
+                    'amount_left': total_size,
+                    'save_path': fields.get('savepath', '/downloads'),
+                    'content_path': os.path.join(fields.get('savepath', '/downloads'), name),
+                    'tags': fields.get('tags', ''),
+                    'category': fields.get('category', ''),
+                    'added_on': int(time.time()),
+                    'dlspeed': 0,
+                    'upspeed': 0,
+                })
+                if not paused and not has_metadata:
+                    self._schedule_metadata(torrent_hash, name)
+                added += 1
+            return 'Ok.' if added else 'Fails.'
+
+    def _schedule_metadata(self, torrent_hash, name):
+        total_size = self.config.files_per_torrent * self.config.file_size
+        self.files[torrent_hash] = self._make_files(name)
+        self._schedule(torrent_hash, self.config.metadata_delay, {
+            'state': 'downloading', 'total_size': total_size, 'size': total_size, 'amount_left': total_size
+        })
+
+    def info(self, params):
+        with self.lock:
+            self._advance()
+            hashes = params.get('hashes')
+            selected = self._resolve_hashes(hashes) if hashes else list(self.torrents.keys())
+            result = []
+            for h in selected:
+                t = self.torrents[h]
+                if 'tag' in params and params['tag'] not in [x.strip() for x in t.get('tags', '').split(',') if x.strip()]:
+                    continue
+                if 'category' in params and t.get('category', '') != params['category']:
+                    continue
+                result.append(dict(t))
+            return result
+
+    def torrent_files(self, torrent_hash):
+        with self.lock:
+            if torrent_hash not in self.torrents:
+                return None
+            return [dict(f) for f in self.files.get(torrent_hash, [])]
+
+    def rename_file(self, torrent_hash, old_path, new_path):
+        with self.lock:
+            for f in self.files.get(torrent_hash, []):
+                if f['name'] == old_path:
+                    f['name'] = new_path
+                    return True
+            return False
+
+    def rename_folder(self, torrent_hash, old_path, new_path):
+        with self.lock:
+            renamed = False
+            for f in self.files.get(torrent_hash, []):
+                if f['name'].startswith(old_path + '/'):
+                    f['name'] = new_path + f['name'][len(old_path):]
+                    renamed = True
+            return renamed
+
+    def set_file_priority(self, torrent_hash, ids, priority):
+        with self.lock:
+            wanted = {int(i) for i in ids.split('|') if i.strip().isdigit()}
+            for f in self.files.get(torrent_hash, []):
+                if f['index'] in wanted:
+                    f['priority'] = int(priority)
+
+    def pause(self, hashes):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                state = self.torrents[h].get('state', '')
+                target = 'pausedUP' if state in ('uploading', 'stalledUP', 'queuedUP', 'pausedUP') else 'pausedDL'
+                self._schedule(h, self.config.pause_delay, {'state': target})
+
+    def resume(self, hashes):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                t = self.torrents[h]
+                if not t.get('total_size'):
+                    self._set_fields(h, {'state': 'metaDL'})
+                    self._schedule_metadata(h, t['name'])
+                else:
+                    target = 'stalledUP' if t.get('progress', 0) >= 1 else 'downloading'
+                    self._schedule(h, self.config.resume_delay, {'state': target})
+
+    def recheck(self, hashes):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                state = self.torrents[h].get('state', '')
+                was_paused = state.startswith('paused')
+                self._set_fields(h, {'state': 'checkingDL'})
+                self._schedule(h, self.config.recheck_delay, {'state': 'pausedDL' if was_paused else 'stalledDL'})
+
+    def delete(self, hashes):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                del self.torrents[h]
+                self.files.pop(h, None)
+                self.pending.pop(h, None)
+                self.field_rids.pop(h, None)
+                self.rid += 1
+                self.removed.append((self.rid, h))
+
+    def set_location(self, hashes, location):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                self._set_fields(h, {'save_path': location, 'content_path': os.path.join(location, self.torrents[h]['name'])})
+
+    def change_tags(self, hashes, tags, add=True):
+        with self.lock:
+            tag_list = [t.strip() for t in tags.split(',') if t.strip()]
+            for h in self._resolve_hashes(hashes):
+                current = [t.strip() for t in self.torrents[h].get('tags', '').split(',') if t.strip()]
+                if add:
+                    current += [t for t in tag_list if t not in current]
+                else:
+                    current = [t for t in current if t not in tag_list]
+                self._set_fields(h, {'tags': ', '.join(current)})
+
+    def set_category(self, hashes, category):
+        with self.lock:
+            for h in self._resolve_hashes(hashes):
+                self._set_fields(h, {'category': category})
+
+    def maindata(self, client_rid):
+        with self.lock:
+            self._advance()
+            # Неизвестный rid (0 или из другого запуска имитатора) - полный снимок, как в qBittorrent
+            if client_rid <= 0 or client_rid > self.rid:
+                return {
+                    'rid': self.rid,
+                    'full_update': True,
+                    'torrents': {h: {k: v for k, v in t.items() if k != 'hash'} for h, t in self.torrents.items()},
+                    'categories': {name: {'name': name, 'savePath': ''} for name in self.categories},
+                    'server_state': {'connection_status': 'connected'},
+                }
+            torrents = {}
+            for h, field_rids in self.field_rids.items():
+                changed = {k: self.torrents[h][k] for k, r in field_rids.items() if r > client_rid}
+                if changed:
+                    torrents[h] = changed
+            update = {'rid': self.rid}
+            if torrents:
+                update['torrents'] = torrents
+            removed = [h for r, h in self.removed if r > client_rid]
+            if removed:
+                update['torrents_removed'] = removed
+            return update
+
+    def record_request(self, endpoint, size):
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+            self.response_bytes[endpoint] = self.response_bytes.get(endpoint, 0) + size
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'torrents': len(self.torrents),
+                'logins': self.logins,
+                'requests': dict(self.request_counts),
+                'response_bytes': dict(self.response_bytes),
+            }
+
+
+def _make_handler(sim: FakeQBittorrent):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type='text/plain; charset=UTF-8', headers=None):
+            if not isinstance(body, (bytes, bytearray)):
+                body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+            sim.record_request(urlparse(self.path).path, len(body))
+
+        def _json(self, data):
+            self._send(200, json.dumps(data), 'application/json')
+
+        def _authorized(self):
+            cookie = self.headers.get('Cookie', '')
+            for part in cookie.split(';'):
+                name, _, value = part.strip().partition('=')
+                if name == 'SID' and value in sim.sids:
+                    return True
+            return False
+
+        def _read_form(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            content_type = self.headers.get('Content-Type', '')
+            fields, files = {}, []
+            if content_type.startswith('multipart/form-data'):
+                message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + raw)
+                for part in message.iter_parts():
+                    name = part.get_param('name', header='content-disposition')
+                    payload = part.get_payload(decode=True) or b''
+                    if part.get_filename():
+                        files.append(payload)
+                    else:
+                        fields[name] = payload.decode('utf-8')
+            else:
+                fields = {k: v[0] for k, v in parse_qs(raw.decode('utf-8')).items()}
+            return fields, files
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            path = parsed.path
+            params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            fields, files = self._read_form() if method == 'POST' else ({}, [])
+            data = {**params, **fields}
+
+            if path == '/api/v2/auth/login':
+                sid = sim.login(data.get('username'), data.get('password'))
+                if sid:
+                    return self._send(200, 'Ok.', headers={'Set-Cookie': f'SID={sid}; HttpOnly; path=/'})
+                return self._send(200, 'Fails.')
+
+            if not self._authorized():
+                return self._send(403, 'Forbidden')
+
+            endpoint = path[len('/api/v2/'):] if path.startswith('/api/v2/') else path
+            if endpoint == 'app/version':
+                return self._send(200, 'v4.6.0-fake')
+            if endpoint == 'sync/maindata':
+                return self._json(sim.maindata(int(data.get('rid', 0))))
+            if endpoint == 'torrents/info':
+                return self._json(sim.info(data))
+            if endpoint == 'torrents/files':
+                files_list = sim.torrent_files(data.get('hash', '').lower())
+                return self._json(files_list) if files_list is not None else self._send(404, 'Not Found')
+            if endpoint == 'torrents/add':
+                urls = [u for u in data.get('urls', '').split('\n') if u.strip()]
+                return self._send(200, sim.add(files, urls, data))
+            if endpoint == 'torrents/renameFile':
+                ok = sim.rename_file(data.get('hash', '').lower(), data.get('oldPath'), data.get('newPath'))
+                return self._send(200 if ok else 409, '' if ok else 'Conflict')
+            if endpoint == 'torrents/renameFolder':
+                ok = sim.rename_folder(data.get('hash', '').lower(), data.get('oldPath'), data.get('newPath'))
+                return self._send(200 if ok else 409, '' if ok else 'Conflict')
+            if endpoint == 'torrents/filePrio':
+                sim.set_file_priority(data.get('hash', '').lower(), data.get('id', ''), data.get('priority', 1))
+                return self._send(200, '')
+            if endpoint in ('torrents/pause', 'torrents/stop'):
+                sim.pause(data.get('hashes'))
+                return self._send(200, '')
+            if endpoint in ('torrents/resume', 'torrents/start'):
+                sim.resume(data.get('hashes'))
+                return self._send(200, '')
+            if endpoint == 'torrents/recheck':
+                sim.recheck(data.get('hashes'))
+                return self._send(200, '')
+            if endpoint == 'torrents/delete':
+                sim.delete(data.get('hashes'))
+                return self._send(200, '')
+            if endpoint == 'torrents/setLocation':
+                sim.set_location(data.get('hashes'), data.get('location'))
+                return self._send(200, '')
+            if endpoint in ('torrents/addTags', 'torrents/removeTags'):
+                sim.change_tags(data.get('hashes'), data.get('tags', ''), add=endpoint.endswith('addTags'))
+                return self._send(200, '')
+            if endpoint == 'torrents/createCategory':
+                with sim.lock:
+                    sim.categories[data.get('category')] = data.get('savePath', '')
+                return self._send(200, '')
+            if endpoint == 'torrents/setCategory':
+                sim.set_category(data.get('hashes'), data.get('category', ''))
+                return self._send(200, '')
+            return self._send(404, 'Not Found')
+
+    return Handler
+
+
+class FakeQBittorrentServer:
+    """HTTP-сервер имитатора в фоновом потоке. Несколько экземпляров можно запускать на разных портах."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, config: SimulatorConfig = None):
+        self.sim = FakeQBittorrent(config)
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.sim))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='FakeQBittorrent', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Имитатор qBittorrent WebAPI v2')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=18080)
+    args = arg_parser.parse_args()
+    server = FakeQBittorrentServer(args.host, args.port).start()
+    print(f"Fake qBittorrent слушает {server.url} (логин {server.sim.config.username}/{server.sim.config.password})")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
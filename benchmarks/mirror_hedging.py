@@ -0,0 +1,107 @@
+# Файл: benchmarks/mirror_hedging.py
+"""
+Время до результата сканирования при деградировавшем трекере: прежний перебор зеркал по очереди
+против хеджирования (utils/mirror_hedging.fetch_with_hedging).
+
+Зеркала имитируются функцией с поведением парсера Kinozal: до MAX_RETRIES попыток, каждая неудачная
+стоит таймаут запроса плюс RETRY_DELAY; отмена проверяется перед каждой попыткой, как в парсерах.
+Все задержки умножаются на --time-scale, чтобы прогон занимал секунды.
+
+Пример:  python benchmarks/mirror_hedging.py --time-scale 0.05 --hedge-delay 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_RETRIES = 5
+RETRY_DELAY = 3
+REQUEST_TIMEOUT = 15
+
+# Поведение зеркал: ('ok', задержка ответа) или ('dead', None) - каждая попытка уходит в таймаут
+SCENARIOS = {
+    'healthy_primary': [('ok', 1.5), ('ok', 1.5)],
+    'slow_primary': [('ok', 25), ('ok', 2)],
+    'dead_primary': [('dead', None), ('ok', 2), ('ok', 2)],
+    'dead_primary_and_mirror': [('dead', None), ('dead', None), ('ok', 3)],
+}
+
+
+def _make_attempt(behaviours, scale):
+    def attempt(url, cancel_event):
+        kind, latency = behaviours[int(url.rsplit('/', 1)[1])]
+        for attempt_number in range(MAX_RETRIES):
+            if cancel_event is not None and cancel_event.is_set():
+                return {"error": "отменено"}
+            if kind == 'ok':
+                time.sleep(latency * scale)
+                return {"torrents": [], "mirror": url}
+            time.sleep(REQUEST_TIMEOUT * scale)
+            if attempt_number < MAX_RETRIES - 1:
+                time.sleep(RETRY_DELAY * scale)
+        return {"error": f"{url}: таймаут после {MAX_RETRIES} попыток"}
+    return attempt
+
+
+def sequential(attempt, urls):
+    # Прежняя логика perform_series_scan: следующее зеркало - только после полного отказа предыдущего
+    result = None
+    for url in urls:
+        result = attempt(url, None)
+        if not result.get('error'):
+            break
+    return result
+
+
+def _build_app(work_dir):
+    os.chdir(work_dir)
+    from flask import Flask
+    from logger import Logger
+
+    app = Flask('benchmark')
+    app.logger = Logger('benchmark')
+    for handler in app.logger.logger.handlers:
+        if not hasattr(handler, 'baseFilename'):
+            handler.setLevel('WARNING')
+    return app
+
+
+def run_benchmark(scale, hedge_delay):
+    from utils.mirror_hedging import fetch_with_hedging
+
+    report = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        app = _build_app(work_dir)
+        for name, behaviours in SCENARIOS.items():
+            urls = [f"http://mirror/{i}" for i in range(len(behaviours))]
+            attempt = _make_attempt(behaviours, scale)
+
+            started = time.perf_counter()
+            sequential_result = sequential(attempt, urls)
+            sequential_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            hedged_result, winner = fetch_with_hedging(app, attempt, urls, hedge_delay * scale, name)
+            hedged_time = time.perf_counter() - started
+
+            report[name] = {
+                # Время приведено к реальному масштабу (без --time-scale)
+                'sequential_seconds': round(sequential_time / scale, 1),
+                'hedged_seconds': round(hedged_time / scale, 1),
+                'sequential_mirror': sequential_result.get('mirror'),
+                'hedged_mirror': winner,
+            }
+    return report
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Перебор зеркал по очереди против хеджирования')
+    arg_parser.add_argument('--time-scale', type=float, default=0.05, help='Множитель всех задержек имитации')
+    arg_parser.add_argument('--hedge-delay', type=float, default=8, help='Задержка запуска следующего зеркала, с')
+    args = arg_parser.parse_args()
+    print(json.dumps(run_benchmark(args.time_scale, args.hedge_delay), ensure_ascii=False, indent=2))
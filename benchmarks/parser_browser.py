@@ -0,0 +1,145 @@
+# Файл: benchmarks/parser_browser.py
+"""
+Загрузка страниц через Playwright: новый браузер на каждую страницу (прежняя схема парсеров)
+против долгоживущего пула BrowserPool.
+
+Локальный HTTP-сервер отдает страницу, повторяющую разметку Astar: список торрентов появляется
+после клика по 'Все торренты'. В отчете: задержка на страницу (среднее, p50, p95), пиковый RSS
+браузеров и число запусков браузера.
+
+Пример:  python benchmarks/parser_browser.py --pages 30 --threads 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser_pool import BrowserPool, _descendant_rss_mb
+
+PAGE = ("""<html><head><title>Bench</title></head><body>
+<span id="torrent_all" onclick="setTimeout(function(){document.getElementById('list').style.display='block'}, 50)">Все торренты</span>
+<div id="list" class="list_torrent" style="display:none">""" + "".join(
+    f'<div class="torrent"><a href="/t/{i}">Серия {i}</a></div>' for i in range(100)) + """</div>
+</body></html>""").encode('utf-8')
+
+TIMEOUT = 10000
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+class _RssSampler(threading.Thread):
+    """Фоново замеряет RSS процессов-потомков и запоминает пик."""
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak_mb = max(self.peak_mb, _descendant_rss_mb(os.getpid()))
+            self.stop_event.wait(self.interval)
+
+
+def _load_page(context, url):
+    page = context.new_page()
+    page.goto(url, timeout=TIMEOUT, wait_until="domcontentloaded")
+    page.wait_for_selector('span#torrent_all', state='visible', timeout=TIMEOUT)
+    page.click('span#torrent_all')
+    page.wait_for_selector('div.list_torrent', state='visible', timeout=TIMEOUT)
+    return page.content()
+
+
+def _fetch_legacy(url):
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        browser = p.firefox.launch(headless=True)
+        context = browser.new_context()
+        html = _load_page(context, url)
+        browser.close()
+        return html
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _run(fetch, url, pages, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_fetch(_):
+        start = time.perf_counter()
+        html = fetch(url)
+        assert 'Серия 99' in html
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    sampler = _RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(timed_fetch, range(pages)))
+    total = time.perf_counter() - start
+    sampler.stop_event.set()
+    sampler.join()
+    return {
+        'total_seconds': round(total, 3),
+        'latency_mean': round(sum(latencies) / len(latencies), 3),
+        'latency_p50': round(_percentile(latencies, 50), 3),
+        'latency_p95': round(_percentile(latencies, 95), 3),
+        'peak_browsers_rss_mb': round(sampler.peak_mb, 1),
+    }
+
+
+def run_benchmark(pages: int, threads: int, max_pages: int) -> dict:
+    from logger import Logger
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/serial/1"
+
+    legacy = _run(_fetch_legacy, url, pages, threads)
+    legacy['browser_launches'] = pages
+
+    pool = BrowserPool(Logger('benchmark'), size=threads, max_pages=max_pages)
+    pooled = _run(lambda u: pool.run(lambda context: _load_page(context, u)), url, pages, threads)
+    status = pool.get_status()
+    pooled['browser_launches'] = status['launches']
+    pooled['recycled'] = status['recycled_pages'] + status['recycled_memory'] + status['recycled_crash']
+    pool.shutdown()
+    server.shutdown()
+
+    return {
+        'pages': pages,
+        'threads': threads,
+        'legacy_new_browser_per_page': legacy,
+        'browser_pool': pooled,
+        'speedup': round(legacy['latency_mean'] / pooled['latency_mean'], 2) if pooled['latency_mean'] else None,
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Новый браузер на страницу против пула браузеров')
+    arg_parser.add_argument('--pages', type=int, default=30, help='Количество загружаемых страниц')
+    arg_parser.add_argument('--threads', type=int, default=2, help='Параллельных загрузок (и размер пула)')
+    arg_parser.add_argument('--max-pages', type=int, default=50, help='Перезапуск браузера пула после N страниц')
+    args = arg_parser.parse_args()
+    print(json.dumps(run_benchmark(args.pages, args.threads, args.max_pages), ensure_ascii=False, indent=2))
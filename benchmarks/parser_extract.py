@@ -0,0 +1,325 @@
+# Файл: benchmarks/parser_extract.py
+"""
+Разбор страниц трекеров: прежний BeautifulSoup (полное дерево, поиск по всему документу)
+против извлечения скомпилированными XPath по дереву lxml (extract_*_page в модулях парсеров).
+
+Страницы берутся из parser_dumps/ (файлы вида '<парсер>_<время>.html', которые парсеры
+сохраняют при включенных флагах save_html_*) и из встроенных образцов разметки каждого трекера.
+Для каждой страницы сравниваются результаты обеих реализаций; при любом расхождении
+бенчмарк завершается с кодом 1. В отчете: среднее время разбора страницы и ускорение.
+
+Пример:  python benchmarks/parser_extract.py --repeat 20 --dumps parser_dumps
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from parsers.kinozal_parser import extract_kinozal_page
+from parsers.rutracker_parser import extract_rutracker_page
+from parsers.astar_parser import extract_astar_page
+from parsers.anilibria_parser import extract_anilibria_page
+from parsers.anilibria_tv_parser import extract_anilibria_tv_page
+
+
+def normalize_date(date_str):
+    # Нормализация дат не меняется и в сравнении не участвует; пустая строка - "дата не распознана"
+    return date_str.strip() or None
+
+
+# --- Прежние реализации на BeautifulSoup (код parse_series до перехода на lxml) ---
+
+def legacy_kinozal(html_content):
+    soup = BeautifulSoup(html_content, 'lxml')
+    title_tag = soup.find('title')
+    date_text = None
+    for key_word in ['Обновлен', 'Залит']:
+        li_tag = soup.find(lambda tag: tag.name == 'li' and len(tag.contents) > 0 and key_word in tag.contents[0])
+        if li_tag:
+            date_span = li_tag.find('span', class_='floatright')
+            if date_span:
+                date_text = normalize_date(date_span.get_text(strip=True))
+                break
+    if not date_text:
+        banner_tag = soup.find('div', class_='bx1 justify', text=re.compile(r'Торрент-файл обновлен'))
+        if banner_tag:
+            match = re.search(r'Торрент-файл обновлен\s+(.*?)\s*Чтобы', banner_tag.get_text(strip=True))
+            if match:
+                date_text = normalize_date(match.group(1))
+    torrent_link_tag = soup.find('a', href=lambda href: href and 'download.php?id=' in href)
+    return {
+        "title": title_tag.text.strip() if title_tag else None,
+        "date_text": date_text,
+        "download_href": torrent_link_tag['href'] if torrent_link_tag else None,
+    }
+
+
+def legacy_rutracker(html_content):
+    soup = BeautifulSoup(html_content, 'lxml')
+    title_tag = soup.find('h1', class_='maintitle')
+    date_pattern = r'([0-9]{2}-[а-яА-ЯёЁa-zA-Z]{3}-[0-9]{2}\s[0-9]{2}:[0-9]{2})'
+    date_text = None
+    attach_table = soup.find('table', class_='attach')
+    if attach_table:
+        for row in attach_table.find_all('tr'):
+            date_match = re.search(r'(Зарегистрирован|[Зз]арег\.?|Registered):\s*' + date_pattern, row.get_text())
+            if date_match:
+                date_text = normalize_date(date_match.group(2))
+                if date_text:
+                    break
+    if not date_text:
+        for li in soup.find_all('li'):
+            li_text = li.get_text(strip=True)
+            match = re.search(date_pattern, li_text)
+            if match:
+                parent = li.parent
+                context_text = (parent.get_text() if parent else "") + " " + li_text
+                if any(k in context_text.lower() for k in ['зарегистр', 'registered', 'reg', 'дата']):
+                    date_text = normalize_date(match.group(1))
+                    if date_text:
+                        break
+    if not date_text:
+        all_text = soup.get_text()
+        for date_match in re.findall(date_pattern, all_text):
+            context_start = max(0, all_text.find(date_match) - 100)
+            context_end = min(len(all_text), all_text.find(date_match) + len(date_match) + 100)
+            context = all_text[context_start:context_end]
+            if any(k in context.lower() for k in ['зарегистр', 'registered', 'reg', 'дата', 'от', 'в']):
+                date_text = normalize_date(date_match)
+                if date_text:
+                    break
+
+    torrent_link_tag = None
+    dl_stub_tag = soup.find('a', class_='dl-stub')
+    if dl_stub_tag and not dl_stub_tag.get('href', '').startswith('magnet:'):
+        torrent_link_tag = dl_stub_tag
+    if not torrent_link_tag:
+        for a_tag in soup.find_all('a', href=True):
+            href = a_tag.get('href', '')
+            if not href.startswith('magnet:') and ('dl.php?' in href or '/dl.php' in href or '.torrent' in href.lower()):
+                if 'magnet-link' not in a_tag.get('class', []):
+                    torrent_link_tag = a_tag
+                    break
+    if not torrent_link_tag:
+        for a_tag in soup.find_all('a', href=True):
+            href = a_tag.get('href', '')
+            link_text = a_tag.get_text().lower()
+            if (not href.startswith('magnet:') and 'magnet-link' not in a_tag.get('class', []) and
+                    ('скачать .torrent' in link_text or 'скачать торрент' in link_text or
+                     'download .torrent' in link_text or 'download torrent' in link_text or 'torrent' in link_text)):
+                torrent_link_tag = a_tag
+                break
+
+    magnet_link_tag = soup.find('a', class_='magnet-link')
+    size_element = soup.find('span', id='tor-size-humn')
+    seeders = leechers = None
+    stats_container = soup.find('div', class_='mrg_4 pad_4')
+    if stats_container:
+        seeders_element = stats_container.find('span', class_='seed')
+        leechers_element = stats_container.find('span', class_='leech')
+        if seeders_element:
+            seeders_match = re.search(r'\d+', seeders_element.get_text())
+            seeders = int(seeders_match.group()) if seeders_match else None
+        if leechers_element:
+            leechers_match = re.search(r'\d+', leechers_element.get_text())
+            leechers = int(leechers_match.group()) if leechers_match else None
+    return {
+        "title": title_tag.get_text(strip=True) if title_tag else None,
+        "date_text": date_text,
+        "link_href": torrent_link_tag.get('href', '') if torrent_link_tag else None,
+        "magnet_link": magnet_link_tag.get('href') if magnet_link_tag else None,
+        "size": size_element.get_text(strip=True) if size_element else None,
+        "seeders": seeders,
+        "leechers": leechers,
+    }
+
+
+def legacy_astar(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    title_tag = soup.find('h1')
+    items = []
+    for item in soup.find_all('div', class_='torrent'):
+        torrent_link_tag = item.find('a', href=re.compile(r'/engine/gettorrent\.php\?id=\d+'))
+        if not torrent_link_tag:
+            continue
+        date_raw = None
+        for div in item.find_all('div', class_='bord_a1'):
+            date_match = re.search(r'Дата: (\d{2}-\d{2}-\d{4})', re.sub(r'\s+', ' ', div.text.strip()))
+            if date_match:
+                date_raw = date_match.group(1)
+                break
+        episode_div = item.find('div', class_='info_d1')
+        items.append({
+            "href": torrent_link_tag['href'],
+            "date_raw": date_raw,
+            "episode_text": episode_div.text.strip() if episode_div else None,
+        })
+    return {"title": title_tag.text.strip() if title_tag else None, "items": items}
+
+
+def legacy_anilibria(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    ru_title_element = soup.find('div', class_='text-autosize')
+    en_title_element = soup.find('div', class_='text-grey-darken-2')
+    blocks = []
+    for block in soup.find_all('div', class_='v-list-item'):
+        episodes_element = block.find('div', class_='fz-90')
+        magnet_link_tag = block.find('a', href=re.compile(r'^magnet:'))
+        info_element = block.find('div', class_='text-grey-darken-2 fz-75')
+        blocks.append({
+            "episodes": episodes_element.text.strip() if episodes_element else "N/A",
+            "magnet_link": magnet_link_tag['href'] if magnet_link_tag else None,
+            "info_string": info_element.text.strip() if info_element else None,
+            "text": block.text[:150],
+        })
+    return {
+        "ru_title": ru_title_element.text.strip() if ru_title_element else "Название не найдено",
+        "en_title": en_title_element.text.strip() if en_title_element else "Eng title not found",
+        "blocks": blocks,
+    }
+
+
+def legacy_anilibria_tv(html_content):
+    soup = BeautifulSoup(html_content, 'lxml')
+    title_tag = soup.find('title')
+    torrent_table = soup.find('table', id='publicTorrentTable')
+    if not torrent_table:
+        return None
+    rows = []
+    for row in torrent_table.find_all('tr'):
+        if not row.find('td'):
+            continue
+        link_tag = row.find('a', class_='torrent-download-link')
+        if not (link_tag and link_tag.has_attr('href')):
+            continue
+        date_td = row.find('td', class_='torrent-datetime')
+        info_td = row.find('td', class_='torrentcol1')
+        rows.append({
+            "href": link_tag['href'],
+            "date_iso": date_td['data-datetime'] if date_td and date_td.has_attr('data-datetime') else None,
+            "info_text": info_td.get_text(strip=True) if info_td else '',
+        })
+    return {"title": title_tag.get_text(strip=True) if title_tag else "", "rows": rows}
+
+
+PARSERS = {
+    'kinozal_parser': (legacy_kinozal, lambda html: extract_kinozal_page(html, normalize_date)),
+    'rutracker_parser': (legacy_rutracker, lambda html: extract_rutracker_page(html, normalize_date)),
+    'astar_parser': (legacy_astar, extract_astar_page),
+    'anilibria_parser': (legacy_anilibria, extract_anilibria_page),
+    'anilibria_tv_parser': (legacy_anilibria_tv, extract_anilibria_tv_page),
+}
+
+
+# --- Встроенные образцы разметки ---
+
+def _page(title, body):
+    return (f'<!DOCTYPE html><html><head><meta charset="windows-1251"><title>{title}</title>'
+            f'<script>var t = "<li>Обновлен</li>";</script><style>.x{{}}</style></head><body>{body}</body></html>')
+
+
+def _filler(count):
+    return ''.join(f'<div class="comment"><p>Комментарий {i} &amp; <b>ответ</b></p><!-- c{i} --><ul><li>пункт {i}</li></ul></div>'
+                   for i in range(count))
+
+
+def sample_pages():
+    yield 'kinozal_parser', 'sample-li', _page(
+        'Сериал / Series (2024) :: Кинозал.ТВ',
+        _filler(300) + '<ul class="men w200"><li>Залит<span class="floatright green n">1 января 2024 в 10:00</span></li>'
+        '<li>Обновлен<span class="floatright green n">3 февраля 2024 в 12:34</span></li></ul>'
+        '<a href="/download.php?id=123456"><img src="x.png"></a>' + _filler(300))
+    yield 'kinozal_parser', 'sample-banner', _page(
+        'Сериал :: Кинозал.МЕ',
+        _filler(200) + '<div class="bx1 justify">Торрент-файл обновлен 5 марта 2024 в 09:15 Чтобы скачать</div>'
+        '<a href="https://dl.kinozal.tv/download.php?id=42">dl</a>')
+    yield 'rutracker_parser', 'sample-attach', _page(
+        'RuTracker',
+        '<h1 class="maintitle"><a href="viewtopic.php?t=1">Сериал / Series [S01]</a></h1>' + _filler(400) +
+        '<table class="attach bordered med"><tr><td>Торрент:</td><td>Зарегистрирован</td></tr>'
+        '<tr><td>Зарегистрирован:</td><td> 04-Ноя-25 10:18</td></tr></table>'
+        '<a href="dl.php?t=6494350" class="dl-stub dl-link dl-topic">Скачать .torrent</a>'
+        '<a href="magnet:?xt=urn:btih:ABC" class="magnet-link">magnet</a><span id="tor-size-humn">12.3&nbsp;GB</span>'
+        '<div class="mrg_4 pad_4"><span class="seed">Сиды:&nbsp; <b>15</b></span><span class="leech">Личи: <b>3</b></span></div>')
+    yield 'rutracker_parser', 'sample-fallbacks', _page(
+        'RuTracker',
+        '<h1 class="maintitle">Тема</h1>' + _filler(200) + '<ul><li>Дата</li><li>12-Dec-24 08:00</li></ul>'
+        '<a href="magnet:?xt=urn:btih:DEF" class="magnet-link">magnet</a><a href="/forum/dl.php?t=77">файл</a>')
+    yield 'rutracker_parser', 'sample-text', _page(
+        'RuTracker', '<h1 class="maintitle">Тема</h1>' + _filler(100) + '<p>Раздача от 01-Фев-23 11:11</p>'
+        '<a href="viewtopic.php?t=9">Download torrent</a>')
+    yield 'astar_parser', 'sample', _page(
+        'Astar', '<h1> Аниме / Anime </h1><span id="torrent_all">Все торренты</span><div class="list_torrent">' + ''.join(
+            f'<div class="torrent"><div class="info_d1">Серии 1-{i} 1080p (1.{i} Gb)</div>'
+            f'<div class="bord_a1">Размер: 1 Gb</div><div class="bord_a1">Дата:\n {i % 28 + 1:02d}-01-2024</div>'
+            f'<a href="/engine/gettorrent.php?id={i}">Скачать</a></div>' for i in range(80)) +
+        '<div class="torrent"><div class="info_d1">Без ссылки</div></div></div>')
+    yield 'anilibria_parser', 'sample', _page(
+        'Anilibria', '<div class="text-autosize"> Название </div><div class="text-grey-darken-2">Title</div>' + ''.join(
+            f'<div class="v-list-item"><div class="fz-90">1-{i}</div>'
+            f'<div class="text-grey-darken-2 fz-75">1/{i % 12 + 1}/2024, 10:00:00 AM • 1080p • HEVC</div>'
+            f'<a href="magnet:?xt=urn:btih:{i:040d}">m</a></div>' for i in range(60)) +
+        '<div class="v-list-item"><div class="fz-90">Без magnet</div></div>')
+    yield 'anilibria_tv_parser', 'sample', _page(
+        'Название / Title Name / Другое', '<table id="publicTorrentTable"><tr><th>Серии</th></tr>' + ''.join(
+            f'<tr><td class="torrentcol1">Серии 1-{i} [WEBRip 1080p]</td>'
+            f'<td class="torrent-datetime" data-datetime="2024-01-{i % 28 + 1:02d}T10:00:00Z">дата</td>'
+            f'<td><a class="torrent-download-link" href="/upload/torrents/{i}.torrent">dl</a></td></tr>' for i in range(60)) +
+        '</table>')
+
+
+def dump_pages(dumps_dir):
+    for path in sorted(glob.glob(os.path.join(dumps_dir, '*.html'))):
+        name = os.path.basename(path)
+        # Самый длинный подходящий префикс: 'anilibria_tv_parser_' не должен попасть в 'anilibria_parser'
+        parser_name = max((p for p in PARSERS if name.startswith(p + '_')), key=len, default=None)
+        if parser_name:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                yield parser_name, name, f.read()
+
+
+def _time_per_page(func, html_content, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(html_content)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run_benchmark(dumps_dir, repeat, include_samples=True):
+    pages = list(dump_pages(dumps_dir))
+    if include_samples:
+        pages.extend(sample_pages())
+    report, mismatches = [], 0
+    for parser_name, page_name, html_content in pages:
+        legacy, extract = PARSERS[parser_name]
+        identical = legacy(html_content) == extract(html_content)
+        mismatches += 0 if identical else 1
+        legacy_ms = _time_per_page(legacy, html_content, repeat)
+        lxml_ms = _time_per_page(extract, html_content, repeat)
+        report.append({
+            'parser': parser_name, 'page': page_name, 'kb': round(len(html_content) / 1024, 1),
+            'identical': identical, 'legacy_ms': round(legacy_ms, 3), 'lxml_ms': round(lxml_ms, 3),
+            'speedup': round(legacy_ms / lxml_ms, 1) if lxml_ms else None,
+        })
+    return {'pages': report, 'mismatches': mismatches}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='BeautifulSoup против XPath lxml на страницах трекеров')
+    arg_parser.add_argument('--dumps', default='parser_dumps', help='Каталог с HTML-дампами парсеров')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='Повторов разбора каждой страницы')
+    arg_parser.add_argument('--no-samples', action='store_true', help='Только дампы, без встроенных образцов')
+    args = arg_parser.parse_args()
+    result = run_benchmark(args.dumps, max(1, args.repeat), include_samples=not args.no_samples)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result['mismatches']:
+        print(f"Результаты разошлись на {result['mismatches']} страницах", file=sys.stderr)
+        sys.exit(1)
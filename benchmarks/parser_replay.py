@@ -0,0 +1,233 @@
+# Файл: benchmarks/parser_replay.py
+"""
+Офлайн-прогон парсеров трекеров по записанным страницам: время разбора и сверка с эталонами.
+
+Страницы берутся из parser_dumps/ (HTML-дампы, которые парсеры сохраняют при флагах save_html_*)
+и из встроенных образцов benchmarks/parser_extract.py. Каждая страница отдается локальным
+HTTP-сервером, а парсер (KinozalParser, RuTrackerParser, AstarParser, AnilibriaParser, AnilibriaTvParser)
+вызывается целиком через parse_series с настоящим URL трекера: запросы сессии перенаправляются
+на локальный сервер. Браузерные парсеры получают страницу тем же HTTP-запросом вместо Playwright:
+дампы уже содержат отрендеренный DOM (page.content()).
+
+Результат parse_series сравнивается с эталоном benchmarks/parser_golden/<страница>.json; при расхождении
+бенчмарк завершается с кодом 1. --update-golden перезаписывает эталоны текущими результатами.
+В отчете: время parse_series на страницу (вместе с локальным HTTP-запросом) и записей в секунду.
+
+Пример:  python benchmarks/parser_replay.py --repeat 10 --dumps parser_dumps
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.parser_extract import dump_pages, sample_pages
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_golden')
+
+# Префикс дампа -> (класс парсера, URL сериала, суффикс запрашиваемой страницы, кодировка ответа трекера)
+REPLAY_TARGETS = {
+    'kinozal_parser': ('KinozalParser', 'https://kinozal.tv/details.php?id={n}', '', 'windows-1251'),
+    'rutracker_parser': ('RuTrackerParser', 'https://rutracker.org/forum/viewtopic.php?t={n}', '', 'windows-1251'),
+    'astar_parser': ('AstarParser', 'https://astar.bz/anime/{n}-replay.html', '', 'utf-8'),
+    'anilibria_parser': ('AnilibriaParser', 'https://aniliberty.top/anime/releases/release/replay-{n}', '/torrents', 'utf-8'),
+    'anilibria_tv_parser': ('AnilibriaTvParser', 'https://anilibria.tv/release/replay-{n}.html', '', 'utf-8'),
+}
+
+
+def _local_path(url):
+    parsed = urlparse(url)
+    return parsed.path + (f"?{parsed.query}" if parsed.query else '')
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        page = self.server.pages.get(self.path)
+        if page is None:
+            self.send_error(404)
+            return
+        body, charset = page
+        self.send_response(200)
+        self.send_header('Content-Type', f'text/html; charset={charset}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ReplayAdapter(HTTPAdapter):
+    """Отправляет любой запрос сессии на локальный сервер, сохраняя путь и параметры."""
+    def __init__(self, origin):
+        super().__init__()
+        self.origin = origin
+
+    def send(self, request, **kwargs):
+        request.url = self.origin + _local_path(request.url)
+        return super().send(request, **kwargs)
+
+
+def _replay_session(origin):
+    session = requests.Session()
+    adapter = _ReplayAdapter(origin)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _golden_name(parser_name, page_name):
+    page_name = page_name[:-5] if page_name.endswith('.html') else page_name
+    return page_name if page_name.startswith(parser_name + '_') else f"{parser_name}_{page_name}"
+
+
+def _first_difference(expected, actual, path='$'):
+    if type(expected) is not type(actual):
+        return path
+    if isinstance(expected, dict):
+        for key in sorted(set(expected) | set(actual)):
+            if key not in expected or key not in actual:
+                return f"{path}.{key}"
+            difference = _first_difference(expected[key], actual[key], f"{path}.{key}")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, list):
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            difference = _first_difference(left, right, f"{path}[{index}]")
+            if difference:
+                return difference
+        return None if len(expected) == len(actual) else f"{path} (длина {len(expected)} != {len(actual)})"
+    return None if expected == actual else path
+
+
+def _build_app(work_dir):
+    # БД, логи и кэш страниц создаются во временном каталоге, чтобы не трогать рабочие файлы проекта
+    os.chdir(work_dir)
+    # Модуль logger уже импортирован парсерами из parser_extract и создал logs/ в прежнем каталоге
+    os.makedirs('logs', exist_ok=True)
+    from flask import Flask
+    from db import Database
+    from logger import Logger
+    from debug_manager import DebugManager
+    from utils.rate_limiter import DEFAULT_LIMITS
+
+    app = Flask('benchmark')
+    app.logger = Logger('benchmark')
+    for handler in app.logger.logger.handlers:
+        if not hasattr(handler, 'baseFilename'):
+            handler.setLevel('WARNING')
+    app.db = Database(f"sqlite:///{os.path.join(work_dir, 'bench.db')}", logger=app.logger)
+    app.debug_manager = DebugManager(app.db)
+    # Ограничитель запросов не должен задерживать прогон: все пределы снимаются
+    app.db.set_setting('rate_limits', json.dumps({key: {'rate': 1e6, 'burst': 1000000} for key in DEFAULT_LIMITS}))
+    return app
+
+
+def _create_parser(app, parser_class_name, session):
+    from auth import AuthManager
+    from parsers import create_parser
+
+    class ReplayAuthManager(AuthManager):
+        def get_kinozal_session(self, url):
+            return session
+
+        def get_rutracker_session(self, url):
+            return session
+
+        def invalidate_session(self, auth_type, url, reason):
+            pass
+
+    parser = create_parser(parser_class_name, ReplayAuthManager(app.db, app.logger), app.db, app.logger)
+    # Ошибка разбора детерминирована: повторы с паузой только растянули бы прогон
+    parser.MAX_RETRIES = 1
+    parser.RETRY_DELAY = 0
+    if hasattr(parser, '_fetch_page_source'):
+        parser._fetch_page_source = lambda url: session.get(url, timeout=10).text
+    return parser
+
+
+def run_benchmark(dumps_dir, repeat, include_samples=True, update_golden=False):
+    pages = list(dump_pages(os.path.abspath(dumps_dir)))
+    if include_samples:
+        pages.extend(sample_pages())
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ReplayHandler)
+    server.pages = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = _replay_session(f"http://127.0.0.1:{server.server_address[1]}")
+
+    report, mismatches = [], 0
+    original_cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            app = _build_app(work_dir)
+            with app.app_context():
+                for parser_name, page_name, html_content in pages:
+                    parser_class_name, url_template, fetch_suffix, charset = REPLAY_TARGETS[parser_name]
+                    # Номер в URL не зависит от набора дампов: эталон страницы не меняется при добавлении других
+                    url = url_template.format(n=zlib.crc32(f"{parser_name}/{page_name}".encode('utf-8')))
+                    server.pages[_local_path(url + fetch_suffix)] = (html_content.encode(charset, errors='xmlcharrefreplace'), charset)
+                    parser = _create_parser(app, parser_class_name, session)
+
+                    timings, result = [], None
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        # Принудительная замена отключает кэш страниц: иначе повторы измеряли бы кэш, а не разбор
+                        result = parser.parse_series(url, None, debug_force_replace=True)
+                        timings.append(time.perf_counter() - started)
+                    result = json.loads(json.dumps(result, ensure_ascii=False, default=str))
+
+                    golden_path = os.path.join(GOLDEN_DIR, _golden_name(parser_name, page_name) + '.json')
+                    if update_golden:
+                        os.makedirs(GOLDEN_DIR, exist_ok=True)
+                        with open(golden_path, 'w', encoding='utf-8') as f:
+                            json.dump(result, f, ensure_ascii=False, indent=2)
+                            f.write('\n')
+                        status, difference = 'updated', None
+                    elif os.path.exists(golden_path):
+                        with open(golden_path, encoding='utf-8') as f:
+                            difference = _first_difference(json.load(f), result)
+                        status = 'mismatch' if difference else 'ok'
+                    else:
+                        status, difference = 'no_golden', None
+                    mismatches += 1 if status == 'mismatch' else 0
+
+                    average = sum(timings) / len(timings)
+                    records = len(result.get('torrents') or [])
+                    report.append({
+                        'parser': parser_name, 'page': page_name, 'kb': round(len(html_content) / 1024, 1),
+                        'status': status, 'difference': difference, 'error': result.get('error'),
+                        'records': records, 'parse_ms': round(average * 1000, 3),
+                        'records_per_second': round(records / average) if average and records else 0,
+                    })
+    finally:
+        os.chdir(original_cwd)
+        server.shutdown()
+    return {'pages': report, 'mismatches': mismatches}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Прогон парсеров по записанным страницам и сверка с эталонами')
+    arg_parser.add_argument('--dumps', default='parser_dumps', help='Каталог с HTML-дампами парсеров')
+    arg_parser.add_argument('--repeat', type=int, default=10, help='Повторов parse_series на каждую страницу')
+    arg_parser.add_argument('--no-samples', action='store_true', help='Только дампы, без встроенных образцов')
+    arg_parser.add_argument('--update-golden', action='store_true', help='Записать текущие результаты как эталоны')
+    args = arg_parser.parse_args()
+    result = run_benchmark(args.dumps, max(1, args.repeat), include_samples=not args.no_samples,
+                           update_golden=args.update_golden)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result['mismatches']:
+        print(f"Результаты разошлись с эталонами на {result['mismatches']} страницах", file=sys.stderr)
+        sys.exit(1)
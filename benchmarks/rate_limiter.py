@@ -0,0 +1,106 @@
+# Файл: benchmarks/rate_limiter.py
+"""
+Поток запросов к трекеру при параллельном сканировании: без ограничений против общего ограничителя
+(utils/rate_limiter.HostRateLimiter).
+
+Несколько потоков одновременно "сканируют" сериалы одного трекера через два его зеркала и скачивают .torrent.
+Для каждого режима считаются число запросов, максимальное число запросов за любое скользящее окно
+--window секунд и задержки ограничителя. Время самих запросов не имитируется: измеряется только планирование.
+
+Пример:  python benchmarks/rate_limiter.py --threads 8 --pages 3 --rate 5 --burst 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MIRRORS = ['kinozal.me', 'kinozal.tv']
+
+
+class _FakeDb:
+    def __init__(self, limits):
+        self.limits = limits
+
+    def get_setting(self, key, default=None):
+        return json.dumps(self.limits) if key == 'rate_limits' else default
+
+    def get_all_trackers(self):
+        return [{'canonical_name': 'kinozal', 'mirrors': MIRRORS}]
+
+
+class _QuietLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    warning = info
+
+
+def _max_in_window(timestamps, window):
+    timestamps = sorted(timestamps)
+    best, start = 0, 0
+    for end, stamp in enumerate(timestamps):
+        while stamp - timestamps[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+def _run(limiter, threads, pages):
+    stamps = {'pages': [], 'downloads': []}
+    lock = threading.Lock()
+
+    def worker(index):
+        for page in range(pages):
+            url = f"https://{MIRRORS[(index + page) % len(MIRRORS)]}/details.php?id={index}"
+            if limiter:
+                limiter.acquire(url)
+            with lock:
+                stamps['pages'].append(time.monotonic())
+        link = f"https://dl.{MIRRORS[index % len(MIRRORS)]}/download.php?id={index}"
+        if limiter:
+            limiter.acquire(link, purpose='download')
+        with lock:
+            stamps['downloads'].append(time.monotonic())
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return stamps, time.monotonic() - started
+
+
+def run_benchmark(threads, pages, rate, burst, window):
+    from utils.rate_limiter import HostRateLimiter
+
+    limits = {'kinozal': {'rate': rate, 'burst': burst}, 'kinozal:download': {'rate': rate / 2, 'burst': 1}}
+    report = {'limits': limits}
+    unlimited, unlimited_time = _run(None, threads, pages)
+    limiter = HostRateLimiter(_FakeDb(limits), _QuietLogger())
+    limited, limited_time = _run(limiter, threads, pages)
+    for name, stamps, elapsed in (('unlimited', unlimited, unlimited_time), ('limited', limited, limited_time)):
+        report[name] = {
+            'seconds': round(elapsed, 2),
+            'page_requests': len(stamps['pages']),
+            f'max_pages_per_{window:g}s': _max_in_window(stamps['pages'], window),
+            f'max_downloads_per_{window:g}s': _max_in_window(stamps['downloads'], window),
+        }
+    report['limiter_metrics'] = limiter.get_metrics()
+    return report
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Параллельное сканирование без ограничителя и с ним')
+    arg_parser.add_argument('--threads', type=int, default=8, help='Число параллельных сканирований')
+    arg_parser.add_argument('--pages', type=int, default=3, help='Запросов страниц на одно сканирование')
+    arg_parser.add_argument('--rate', type=float, default=5, help='Предел страниц трекера в секунду')
+    arg_parser.add_argument('--burst', type=int, default=2, help='Допустимая пачка запросов')
+    arg_parser.add_argument('--window', type=float, default=1, help='Окно подсчета пиковой нагрузки, с')
+    args = arg_parser.parse_args()
+    print(json.dumps(run_benchmark(args.threads, args.pages, args.rate, args.burst, args.window), ensure_ascii=False, indent=2))
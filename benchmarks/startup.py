@@ -0,0 +1,78 @@
+# Файл: benchmarks/startup.py
+"""
+Время холодного старта приложения: импорт модуля run (Flask-приложение, БД, агенты, маршруты)
+в отдельном процессе. В отчете: время импорта, пиковый RSS процесса и какие тяжелые зависимости
+парсеров (playwright, cloudscraper, bs4, lxml) оказались загружены. Парсеры импортируются
+при первом сканировании, поэтому после старта этих модулей быть не должно.
+
+Процесс запускается во временном каталоге, чтобы не трогать app.db рабочей копии.
+С --max-seconds бенчмарк завершается с кодом 1, если старт медленнее порога или
+тяжелые модули загружены при старте (регрессия).
+
+Пример:  python benchmarks/startup.py --runs 5 --max-seconds 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['playwright', 'cloudscraper', 'bs4', 'lxml']
+
+CHILD_CODE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import run
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'import_seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy_modules': sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+
+def measure_once() -> dict:
+    code = CHILD_CODE.format(root=ROOT, heavy=HEAVY_MODULES)
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = subprocess.run([sys.executable, '-c', code], cwd=workdir,
+                              capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Импорт run завершился с кодом {proc.returncode}:\n{proc.stderr}")
+    # Последняя строка stdout - результат; выше может быть вывод логгера приложения
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(runs: int) -> dict:
+    results = [measure_once() for _ in range(runs)]
+    import_times = [r['import_seconds'] for r in results]
+    return {
+        'runs': runs,
+        'import_seconds_min': round(min(import_times), 3),
+        'import_seconds_median': round(statistics.median(import_times), 3),
+        'max_rss_mb': round(max(r['max_rss_mb'] for r in results), 1),
+        'heavy_modules_loaded': sorted({m for r in results for m in r['heavy_modules']}),
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Время холодного старта приложения')
+    arg_parser.add_argument('--runs', type=int, default=3, help='Количество запусков')
+    arg_parser.add_argument('--max-seconds', type=float, default=None,
+                            help='Порог медианного времени импорта; при превышении код выхода 1')
+    args = arg_parser.parse_args()
+    report = run_benchmark(max(1, args.runs))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.max_seconds is not None:
+        if report['import_seconds_median'] > args.max_seconds:
+            print(f"Регрессия: старт {report['import_seconds_median']} с > {args.max_seconds} с", file=sys.stderr)
+            sys.exit(1)
+        if report['heavy_modules_loaded']:
+            print(f"Регрессия: при старте загружены {', '.join(report['heavy_modules_loaded'])}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,311 @@
+# Файл: browser_pool.py
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Set
+from logger import Logger
+
+
+def _read_process_table() -> tuple:
+    """Дерево процессов и их RSS по /proc: (ppid -> [pid], pid -> RSS в страницах). Только Linux."""
+    children: Dict[int, list] = {}
+    rss_pages: Dict[int, int] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                fields = f.read().rsplit(b')', 1)[1].split()
+            # После имени процесса: state ppid ... rss (24-е поле stat, 22-е после имени)
+            children.setdefault(int(fields[1]), []).append(int(entry))
+            rss_pages[int(entry)] = int(fields[21])
+        except (OSError, IndexError, ValueError):
+            continue
+    return children, rss_pages
+
+
+def _subtree_rss_mb(root_pids: Set[int]) -> float:
+    """Суммарный RSS процессов root_pids и всех их потомков. Только Linux, иначе 0."""
+    try:
+        children, rss_pages = _read_process_table()
+        total_pages, stack = 0, list(root_pids)
+        while stack:
+            pid = stack.pop()
+            total_pages += rss_pages.get(pid, 0)
+            stack.extend(children.get(pid, []))
+        return total_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+
+def _playwright_driver_pids() -> Set[int]:
+    """
+    PID драйверов Playwright, запущенных этим процессом. Браузеры - потомки драйвера, поэтому его поддерево
+    не включает другие дочерние процессы приложения (ffmpeg нарезки, загрузчики).
+    """
+    try:
+        children, _ = _read_process_table()
+    except OSError:
+        return set()
+    pids = set()
+    for pid in children.get(os.getpid(), []):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if b'run-driver' in f.read():
+                    pids.add(pid)
+        except OSError:
+            continue
+    return pids
+
+
+class BrowserPool:
+    """
+    Пул долгоживущих headless-браузеров Firefox для парсеров, которым нужен рендеринг JS.
+
+    Sync API Playwright привязан к потоку, который его запустил, поэтому каждым браузером владеет
+    свой рабочий поток. Парсер передает в run() функцию, получающую изолированный BrowserContext;
+    контекст закрывается сразу после нее, браузер остается жить. Число рабочих потоков - это
+    предел одновременно открытых контекстов. Браузер перезапускается после max_pages страниц,
+    после сбоя или когда драйверы Playwright и их браузеры занимают больше max_rss_mb; простаивающий
+    дольше idle_timeout браузер закрывается. Контекст задачи, не уложившейся в timeout run(), закрывается.
+    """
+    def __init__(self, logger: Logger, size: int = 2, max_pages: int = 50, max_rss_mb: int = 1500, idle_timeout: int = 300):
+        self.logger = logger
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.max_rss_mb = max_rss_mb
+        self.idle_timeout = idle_timeout
+        self.jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.idle_workers = 0
+        self.is_shutdown = False
+        self.driver_pids: Set[int] = set()
+        self.metrics = {'jobs': 0, 'failed_jobs': 0, 'timed_out_jobs': 0, 'launches': 0,
+                        'recycled_pages': 0, 'recycled_memory': 0, 'recycled_crash': 0, 'idle_closed': 0}
+        self._wait_times = deque(maxlen=200)
+        self._job_times = deque(maxlen=200)
+
+    def _increment_metric(self, name: str):
+        with self.lock:
+            self.metrics[name] += 1
+
+    def _ensure_workers(self):
+        with self.lock:
+            # Новый рабочий поток (и браузер) создается, только если все имеющиеся заняты, и не больше size
+            if len(self.workers) >= self.size or self.jobs.qsize() <= self.idle_workers:
+                return
+            worker = threading.Thread(target=self._worker_loop, name=f"BrowserPool-{len(self.workers) + 1}", daemon=True)
+            self.workers.append(worker)
+        worker.start()
+
+    def run(self, job: Callable[[Any], Any], context_options: Optional[Dict] = None, timeout: float = 180) -> Any:
+        """
+        Выполняет job(context) в свободном браузере пула и возвращает ее результат.
+        Исключения job (включая таймауты Playwright) пробрасываются вызывающему коду.
+        Если результата нет за timeout секунд, задача снимается из очереди или ее контекст закрывается,
+        чтобы зависшая страница не занимала рабочий поток.
+        """
+        if self.is_shutdown:
+            raise RuntimeError("Пул браузеров остановлен")
+        future: Future = Future()
+        handle = {'context': None}
+        self.jobs.put((job, context_options or {}, future, time.time(), handle))
+        self._ensure_workers()
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._increment_metric('timed_out_jobs')
+            if not future.cancel():
+                self._abort_job(handle)
+            raise
+
+    def _abort_job(self, handle: Dict):
+        """Закрывает контекст выполняющейся задачи из чужого потока."""
+        with self.lock:
+            context = handle['context']
+        if context is None:
+            return
+        self.logger.warning("browser_pool", "Задача пула браузеров не уложилась в таймаут, ее контекст закрывается.")
+        try:
+            # Sync API нельзя вызывать из чужого потока: закрытие ставится в цикл событий рабочего потока,
+            # который крутится, пока задача ждет Playwright, и ожидающая операция завершается ошибкой
+            asyncio.run_coroutine_threadsafe(context._impl_obj.close(), context._loop)
+        except Exception as e:
+            self.logger.warning("browser_pool", f"Не удалось закрыть контекст зависшей задачи: {e}")
+
+    def _launch(self, playwright):
+        browser = playwright.firefox.launch(headless=True)
+        self._increment_metric('launches')
+        self.logger.info("browser_pool", f"[{threading.current_thread().name}] Запущен браузер Firefox.")
+        return browser
+
+    def _close_browser(self, browser):
+        try:
+            browser.close()
+        except Exception as e:
+            self.logger.warning("browser_pool", f"Ошибка при закрытии браузера: {e}")
+
+    def _fail_pending(self, error: Exception):
+        """Отклоняет ожидающие задачи, если рабочий поток не смог запустить Playwright."""
+        while True:
+            try:
+                item = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if item is None:
+                self.jobs.put(None)
+                return
+            future = item[2]
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def _worker_loop(self):
+        try:
+            # Playwright импортируется рабочим потоком: при старте приложения он не нужен
+            from playwright.sync_api import sync_playwright
+            playwright = sync_playwright().start()
+            driver_pids = _playwright_driver_pids()
+            with self.lock:
+                self.driver_pids |= driver_pids
+        except Exception as e:
+            self.logger.error("browser_pool", f"Не удалось запустить Playwright: {e}", exc_info=True)
+            with self.lock:
+                self.workers.remove(threading.current_thread())
+            self._fail_pending(e)
+            return
+        browser = None
+        pages_served = 0
+        try:
+            while True:
+                with self.lock:
+                    self.idle_workers += 1
+                try:
+                    item = self.jobs.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    if browser is not None:
+                        self._close_browser(browser)
+                        browser, pages_served = None, 0
+                        self._increment_metric('idle_closed')
+                    continue
+                finally:
+                    with self.lock:
+                        self.idle_workers -= 1
+                if item is None:
+                    break
+
+                job, context_options, future, queued_at, handle = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                started_at = time.time()
+                with self.lock:
+                    self._wait_times.append(started_at - queued_at)
+                try:
+                    if browser is None or not browser.is_connected():
+                        if browser is not None:
+                            self._increment_metric('recycled_crash')
+                        browser, pages_served = self._launch(playwright), 0
+                    context = browser.new_context(**context_options)
+                    with self.lock:
+                        handle['context'] = context
+                    try:
+                        result = job(context)
+                    finally:
+                        with self.lock:
+                            handle['context'] = None
+                        context.close()
+                    future.set_result(result)
+                except Exception as e:
+                    self._increment_metric('failed_jobs')
+                    future.set_exception(e)
+                finally:
+                    pages_served += 1
+                    self._increment_metric('jobs')
+                    with self.lock:
+                        self._job_times.append(time.time() - started_at)
+
+                if browser is not None and pages_served >= self.max_pages:
+                    self.logger.info("browser_pool", f"Перезапуск браузера после {pages_served} страниц.")
+                    self._close_browser(browser)
+                    browser = None
+                    self._increment_metric('recycled_pages')
+                elif browser is not None and self.max_rss_mb and self._browsers_rss_mb() > self.max_rss_mb:
+                    self.logger.warning("browser_pool", f"Браузеры занимают больше {self.max_rss_mb} МБ, перезапуск браузера.")
+                    self._close_browser(browser)
+                    browser = None
+                    self._increment_metric('recycled_memory')
+        finally:
+            if browser is not None:
+                self._close_browser(browser)
+            playwright.stop()
+            with self.lock:
+                self.driver_pids -= driver_pids
+
+    def _browsers_rss_mb(self) -> float:
+        """RSS драйверов Playwright пула и запущенных ими браузеров, без остальных дочерних процессов приложения."""
+        with self.lock:
+            driver_pids = set(self.driver_pids)
+        return _subtree_rss_mb(driver_pids) if driver_pids else 0.0
+
+    def shutdown(self):
+        with self.lock:
+            self.is_shutdown = True
+            workers = list(self.workers)
+        for _ in workers:
+            self.jobs.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
+        self.logger.info("browser_pool", "Пул браузеров остановлен.")
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            wait_times = list(self._wait_times)
+            job_times = list(self._job_times)
+            status = dict(self.metrics)
+            status['workers'] = len(self.workers)
+            status['idle_workers'] = self.idle_workers
+        status['size'] = self.size
+        status['queued'] = self.jobs.qsize()
+        status['avg_wait_seconds'] = round(sum(wait_times) / len(wait_times), 3) if wait_times else 0
+        status['avg_job_seconds'] = round(sum(job_times) / len(job_times), 3) if job_times else 0
+        status['browsers_rss_mb'] = round(self._browsers_rss_mb(), 1)
+        return status
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_browser_pool(db, logger: Logger) -> BrowserPool:
+    """
+    Возвращает общий для процесса пул браузеров. Размер и пороги перезапуска задаются настройками
+    'browser_pool_size', 'browser_pool_max_pages' и 'browser_pool_max_rss_mb'.
+    """
+    global _shared_pool
+    if _shared_pool is None:
+        with _shared_pool_lock:
+            if _shared_pool is None:
+                def _int_setting(key, default):
+                    try:
+                        return int(db.get_setting(key, default))
+                    except (ValueError, TypeError):
+                        return default
+                _shared_pool = BrowserPool(logger,
+                                           size=_int_setting('browser_pool_size', 2),
+                                           max_pages=_int_setting('browser_pool_max_pages', 50),
+                                           max_rss_mb=_int_setting('browser_pool_max_rss_mb', 1500))
+                logger.info("browser_pool", f"Создан пул браузеров на {_shared_pool.size} контекст(ов).")
+    return _shared_pool
+
+
+def shutdown_browser_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.shutdown()
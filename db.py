@@ -7,19 +7,28 @@ from sqlalchemy import create_engine, func, inspect, text
 from sqlalchemy.orm import sessionmaker, joinedload
 from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Optional, Any
+from typing import Callable, List, Dict, Optional, Any
 
 from models import (
     Base, Auth, Series, SeriesStatus,
     Torrent, Setting, AgentTask, ScanTask,
     ParserProfile, ParserRule, ParserRuleCondition, MediaItem, DownloadTask,
     SlicingTask, SlicedFile, TorrentFile, RelocationTask,
-    RenamingTask, Tracker, SeriesTMDB
+    RenamingTask, Tracker, SeriesTMDB, PageCache, TrackerSession,
+    OWNED_TORRENT_FILE_STATUSES
 )
 
 class Database:
     ENABLE_DEBUG_SCHEMA_CHECK = True
 
+    # Колонки, добавленные в существующие таблицы. Добавляются через ALTER TABLE до проверки схемы,
+    # иначе проверка пересоздаст таблицу вместе с данными.
+    ADDITIVE_COLUMNS = [
+        ('torrents', 'qb_instance', 'TEXT'),
+        ('trackers', 'mirror_health', "TEXT DEFAULT '{}'"),
+        ('series', 'vk_scan_state', "TEXT DEFAULT '{}'"),
+    ]
+
     def __init__(self, db_url: str = "sqlite:///app.db", logger=None):
         self.engine = create_engine(db_url, connect_args={'check_same_thread': False, 'timeout': 15})
         self.logger = logger if logger else logging.getLogger(__name__)
@@ -27,6 +36,8 @@ class Database:
         Base.metadata.create_all(self.engine) 
         self.Session = sessionmaker(bind=self.engine)
 
+        self._add_missing_columns()
+
         if self.ENABLE_DEBUG_SCHEMA_CHECK:
             self._debug_check_and_migrate_tables_individually()
         
@@ -35,6 +46,23 @@ class Database:
 
         self._seed_trackers_if_empty()
 
+    def _add_missing_columns(self):
+        """Неразрушающая миграция: добавляет недостающие колонки из ADDITIVE_COLUMNS."""
+        inspector = inspect(self.engine)
+        with self.Session() as session:
+            try:
+                for table_name, column_name, column_type in self.ADDITIVE_COLUMNS:
+                    if not inspector.has_table(table_name):
+                        continue
+                    if any(c['name'] == column_name for c in inspector.get_columns(table_name)):
+                        continue
+                    session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+                    self.logger.warning("db_migration", f"Добавлена колонка {column_name} в таблицу {table_name}")
+                session.commit()
+            except Exception as e:
+                self.logger.error("db_migration", f"Ошибка добавления колонок: {e}", exc_info=True)
+                session.rollback()
+
     def _debug_check_and_migrate_tables_individually(self):
         self.logger.info("db", "DEBUG: Начат детальный анализ схемы базы данных (по таблицам).")
         inspector = inspect(self.engine)
@@ -225,6 +253,19 @@ class Database:
                         setattr(series, key, value)
                 session.commit()
 
+    def get_series_vk_scan_state(self, series_id: int) -> Dict[str, Any]:
+        """Возвращает состояние инкрементального сканирования VK-канала сериала."""
+        with self.Session() as session:
+            series = session.query(Series).filter_by(id=series_id).first()
+            return json.loads(series.vk_scan_state or '{}') if series else {}
+
+    def set_series_vk_scan_state(self, series_id: int, state: Dict[str, Any]):
+        with self.Session() as session:
+            series = session.query(Series).filter_by(id=series_id).first()
+            if series:
+                series.vk_scan_state = json.dumps(state)
+                session.commit()
+
     # ДОБАВИТЬ ЭТИ МЕТОДЫ В КЛАСС Database
     def set_series_status_flag(self, series_id: int, status_name: str, value: bool):
         """Устанавливает конкретный флаг статуса для сериала."""
@@ -327,7 +368,7 @@ class Database:
                 session.rollback()
                 raise
 
-    def add_torrent(self, series_id: int, torrent_data: Dict[str, Any], is_active: bool = True, qb_hash: Optional[str] = None):
+    def add_torrent(self, series_id: int, torrent_data: Dict[str, Any], is_active: bool = True, qb_hash: Optional[str] = None, qb_instance: Optional[str] = None):
         with self.Session() as session:
             torrent = Torrent(
                 series_id=series_id,
@@ -337,7 +378,8 @@ class Database:
                 quality=torrent_data.get("quality"),
                 episodes=torrent_data.get("episodes"),
                 is_active=is_active,
-                qb_hash=qb_hash
+                qb_hash=qb_hash,
+                qb_instance=qb_instance
             )
             session.add(torrent)
             session.commit()
@@ -349,6 +391,34 @@ class Database:
             if is_active is not None: query = query.filter_by(is_active=is_active)
             return [{c.name: getattr(t, c.name) for c in t.__table__.columns} for t in query.all()]
 
+    def get_qbittorrent_instances(self) -> List[Dict[str, str]]:
+        """Все экземпляры qBittorrent: записи auth с типом 'qbittorrent' или 'qbittorrent_<имя>'."""
+        with self.Session() as session:
+            rows = session.query(Auth).filter((Auth.auth_type == 'qbittorrent') | Auth.auth_type.like('qbittorrent\\_%', escape='\\')).order_by(Auth.auth_type).all()
+            return [{"name": a.auth_type, "url": a.url, "username": a.username} for a in rows]
+
+    def delete_auth(self, auth_type: str):
+        with self.Session() as session:
+            session.query(Auth).filter_by(auth_type=auth_type).delete()
+            session.commit()
+
+    def get_active_torrent_counts_by_instance(self) -> Dict[Optional[str], int]:
+        """Количество активных торрентов на каждом экземпляре qBittorrent (None - основной)."""
+        with self.Session() as session:
+            rows = session.query(Torrent.qb_instance, func.count(Torrent.id)).filter(Torrent.is_active == True).group_by(Torrent.qb_instance).all()
+            return {instance: count for instance, count in rows}
+
+    def get_torrent_instances_by_hashes(self, hashes: List[str]) -> Dict[str, Optional[str]]:
+        if not hashes:
+            return {}
+        with self.Session() as session:
+            rows = session.query(Torrent.qb_hash, Torrent.qb_instance).filter(Torrent.qb_hash.in_(hashes)).all()
+            return {qb_hash: instance for qb_hash, instance in rows}
+
+    def get_all_torrent_hashes(self) -> List[str]:
+        with self.Session() as session:
+            return [row[0] for row in session.query(Torrent.qb_hash).filter(Torrent.qb_hash.isnot(None)).distinct().all()]
+
     def get_torrent_by_hash(self, qb_hash: str) -> Optional[Dict[str, Any]]:
         with self.Session() as session:
             torrent = session.query(Torrent).filter_by(qb_hash=qb_hash).first()
@@ -374,6 +444,16 @@ class Database:
             setting = session.query(Setting).filter_by(key=key).first()
             return setting.value if setting else default
 
+    def get_page_cache(self, url: str) -> Optional[Dict[str, Any]]:
+        with self.Session() as session:
+            entry = session.query(PageCache).filter_by(url=url).first()
+            return {c.name: getattr(entry, c.name) for c in entry.__table__.columns} if entry else None
+
+    def set_page_cache(self, url: str, data: Dict[str, Any]):
+        with self.Session() as session:
+            session.merge(PageCache(url=url, updated_at=datetime.now(timezone.utc), **data))
+            session.commit()
+
     def get_settings_by_prefix(self, prefix: str) -> Dict[str, str]:
         with self.Session() as session:
             settings = session.query(Setting).filter(Setting.key.like(f"{prefix}%")).all()
@@ -627,7 +707,12 @@ class Database:
             else:
                 self.logger.warning("db", f"Попытка сбросить статус для несуществующего media_item с UID: {unique_id}")
 
-    def add_or_update_media_items(self, items_to_process: List[Dict[str, Any]]):
+    def add_or_update_media_items(self, items_to_process: List[Dict[str, Any]], keep_missing: bool = False):
+        """
+        Сохраняет кандидатов сериала. Обычно список полный, и отсутствующие в нем нетронутые записи удаляются.
+        keep_missing=True - список содержит только новые видео (инкрементальное сканирование VK): отсутствующие
+        записи остаются и вместе с новыми снова становятся кандидатами, как при полном сканировании.
+        """
         if not items_to_process:
             return
 
@@ -648,6 +733,9 @@ class Database:
                 phantom_items_to_delete = []
                 for existing_uid, existing_item in existing_items_map.items():
                     if existing_uid not in new_unique_ids:
+                        if keep_missing:
+                            existing_item.plan_status = 'candidate'
+                            continue
                         # 3. Применяем строгую проверку безопасности
                         is_in_pristine_state = (
                             existing_item.status == 'pending' and
@@ -751,16 +839,19 @@ class Database:
             ).first()
             return task is not None
 
-    def get_pending_download_tasks(self, limit: int) -> List[Dict[str, Any]]:
+    def get_pending_download_tasks(self, limit: int, series_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         with self.Session() as session:
             # Используем правильное имя столбца `task_key` и фильтруем по типу задачи
-            tasks = session.query(DownloadTask).join(
+            query = session.query(DownloadTask).join(
                 MediaItem, DownloadTask.task_key == MediaItem.unique_id
             ).filter(
                 DownloadTask.task_type == 'vk_video',
                 DownloadTask.status == 'pending',
                 MediaItem.plan_status.in_(['in_plan_single', 'in_plan_compilation'])
-            ).order_by(DownloadTask.created_at).limit(limit).all()
+            )
+            if series_ids is not None:
+                query = query.filter(DownloadTask.series_id.in_(series_ids))
+            tasks = query.order_by(DownloadTask.created_at).limit(limit).all()
             
             return [{c.name: getattr(task, c.name) for c in task.__table__.columns} for task in tasks]
         
@@ -819,10 +910,10 @@ class Database:
             else:
                 # Считаем TorrentFile
                 # Нам нужны файлы, которые считаются "эпизодами".
-                # Обычно это те, которые переименованы (renamed).
+                # Обычно это те, которые переименованы (renamed) или пропущены как уже скачанные (skipped).
                 return session.query(TorrentFile).join(Torrent).filter(
                     Torrent.series_id == series_id,
-                    TorrentFile.status == 'renamed'
+                    TorrentFile.status.in_(OWNED_TORRENT_FILE_STATUSES)
                 ).count()
 
     # --- TMDB METHODS ---
@@ -963,11 +1054,18 @@ class Database:
                 item.slicing_status = status
                 session.commit()
 
-    def create_slicing_task(self, unique_id: str, series_id: int) -> int:
-        """Создает новую задачу на нарезку в очереди."""
+    def create_slicing_task(self, unique_id: str, series_id: int, before_commit: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Создает новую задачу на нарезку в очереди.
+        before_commit(task_id) вызывается до того, как задача станет видна агенту нарезки
+        (например, чтобы поставить ее в приоритетную полосу).
+        """
         with self.Session() as session:
             new_task = SlicingTask(media_item_unique_id=unique_id, series_id=series_id, status='pending')
             session.add(new_task)
+            session.flush()
+            if before_commit:
+                before_commit(new_task.id)
             session.commit()
             return new_task.id
 
@@ -979,6 +1077,12 @@ class Database:
                 return None
             return {c.name: getattr(task, c.name) for c in task.__table__.columns}
 
+    def get_pending_slicing_tasks(self) -> List[Dict[str, Any]]:
+        """Извлекает все ожидающие задачи на нарезку в порядке создания."""
+        with self.Session() as session:
+            tasks = session.query(SlicingTask).filter_by(status='pending').order_by(SlicingTask.created_at).all()
+            return [{c.name: getattr(task, c.name) for c in task.__table__.columns} for task in tasks]
+
     def update_slicing_task(self, task_id: int, updates: Dict[str, Any]):
         """Обновляет данные задачи на нарезку (статус, прогресс и т.д.)."""
         with self.Session() as session:
@@ -1686,10 +1790,72 @@ class Database:
                     "parser_class": t.parser_class,
                     "auth_type": t.auth_type,
                     # --- КОНЕЦ ИЗМЕНЕНИЙ ---
-                    "ui_features": json.loads(t.ui_features or '{}')
+                    "ui_features": json.loads(t.ui_features or '{}'),
+                    "mirror_health": json.loads(t.mirror_health or '{}')
                 })
             return result
 
+    def get_tracker_mirror_health(self, tracker_id: int) -> Dict[str, Any]:
+        """Возвращает статистику здоровья зеркал трекера."""
+        with self.Session() as session:
+            tracker = session.query(Tracker).filter_by(id=tracker_id).first()
+            return json.loads(tracker.mirror_health or '{}') if tracker else {}
+
+    def set_tracker_mirror_health(self, tracker_id: int, health: Dict[str, Any]):
+        """Сохраняет статистику здоровья зеркал трекера."""
+        with self.Session() as session:
+            tracker = session.query(Tracker).filter_by(id=tracker_id).first()
+            if tracker:
+                tracker.mirror_health = json.dumps(health, ensure_ascii=False)
+                session.commit()
+
+    def get_tracker_session(self, key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает сохраненную сессию трекера (payload зашифрован)."""
+        with self.Session() as session:
+            entry = session.query(TrackerSession).filter_by(key=key).first()
+            return {c.name: getattr(entry, c.name) for c in entry.__table__.columns} if entry else None
+
+    def get_all_tracker_sessions(self) -> List[Dict[str, Any]]:
+        """Состояние всех сохраненных сессий трекеров без самих cookies."""
+        with self.Session() as session:
+            entries = session.query(TrackerSession).all()
+            return [{c.name: getattr(entry, c.name) for c in entry.__table__.columns if c.name != 'payload'} for entry in entries]
+
+    def save_tracker_session(self, key: str, auth_type: str, domain: str, payload: str):
+        """Сохраняет сессию после успешного входа и отмечает ее действительной."""
+        now = datetime.now(timezone.utc)
+        with self.Session() as session:
+            entry = session.query(TrackerSession).filter_by(key=key).first()
+            if not entry:
+                entry = TrackerSession(key=key, auth_type=auth_type, domain=domain, login_count=0)
+                session.add(entry)
+            entry.payload = payload
+            entry.is_valid = True
+            entry.logged_in_at = now
+            entry.last_used_at = now
+            entry.invalidated_at = None
+            entry.invalid_reason = None
+            entry.login_count = (entry.login_count or 0) + 1
+            session.commit()
+
+    def touch_tracker_session(self, key: str):
+        with self.Session() as session:
+            entry = session.query(TrackerSession).filter_by(key=key).first()
+            if entry:
+                entry.last_used_at = datetime.now(timezone.utc)
+                session.commit()
+
+    def invalidate_tracker_session(self, key: str, reason: str):
+        """Помечает сессию недействительной; cookies удаляются, при следующем обращении выполняется вход."""
+        with self.Session() as session:
+            entry = session.query(TrackerSession).filter_by(key=key).first()
+            if entry:
+                entry.payload = None
+                entry.is_valid = False
+                entry.invalidated_at = datetime.now(timezone.utc)
+                entry.invalid_reason = reason[:300]
+                session.commit()
+
     def update_tracker_mirrors(self, tracker_id: int, mirrors: List[str]):
         """Обновляет список зеркал для указанного трекера."""
         with self.Session() as session:
@@ -1720,6 +1886,12 @@ class Database:
                 session.rollback()
                 raise
 
+    def get_pending_renaming_tasks(self) -> List[Dict[str, Any]]:
+        """Возвращает все ожидающие задачи на переименование в порядке создания."""
+        with self.Session() as session:
+            tasks = session.query(RenamingTask).filter_by(status='pending').order_by(RenamingTask.created_at).all()
+            return [{c.name: getattr(task, c.name) for c in task.__table__.columns} for task in tasks]
+
     def get_all_renaming_tasks(self, series_id: int = None) -> List[Dict[str, Any]]:
         """Возвращает все активные задачи на переименование (pending или in_progress)."""
         with self.Session() as session:
@@ -1,18 +1,24 @@
 import os
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from flask import Flask
 from db import Database
+from models import OWNED_TORRENT_FILE_STATUSES
 from logger import Logger
-from qbittorrent import QBittorrentClient
+from qbittorrent import QBittorrentClient, get_qbittorrent_client
 from rule_engine import RuleEngine
 from filename_formatter import FilenameFormatter
-from auth import AuthManager
 
-def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash: str):
+# Количество одновременных запросов renameFile к qBittorrent для одного торрента
+RENAME_CONCURRENCY = 4
+
+def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash: str, qb_client: QBittorrentClient = None):
     """
     Централизованная функция для полной обработки и переименования файлов
     внутри одного торрента с распределением по папкам сезонов.
+    Если передан qb_client (например, клиент StatefulAgent), используется его сессия вместо новой авторизации.
     """
     db: Database = flask_app.db
     logger: Logger = flask_app.logger
@@ -27,11 +33,12 @@ def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash:
     profile_id = series['parser_profile_id']
     engine = RuleEngine(db, logger)
     formatter = FilenameFormatter(logger)
-    auth_manager = AuthManager(db, logger)
-    qb_client = QBittorrentClient(auth_manager, db, logger)
+    if qb_client is None:
+        qb_client = get_qbittorrent_client(db, logger, db.get_torrent_instances_by_hashes([qb_hash]).get(qb_hash))
     
-    # Получаем список файлов из qBittorrent
-    files_in_qbit = qb_client.get_torrent_files_by_hash(qb_hash)
+    # Получаем список файлов из qBittorrent (с индексами - они нужны для приоритетов файлов)
+    files_info = qb_client.get_torrent_files(qb_hash)
+    files_in_qbit = [f['name'] for f in files_info] if files_info else None
     if not files_in_qbit:
         logger.warning("renaming_processor", f"Не удалось получить список файлов из qBittorrent для хеша {qb_hash[:8]}.")
         return
@@ -43,46 +50,54 @@ def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash:
         return
     
     # Получаем файлы торрента из базы данных
-    files_in_db_map = {f['original_path']: f for f in db.get_torrent_files_for_torrent(torrent_db_entry['id'])}
+    torrent_file_records = db.get_torrent_files_for_torrent(torrent_db_entry['id'])
+    # Записи 'inherited' перенесены сканером из замененного rolling-торрента: это не файлы текущего торрента
+    inherited_records = [f for f in torrent_file_records if f['status'] == 'inherited']
+    files_in_db_map = {f['original_path']: f for f in torrent_file_records if f['status'] != 'inherited'}
+    records_by_current_path = {(r.get('renamed_path') or r['original_path']): r for r in files_in_db_map.values()}
     
-    # Обрабатываем каждый файл
+    # Отбираем видеофайлы
     video_extensions = ['.mkv', '.avi', '.mp4', '.mov', '.wmv', '.webm']
-    db_files_to_save = []
-    
+    video_files = []
     for current_path in files_in_qbit:
         # Пропускаем не-видео файлы
         if not any(current_path.lower().endswith(ext) for ext in video_extensions):
             continue
-        
-        db_record = next((r for r in files_in_db_map.values() if (r.get('renamed_path') or r['original_path']) == current_path), None)
+        db_record = records_by_current_path.get(current_path)
         original_path = db_record['original_path'] if db_record else current_path
-        
-        # Извлекаем только имя файла для анализа правил, игнорируя подкаталоги
+        video_files.append((current_path, original_path))
+
+    if not video_files:
+        return True
+
+    # Все файлы обрабатываются движком правил одним пакетом (правила профиля читаются из БД один раз).
+    # Для анализа берется только имя файла, подкаталоги игнорируются.
+    processed_results = engine.process_videos(profile_id, [{'title': os.path.basename(original)} for _, original in video_files])
+
+    # Для односезонного сериала номер сезона берется из базы данных один раз для всех файлов
+    series_season_number = None
+    if series.get('season'):
+        try:
+            # Извлекаем числовое значение из строки сезона, например "s03", "S03", "season 3" и т.д.
+            season_str = str(series['season']).strip()
+            season_match = re.search(r'\d+', season_str)
+            if season_match:
+                series_season_number = int(season_match.group())
+                logger.info("renaming_processor", f"Номер сезона получен из базы данных (односезонный сериал): {series_season_number}")
+            else:
+                logger.warning("renaming_processor", f"Не удалось извлечь числовое значение сезона из строки: {series['season']}")
+        except (ValueError, TypeError):
+            logger.warning("renaming_processor", f"Не удалось преобразовать номер сезона из базы данных: {series['season']}")
+
+    # --- ЭТАП 1: ПЛАНИРОВАНИЕ ---
+    rename_plan = []
+    for (current_path, original_path), processed_result in zip(video_files, processed_results):
         file_basename = os.path.basename(original_path)
-        
-        # Обрабатываем файл через движок правил, чтобы извлечь метаданные
-        processed_result = engine.process_videos(profile_id, [{'title': file_basename}])[0]
         extracted_data = processed_result.get('result', {}).get('extracted', {})
         
-        # Получаем номер сезона из извлеченных метаданных
-        season_number = extracted_data.get('season')
-
-        # Определяем, является ли сериал многосезонным или односезонным
-        # Если в series['season'] есть значение, значит это односезонный сериал - используем этот сезон
-        # Если в series['season'] пусто, значит это многосезонный сериал - используем сезон из extracted_data
-        if series.get('season'):  # Если поле season заполнено, это односезонный сериал
-            try:
-                # Извлекаем числовое значение из строки сезона, например "s03", "S03", "season 3" и т.д.
-                season_str = str(series['season']).strip()
-                season_match = re.search(r'\d+', season_str)
-                if season_match:
-                    season_number = int(season_match.group())
-                    logger.info("renaming_processor", f"Номер сезона получен из базы данных (односезонный сериал): {season_number}")
-                else:
-                    logger.warning("renaming_processor", f"Не удалось извлечь числовое значение сезона из строки: {series['season']}")
-            except (ValueError, TypeError):
-                logger.warning("renaming_processor", f"Не удалось преобразовать номер сезона из базы данных: {series['season']}")
-        # else: для многосезонного сериала season_number остается из extracted_data
+        # Если в series['season'] есть значение, значит это односезонный сериал - используем этот сезон,
+        # иначе (многосезонный сериал) используем сезон из extracted_data
+        season_number = series_season_number if series_season_number is not None else extracted_data.get('season')
 
         if season_number is None:
             # Для многосезонных сериалов (где series['season'] пустой) сезон должен быть определен из extracted_data
@@ -108,25 +123,42 @@ def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash:
         
         # Создаем новый путь, добавив папку сезона
         new_file_path = os.path.join(season_folder_name, filename).replace("\\", "/")
-        
-        logger.info("renaming_processor", f"Переименование файла в qBittorrent: '{current_path}' -> '{new_file_path}'")
-        
-        # Переименовываем файл в qBittorrent
-        if qb_client.rename_file(qb_hash, current_path, new_file_path):
-            final_renamed_path = new_file_path
-            file_status = 'renamed'
+        rename_plan.append({
+            'current_path': current_path,
+            'original_path': original_path,
+            'new_path': new_file_path,
+            'extracted_data': extracted_data,
+            'episode_keys': _episode_keys(extracted_data, season_number),
+        })
+
+    # --- ЭТАП 2: ВЫПОЛНЕНИЕ ---
+    results = _execute_rename_plan(flask_app, qb_client, qb_hash, files_in_qbit, rename_plan, logger)
+
+    # --- ЭТАП 3: ВЫБОРОЧНАЯ ЗАГРУЗКА ---
+    skipped_paths = set()
+    if db.get_setting('rolling_selective_download', 'false') == 'true':
+        skipped_paths = _skip_known_episodes(db, qb_client, series_id, torrent_db_entry['id'], qb_hash, files_info,
+                                             rename_plan, inherited_records, series_season_number, logger)
+
+    db_files_to_save = []
+    for item in rename_plan:
+        if results.get(item['current_path']):
+            final_renamed_path = item['new_path']
+            # Пропущенные серии не скачиваются, поэтому не проверяются на диске как 'renamed'
+            file_status = 'skipped' if item['current_path'] in skipped_paths else 'renamed'
         else:
-            logger.error("renaming_processor", f"Не удалось переименовать файл в qBittorrent '{current_path}' -> '{new_file_path}'")
+            logger.error("renaming_processor", f"Не удалось переименовать файл в qBittorrent '{item['current_path']}' -> '{item['new_path']}'")
             final_renamed_path = None
             file_status = 'rename_error'
         
         db_files_to_save.append({
-            "original_path": original_path,
+            "original_path": item['original_path'],
             "renamed_path": final_renamed_path,
             "status": file_status,
-            "extracted_metadata": json.dumps(extracted_data)
+            "extracted_metadata": json.dumps(item['extracted_data'])
         })
     
+    # Сохранение заменяет и унаследованные записи 'inherited': их пути отсутствуют в текущем торренте
     if db_files_to_save:
         db.add_or_update_torrent_files(torrent_db_entry['id'], db_files_to_save)
         successful_renames = len([f for f in db_files_to_save if f['status'] == 'renamed'])
@@ -134,3 +166,142 @@ def process_and_rename_torrent_files(flask_app: Flask, series_id: int, qb_hash:
     
     return True
 
+
+
+def build_inherited_file_records(db: Database, old_torrent_db_id: int) -> List[Dict]:
+    """
+    Записи 'inherited' для нового rolling-торрента: серии, которые есть у замененного торрента
+    (переименованные и пропущенные как уже скачанные). По ним новый торрент не скачивает эти серии повторно.
+    """
+    return [{
+        'original_path': f.get('renamed_path') or f['original_path'],
+        'renamed_path': f.get('renamed_path'),
+        'status': 'inherited',
+        'extracted_metadata': f.get('extracted_metadata'),
+    } for f in db.get_torrent_files_for_torrent(old_torrent_db_id) if f['status'] in OWNED_TORRENT_FILE_STATUSES]
+
+
+def _episode_keys(extracted_data: Dict, season_number) -> set:
+    """Множество пар (сезон, серия), которые содержит файл: одна серия или диапазон."""
+    season = extracted_data.get('season', season_number)
+    if season is None:
+        return set()
+    if extracted_data.get('episode') is not None:
+        return {(season, extracted_data['episode'])}
+    start, end = extracted_data.get('start'), extracted_data.get('end')
+    if start is not None and end is not None and start <= end:
+        return {(season, episode) for episode in range(start, end + 1)}
+    return set()
+
+
+def _skip_known_episodes(db: Database, qb_client: QBittorrentClient, series_id: int, torrent_db_id: int, qb_hash: str,
+                         files_info: List[Dict], rename_plan: List[Dict], inherited_records: List[Dict],
+                         series_season_number, logger: Logger) -> set:
+    """
+    Для rolling-торрентов: серии, которые уже есть у нас (по записям TorrentFile замененного торрента
+    и других торрентов сериала), получают приоритет 0 и не скачиваются повторно.
+    Возвращает множество current_path пропущенных файлов.
+    """
+    known_records = list(inherited_records)
+    known_records.extend(f for f in db.get_torrent_files_for_series(series_id)
+                         if f['torrent_db_id'] != torrent_db_id and f['status'] in OWNED_TORRENT_FILE_STATUSES)
+    known_keys = set()
+    for record in known_records:
+        try:
+            extracted = json.loads(record.get('extracted_metadata') or '{}')
+        except (json.JSONDecodeError, TypeError):
+            continue
+        known_keys |= _episode_keys(extracted, series_season_number)
+
+    if not known_keys:
+        return set()
+
+    index_by_path = {f['name']: f['index'] for f in files_info}
+    skipped = [item for item in rename_plan if item['episode_keys'] and item['episode_keys'] <= known_keys]
+    if not skipped:
+        return set()
+
+    indexes = [index_by_path[item['current_path']] for item in skipped if item['current_path'] in index_by_path]
+    if not qb_client.set_file_priority(qb_hash, indexes, 0):
+        logger.warning("renaming_processor", f"Не удалось снять с загрузки уже имеющиеся серии в торренте {qb_hash[:8]}. Торрент будет скачан целиком.")
+        return set()
+
+    logger.info("renaming_processor", f"Торрент {qb_hash[:8]}: {len(skipped)} из {len(rename_plan)} серий уже есть, они не будут скачиваться.")
+    return {item['current_path'] for item in skipped}
+
+
+def _plan_folder_renames(files_in_qbit: List[str], rename_plan: List[Dict]) -> Dict[str, str]:
+    """
+    Находит каталоги, которые целиком переносятся в новый каталог без изменения имен файлов.
+    Такие каталоги переименовываются одним запросом renameFolder вместо запроса на каждый файл.
+    Возвращает словарь {старый_каталог: новый_каталог}.
+    """
+    all_dirs = {}
+    for path in files_in_qbit:
+        all_dirs.setdefault(os.path.dirname(path), []).append(path)
+
+    plan_by_dir = {}
+    for item in rename_plan:
+        plan_by_dir.setdefault(os.path.dirname(item['current_path']), []).append(item)
+
+    folder_renames = {}
+    for source_dir, items in plan_by_dir.items():
+        if not source_dir:
+            continue
+        # В каталоге не должно быть вложенных папок и файлов вне плана (например, субтитров)
+        has_nested = any(d != source_dir and d.startswith(source_dir + '/') for d in all_dirs)
+        if has_nested or len(all_dirs.get(source_dir, [])) != len(items):
+            continue
+        target_dirs = {os.path.dirname(i['new_path']) for i in items}
+        if len(target_dirs) != 1:
+            continue
+        target_dir = target_dirs.pop()
+        if not target_dir or target_dir == source_dir:
+            continue
+        if any(os.path.basename(i['current_path']) != os.path.basename(i['new_path']) for i in items):
+            continue
+        # Целевой каталог не должен уже существовать в торренте
+        if any(d == target_dir or d.startswith(target_dir + '/') for d in all_dirs):
+            continue
+        if target_dir in folder_renames.values():
+            continue
+        folder_renames[source_dir] = target_dir
+    return folder_renames
+
+
+def _execute_rename_plan(flask_app: Flask, qb_client: QBittorrentClient, qb_hash: str, files_in_qbit: List[str], rename_plan: List[Dict], logger: Logger) -> Dict[str, bool]:
+    """Выполняет план переименования: сначала целые каталоги, затем оставшиеся файлы параллельно."""
+    results = {}
+
+    folder_renames = _plan_folder_renames(files_in_qbit, rename_plan)
+    for source_dir, target_dir in folder_renames.items():
+        logger.info("renaming_processor", f"Переименование каталога в qBittorrent: '{source_dir}' -> '{target_dir}'")
+        success = qb_client.rename_folder(qb_hash, source_dir, target_dir)
+        for item in rename_plan:
+            if os.path.dirname(item['current_path']) == source_dir:
+                results[item['current_path']] = success
+
+    pending = []
+    for item in rename_plan:
+        if item['current_path'] in results:
+            continue
+        if item['current_path'] == item['new_path']:
+            # Файл уже имеет целевое имя
+            results[item['current_path']] = True
+            continue
+        pending.append(item)
+
+    if not pending:
+        return results
+
+    def _rename(item):
+        logger.info("renaming_processor", f"Переименование файла в qBittorrent: '{item['current_path']}' -> '{item['new_path']}'")
+        # Рабочие потоки не наследуют контекст приложения, а клиент qBittorrent читает current_app
+        with flask_app.app_context():
+            return item['current_path'], qb_client.rename_file(qb_hash, item['current_path'], item['new_path'])
+
+    with ThreadPoolExecutor(max_workers=min(RENAME_CONCURRENCY, len(pending)), thread_name_prefix='rename_worker') as executor:
+        for current_path, success in executor.map(_rename, pending):
+            results[current_path] = success
+
+    return results
@@ -32,6 +32,7 @@ class Series(Base):
     ignored_seasons = Column(Text, default='[]')
     vk_search_mode = Column(Text, default='search', nullable=False)
     vk_quality_priority = Column(Text, nullable=True)
+    vk_scan_state = Column(Text, default='{}') # JSON: самые новые известные видео канала и время последнего полного сканирования
     
     statuses = relationship("SeriesStatus", back_populates="series", uselist=False, cascade="all, delete-orphan")
 
@@ -64,6 +65,8 @@ class Torrent(Base):
     episodes = Column(Text)
     is_active = Column(Boolean, default=True)
     qb_hash = Column(Text)
+    # Экземпляр qBittorrent (auth_type из таблицы auth), которому принадлежит торрент; NULL - основной
+    qb_instance = Column(Text, nullable=True)
     series = relationship("Series")
     files = relationship("TorrentFile", back_populates="torrent", cascade="all, delete-orphan")
 
@@ -211,6 +214,10 @@ class TorrentFile(Base):
 
     torrent = relationship("Torrent", back_populates="files")
 
+# Статусы TorrentFile, при которых серия считается имеющейся: 'skipped' - серия rolling-торрента
+# снята с загрузки, потому что уже скачана раньше
+OWNED_TORRENT_FILE_STATUSES = ('renamed', 'skipped')
+
 class RelocationTask(Base):
     __tablename__ = 'relocation_tasks'
     id = Column(Integer, primary_key=True)
@@ -248,6 +255,7 @@ class Tracker(Base):
     parser_class = Column(Text, nullable=False) # Имя класса-парсера
     auth_type = Column(Text, default='none', nullable=False)
     ui_features = Column(Text, default='{}') # JSON-объект с флагами для UI
+    mirror_health = Column(Text, default='{}') # JSON: предпочитаемое зеркало и статистика исходов по каждому зеркалу
 
 class SeriesTMDB(Base):
     __tablename__ = 'series_tmdb_mappings'
@@ -259,4 +267,27 @@ class SeriesTMDB(Base):
     poster_path = Column(Text, nullable=True)
     series_name = Column(Text, nullable=True) # Название из TMDB для сверки
     
-    series = relationship("Series", backref=backref("tmdb_info", uselist=False, cascade="all, delete-orphan"))
\ No newline at end of file
+    series = relationship("Series", backref=backref("tmdb_info", uselist=False, cascade="all, delete-orphan"))
+
+class PageCache(Base):
+    __tablename__ = 'page_cache'
+    url = Column(Text, primary_key=True)
+    etag = Column(Text, nullable=True)
+    last_modified = Column(Text, nullable=True)
+    content_hash = Column(Text, nullable=True) # sha1 нормализованного HTML
+    known_key = Column(Text, nullable=True) # Отпечаток известных торрентов, с которыми был получен результат
+    result = Column(Text, nullable=True) # JSON результата парсера
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class TrackerSession(Base):
+    __tablename__ = 'tracker_sessions'
+    key = Column(Text, primary_key=True) # '<auth_type>:<домен>'
+    auth_type = Column(Text, nullable=False)
+    domain = Column(Text, nullable=False)
+    payload = Column(Text, nullable=True) # Зашифрованные cookies и отпечаток учетных данных (utils/session_store)
+    is_valid = Column(Boolean, default=True, nullable=False)
+    logged_in_at = Column(DateTime, nullable=True)
+    last_used_at = Column(DateTime, nullable=True)
+    invalidated_at = Column(DateTime, nullable=True)
+    invalid_reason = Column(Text, nullable=True)
+    login_count = Column(Integer, default=0, nullable=False)
@@ -1,13 +1,81 @@
-from .anilibria_parser import AnilibriaParser
-from .anilibria_tv_parser import AnilibriaTvParser
-from .astar_parser import AstarParser
-from .kinozal_parser import KinozalParser
-from .rutracker_parser import RuTrackerParser
+import importlib
+import threading
+
+# Реестр парсеров по значению Tracker.parser_class. Модули импортируются при первом обращении:
+# иначе каждый воркер при старте загружает playwright, cloudscraper и bs4/lxml, даже если они не нужны.
+PARSER_MODULES = {
+    "AnilibriaParser": "parsers.anilibria_parser",
+    "AnilibriaTvParser": "parsers.anilibria_tv_parser",
+    "AstarParser": "parsers.astar_parser",
+    "KinozalParser": "parsers.kinozal_parser",
+    "RuTrackerParser": "parsers.rutracker_parser",
+}
+
+# Парсеры, которым нужна авторизованная сессия трекера из AuthManager
+AUTH_PARSERS = {"KinozalParser", "RuTrackerParser"}
+
+# Вид ошибки в результате парсера (ключ 'error_kind'). Сбоем зеркала считается только ERROR_TRANSPORT:
+# ошибка разбора доступной страницы говорит об изменившейся разметке, а не о недоступности зеркала.
+ERROR_TRANSPORT = "transport"
+ERROR_PARSE = "parse"
+ERROR_AUTH = "auth"
+
+_parser_classes = {}
+_parser_classes_lock = threading.Lock()
+
+
+def get_parser_class(parser_class_name: str):
+    """Возвращает класс парсера, импортируя его модуль при первом обращении. None - парсер неизвестен."""
+    parser_class = _parser_classes.get(parser_class_name)
+    if parser_class is not None:
+        return parser_class
+    module_name = PARSER_MODULES.get(parser_class_name)
+    if not module_name:
+        return None
+    with _parser_classes_lock:
+        if parser_class_name not in _parser_classes:
+            _parser_classes[parser_class_name] = getattr(importlib.import_module(module_name), parser_class_name)
+        return _parser_classes[parser_class_name]
+
+
+def create_parser(parser_class_name: str, auth_manager, db, logger):
+    """Создает парсер по имени класса из таблицы трекеров. None - парсер неизвестен."""
+    parser_class = get_parser_class(parser_class_name)
+    if parser_class is None:
+        return None
+    if parser_class_name in AUTH_PARSERS:
+        return parser_class(auth_manager, db, logger)
+    return parser_class(db, logger)
+
+
+def is_transport_error(error: Exception) -> bool:
+    """Таймаут, сбой соединения или ответ 5xx: страница не получена по вине сети или зеркала."""
+    from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError, Timeout
+    if isinstance(error, (RequestsConnectionError, Timeout)):
+        return True
+    if isinstance(error, HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    return False
+
+
+def __getattr__(name):
+    # Совместимость с 'from parsers import KinozalParser'
+    parser_class = get_parser_class(name)
+    if parser_class is None:
+        raise AttributeError(f"module 'parsers' has no attribute '{name}'")
+    return parser_class
+
 
 __all__ = [
     "AnilibriaParser",
-    "AnilibriaTvParser", 
+    "AnilibriaTvParser",
     "AstarParser",
     "KinozalParser",
-    "RuTrackerParser"
-]
\ No newline at end of file
+    "RuTrackerParser",
+    "get_parser_class",
+    "create_parser",
+    "is_transport_error",
+    "ERROR_TRANSPORT",
+    "ERROR_PARSE",
+    "ERROR_AUTH",
+]
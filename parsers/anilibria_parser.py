@@ -1,18 +1,63 @@
 import time
 import re
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+from lxml import etree
 from db import Database
 from logger import Logger
 from typing import Optional, Dict, List
 from flask import current_app as app
 import os
 from datetime import datetime, timezone, timedelta
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from browser_pool import get_browser_pool
+from utils.rate_limiter import get_rate_limiter
+from utils.page_cache import PageCache
+from parsers import ERROR_PARSE, ERROR_TRANSPORT
+from parsers.html_extract import parse_html, has_class, has_exact_class, node_text, first
+
+_RU_TITLE = etree.XPath(f"//div[{has_class('text-autosize')}]")
+_EN_TITLE = etree.XPath(f"//div[{has_class('text-grey-darken-2')}]")
+_TORRENT_BLOCKS = etree.XPath(f"//div[{has_class('v-list-item')}]")
+_EPISODES_DIV = etree.XPath(f".//div[{has_class('fz-90')}]")
+_MAGNET_LINK = etree.XPath(".//a[starts-with(@href, 'magnet:')]")
+_INFO_DIV = etree.XPath(f".//div[{has_exact_class('text-grey-darken-2 fz-75')}]")
+
+
+def extract_anilibria_page(html_content: str) -> Dict:
+    """
+    Извлекает названия релиза и для каждого блока торрента - серии, magnet-ссылку и строку 'дата • качество'.
+    Скомпилированные XPath по дереву lxml вместо BeautifulSoup с html.parser.
+    """
+    root = parse_html(html_content)
+    ru_title_element = first(_RU_TITLE(root))
+    en_title_element = first(_EN_TITLE(root))
+
+    blocks = []
+    for block in _TORRENT_BLOCKS(root):
+        episodes_element = first(_EPISODES_DIV(block))
+        magnet_link_tag = first(_MAGNET_LINK(block))
+        info_element = first(_INFO_DIV(block))
+        blocks.append({
+            "episodes": node_text(episodes_element).strip() if episodes_element is not None else "N/A",
+            "magnet_link": magnet_link_tag.get('href') if magnet_link_tag is not None else None,
+            "info_string": node_text(info_element).strip() if info_element is not None else None,
+            "text": node_text(block)[:150],
+        })
+
+    return {
+        "ru_title": node_text(ru_title_element).strip() if ru_title_element is not None else "Название не найдено",
+        "en_title": node_text(en_title_element).strip() if en_title_element is not None else "Eng title not found",
+        "blocks": blocks,
+    }
+
 
 class AnilibriaParser:
     MAX_RETRIES = 2
     RETRY_DELAY = 5
+    # threading.Event от сканера: выставляется, когда другое зеркало уже вернуло результат
+    cancel_event = None
+    # Вид последней ошибки _fetch_page_source: страница не загрузилась или на ней нет ожидаемых элементов
+    fetch_error_kind = ERROR_TRANSPORT
     DUMP_DIR = "parser_dumps"
     TIMEOUT = 30000 
 
@@ -76,24 +121,30 @@ class AnilibriaParser:
             self.logger.error(f"anilibria_parser - Не удалось сохранить HTML-дамп: {e}", exc_info=True)
 
     def _fetch_page_source(self, url: str) -> Optional[str]:
+        def load_page(context):
+            page = context.new_page()
+            response = page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
+            # Зеркало ответило страницей: дальнейшие таймауты ожидания элементов - ошибка разбора, а не сбой зеркала
+            page_state['loaded'] = response is None or response.status < 500
+            page.wait_for_selector('div.v-list-item', state='visible', timeout=self.TIMEOUT)
+            return page.content()
+
+        context_options = {'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0'}
+        page_state = {'loaded': False}
         for attempt in range(self.MAX_RETRIES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return None
+            page_state['loaded'] = False
             try:
-                with sync_playwright() as p:
-                    browser = p.firefox.launch(headless=True)
-                    context = browser.new_context(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0')
-                    page = context.new_page()
-                    page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
-                    
-                    page.wait_for_selector('div.v-list-item', state='visible', timeout=self.TIMEOUT)
-                    
-                    html_content = page.content()
-                    browser.close()
-
-                    if app.debug_manager.is_debug_enabled('save_html_anilibria'):
-                        self._save_html_dump(html_content)
-
-                    return html_content
+                get_rate_limiter(self.db, self.logger).acquire(url)
+                html_content = get_browser_pool(self.db, self.logger).run(load_page, context_options)
+
+                if app.debug_manager.is_debug_enabled('save_html_anilibria'):
+                    self._save_html_dump(html_content)
+
+                return html_content
             except (PlaywrightTimeoutError, Exception) as e:
+                self.fetch_error_kind = ERROR_PARSE if page_state['loaded'] else ERROR_TRANSPORT
                 self.logger.warning(f"anilibria_parser - Ошибка Playwright при запросе к {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}")
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
@@ -106,42 +157,44 @@ class AnilibriaParser:
 
         match = re.match(r"(https://[^/]+/(?:release|anime/releases/release)/[^/]+)", original_url)
         if not match:
-            return {"source": "aniliberty.top", "title": {"ru": None, "en": None}, "torrents": [], "error": "Некорректный URL релиза"}
+            return {"source": "aniliberty.top", "title": {"ru": None, "en": None}, "torrents": [], "error": "Некорректный URL релиза", "error_kind": ERROR_PARSE}
         
         base_release_url = match.group(1)
         url_to_fetch = f"{base_release_url}/torrents"
 
         html_content = self._fetch_page_source(url_to_fetch)
         if not html_content:
-            return {"source": "aniliberty.top", "title": {"ru": None, "en": None}, "torrents": [], "error": f"Не удалось загрузить страницу {url_to_fetch}"}
+            return {"source": "aniliberty.top", "title": {"ru": None, "en": None}, "torrents": [], "error": f"Не удалось загрузить страницу {url_to_fetch}", "error_kind": self.fetch_error_kind}
+
+        # Результат этого парсера не зависит от уже известных торрентов - отпечаток у всех сканирований общий
+        page_cache = PageCache(self.db, self.logger, "anilibria_parser", enabled=not debug_force_replace)
+        known_key = page_cache.known_key(None)
+        cached_result = page_cache.lookup(url_to_fetch, known_key, html_content)
+        if cached_result:
+            return cached_result
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+        page = extract_anilibria_page(html_content)
 
-        ru_title_element = soup.find('div', class_='text-autosize')
-        ru_title = ru_title_element.text.strip() if ru_title_element else "Название не найдено"
-        en_title_element = soup.find('div', class_='text-grey-darken-2')
-        en_title = en_title_element.text.strip() if en_title_element else "Eng title not found"
+        ru_title = page['ru_title']
+        en_title = page['en_title']
         
         torrents = []
-        torrent_blocks = soup.find_all('div', class_='v-list-item')
+        torrent_blocks = page['blocks']
         if not torrent_blocks:
-            return {"source": urlparse(url_to_fetch).netloc, "title": {"ru": ru_title, "en": en_title}, "torrents": [], "error": "Не найдены блоки торрентов"}
+            return {"source": urlparse(url_to_fetch).netloc, "title": {"ru": ru_title, "en": en_title}, "torrents": [], "error": "Не найдены блоки торрентов", "error_kind": ERROR_PARSE}
         
         for index, block in enumerate(torrent_blocks):
             try:
-                episodes_element = block.find('div', class_='fz-90')
-                episodes = episodes_element.text.strip() if episodes_element else "N/A"
+                episodes = block['episodes']
                 
-                magnet_link_tag = block.find('a', href=re.compile(r'^magnet:'))
-                if not magnet_link_tag:
+                magnet_link = block['magnet_link']
+                if not magnet_link:
                     continue
-                magnet_link = magnet_link_tag['href']
                 
-                info_element = block.find('div', class_='text-grey-darken-2 fz-75')
-                if not info_element:
+                info_string = block['info_string']
+                if info_string is None:
                     continue
                 
-                info_string = info_element.text.strip()
                 parts = [p.strip() for p in info_string.split('•')]
                 
                 date_raw = parts[0]
@@ -157,14 +210,14 @@ class AnilibriaParser:
                 }
                 torrents.append(torrent_info)
             except Exception as e:
-                self.logger.warning(f"Пропущен один блок торрента из-за ошибки парсинга: {e}. Блок: {block.text[:150]}...")
+                self.logger.warning(f"Пропущен один блок торрента из-за ошибки парсинга: {e}. Блок: {block['text']}...")
                 continue
         
         if app.debug_manager.is_debug_enabled('anilibria_parser_debug'):
             self.logger.debug("anilibria_parser_debug", f"FINAL TORRENTS PAYLOAD: {torrents}")
         
-        return {
+        return page_cache.store(url_to_fetch, known_key, html_content, {
             "source": urlparse(url_to_fetch).netloc,
             "title": {"ru": ru_title, "en": en_title},
             "torrents": torrents
-        }
\ No newline at end of file
+        })
\ No newline at end of file
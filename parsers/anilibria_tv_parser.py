@@ -2,14 +2,27 @@ import re
 import time
 import os
 from typing import Dict, Optional, List
-from bs4 import BeautifulSoup
+from lxml import etree
 from datetime import datetime, timezone
 from db import Database
 from logger import Logger
 from flask import current_app as app
 from urllib.parse import urlparse
 import hashlib
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from browser_pool import get_browser_pool
+from utils.rate_limiter import get_rate_limiter
+from utils.page_cache import PageCache
+from parsers import ERROR_PARSE, ERROR_TRANSPORT
+from parsers.html_extract import parse_html, has_class, node_text_stripped, first
+
+_TITLE = etree.XPath('//title')
+_TORRENT_TABLE = etree.XPath("//table[@id='publicTorrentTable']")
+_ROWS = etree.XPath('.//tr')
+_ROW_TD = etree.XPath('.//td')
+_DOWNLOAD_LINK = etree.XPath(f".//a[{has_class('torrent-download-link')}]")
+_DATETIME_TD = etree.XPath(f".//td[{has_class('torrent-datetime')}]")
+_INFO_TD = etree.XPath(f".//td[{has_class('torrentcol1')}]")
 
 def generate_anilibria_tv_torrent_id(link, date_time):
     """Вспомогательная функция для генерации ID, чтобы избежать дублирования."""
@@ -28,10 +41,43 @@ def extract_en_title(full_title: str) -> str:
     else:
         return min(latin_candidates, key=len)
 
+def extract_anilibria_tv_page(html_content: str) -> Optional[Dict]:
+    """
+    Извлекает заголовок и строки таблицы торрентов (ссылка, дата ISO, строка серий и качества).
+    None - таблицы на странице нет. Скомпилированные XPath по дереву lxml вместо полного дерева BeautifulSoup.
+    """
+    root = parse_html(html_content)
+    title_tag = first(_TITLE(root))
+    torrent_table = first(_TORRENT_TABLE(root))
+    if torrent_table is None:
+        return None
+
+    rows = []
+    for row in _ROWS(torrent_table):
+        if not _ROW_TD(row):
+            continue
+        link_tag = first(_DOWNLOAD_LINK(row))
+        if link_tag is None or link_tag.get('href') is None:
+            continue
+        date_td = first(_DATETIME_TD(row))
+        info_td = first(_INFO_TD(row))
+        rows.append({
+            "href": link_tag.get('href'),
+            "date_iso": date_td.get('data-datetime') if date_td is not None else None,
+            "info_text": node_text_stripped(info_td) if info_td is not None else '',
+        })
+
+    return {"title": node_text_stripped(title_tag) if title_tag is not None else "", "rows": rows}
+
+
 class AnilibriaTvParser:
     # --- ИЗМЕНЕНИЕ: Добавлены константы для Playwright ---
     MAX_RETRIES = 2
     RETRY_DELAY = 5
+    # threading.Event от сканера: выставляется, когда другое зеркало уже вернуло результат
+    cancel_event = None
+    # Вид последней ошибки _fetch_page_source: страница не загрузилась или на ней нет ожидаемых элементов
+    fetch_error_kind = ERROR_TRANSPORT
     TIMEOUT = 45000  # Увеличено время ожидания для прохождения JS-проверки
 
     def __init__(self, db: Database, logger: Logger):
@@ -65,29 +111,34 @@ class AnilibriaTvParser:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36'
         }
+        def load_page(context):
+            page = context.new_page()
+            response = page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
+            # Зеркало ответило страницей: дальнейшие таймауты ожидания элементов - ошибка разбора, а не сбой зеркала
+            page_state['loaded'] = response is None or response.status < 500
+
+            # Ждем, пока JS-челлендж не будет пройден и не появится таблица с торрентами
+            self.logger.info("anilibria_tv_parser", "Ожидаем появления таблицы с торрентами...")
+            page.wait_for_selector('table#publicTorrentTable', state='visible', timeout=self.TIMEOUT)
+            self.logger.info("anilibria_tv_parser", "Таблица найдена, страница загружена.")
+            return page.content()
+
+        page_state = {'loaded': False}
         for attempt in range(self.MAX_RETRIES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return None
+            page_state['loaded'] = False
             try:
-                with sync_playwright() as p:
-                    browser = p.firefox.launch(headless=True)
-                    context = browser.new_context(user_agent=headers['User-Agent'])
-                    page = context.new_page()
-                    
-                    self.logger.info("anilibria_tv_parser", f"Переход на страницу {url} (попытка {attempt + 1}). Ожидание JS-проверки...")
-                    page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
-                    
-                    # Ждем, пока JS-челлендж не будет пройден и не появится таблица с торрентами
-                    self.logger.info("anilibria_tv_parser", "Ожидаем появления таблицы с торрентами...")
-                    page.wait_for_selector('table#publicTorrentTable', state='visible', timeout=self.TIMEOUT)
-                    self.logger.info("anilibria_tv_parser", "Таблица найдена, страница загружена.")
-                    
-                    html_content = page.content()
-                    browser.close()
-
-                    if app.debug_manager.is_debug_enabled('save_html_anilibria_tv'):
-                        self._save_html_dump(html_content)
-
-                    return html_content
+                self.logger.info("anilibria_tv_parser", f"Переход на страницу {url} (попытка {attempt + 1}). Ожидание JS-проверки...")
+                get_rate_limiter(self.db, self.logger).acquire(url)
+                html_content = get_browser_pool(self.db, self.logger).run(load_page, {'user_agent': headers['User-Agent']})
+
+                if app.debug_manager.is_debug_enabled('save_html_anilibria_tv'):
+                    self._save_html_dump(html_content)
+
+                return html_content
             except (PlaywrightTimeoutError, Exception) as e:
+                self.fetch_error_kind = ERROR_PARSE if page_state['loaded'] else ERROR_TRANSPORT
                 self.logger.warning("anilibria_tv_parser", f"Ошибка Playwright при запросе к {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}")
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
@@ -99,36 +150,32 @@ class AnilibriaTvParser:
         self.logger.info("anilibria_tv_parser", f"Начало парсинга {url}")
         html_content = self._fetch_page_source(url)
         if not html_content:
-            return {"error": f"Не удалось загрузить страницу {url}"}
+            return {"error": f"Не удалось загрузить страницу {url}", "error_kind": self.fetch_error_kind}
 
-        soup = BeautifulSoup(html_content, 'lxml')
+        page_cache = PageCache(self.db, self.logger, "anilibria_tv_parser", enabled=not debug_force_replace)
+        known_key = page_cache.known_key(last_known_torrents)
+        cached_result = page_cache.lookup(url, known_key, html_content)
+        if cached_result:
+            return cached_result
+
+        page = extract_anilibria_tv_page(html_content)
         parsed_url = urlparse(url)
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
-        title_tag = soup.find('title')
-        full_title = title_tag.get_text(strip=True) if title_tag else ""
+        torrents = []
+        if page is None:
+            return {"error": "Не найдена таблица с торрентами на странице.", "error_kind": ERROR_PARSE}
+
+        full_title = page['title']
         title_ru = full_title
         title_en = extract_en_title(full_title)
 
-        torrents = []
-        torrent_table = soup.find('table', id='publicTorrentTable')
-        if not torrent_table:
-            return {"error": "Не найдена таблица с торрентами на странице."}
-
         known_torrents_dict = {t['torrent_id']: t for t in last_known_torrents} if last_known_torrents else {}
-        rows = torrent_table.find_all('tr')
-
-        for row in rows:
-            if not row.find('td'): continue
 
-            link_tag = row.find('a', class_='torrent-download-link')
-            if not (link_tag and link_tag.has_attr('href')):
-                continue
-            
-            link = base_url + link_tag['href']
+        for row in page['rows']:
+            link = base_url + row['href']
 
-            date_td = row.find('td', class_='torrent-datetime')
-            date_iso = date_td['data-datetime'] if date_td and date_td.has_attr('data-datetime') else None
+            date_iso = row['date_iso']
             if date_iso:
                 self.logger.info("RAW_DATE_DEBUG", f"[Anilibria.TV] Raw date string found: '{date_iso}'")
             date_time = self._normalize_date(date_iso) if date_iso else None
@@ -139,8 +186,7 @@ class AnilibriaTvParser:
             if temp_torrent_id in known_torrents_dict:
                 link_to_add = None
 
-            info_td = row.find('td', class_='torrentcol1')
-            info_text = info_td.get_text(strip=True) if info_td else ''
+            info_text = row['info_text']
             
             episodes, quality = None, None
             match = re.match(r'(.+?)\s*\[(.+)\]', info_text)
@@ -160,8 +206,8 @@ class AnilibriaTvParser:
             
         self.logger.info("anilibria_tv_parser", f"Найдено и обработано {len(torrents)} торрентов.")
         
-        return {
+        return page_cache.store(url, known_key, html_content, {
             "source": parsed_url.netloc,
             "title": {"ru": title_ru, "en": title_en},
             "torrents": torrents
-        }
\ No newline at end of file
+        })
\ No newline at end of file
@@ -1,8 +1,8 @@
 # Файл: astar_parser.py
 
 from typing import Dict, Optional, List
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from lxml import etree
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from datetime import datetime, timezone
 import re
 from db import Database
@@ -12,16 +12,63 @@ from flask import current_app as app
 from urllib.parse import urlparse
 import hashlib
 import os
+from browser_pool import get_browser_pool
+from utils.rate_limiter import get_rate_limiter
+from utils.page_cache import PageCache
+from parsers import ERROR_PARSE, ERROR_TRANSPORT
+from parsers.html_extract import parse_html, has_class, node_text, first
+
+_TITLE = etree.XPath('//h1')
+_TORRENT_ITEMS = etree.XPath(f"//div[{has_class('torrent')}]")
+_TORRENT_LINKS = etree.XPath(".//a[contains(@href, '/engine/gettorrent.php?id=')]")
+_DATE_DIVS = etree.XPath(f".//div[{has_class('bord_a1')}]")
+_EPISODE_DIV = etree.XPath(f".//div[{has_class('info_d1')}]")
+_TORRENT_HREF_RE = re.compile(r'/engine/gettorrent\.php\?id=\d+')
 
 def generate_astar_torrent_id(link, date_time):
     """Вспомогательная функция для генерации ID, чтобы избежать дублирования."""
     unique_string = f"{link}{date_time or ''}"
     return hashlib.md5(unique_string.encode()).hexdigest()[:16]
 
+def extract_astar_page(html_content: str) -> Dict:
+    """
+    Извлекает заголовок и для каждого блока торрента - ссылку, исходную дату и строку серий.
+    Скомпилированные XPath по дереву lxml вместо BeautifulSoup с html.parser и find_all по каждому блоку.
+    """
+    root = parse_html(html_content)
+    title_tag = first(_TITLE(root))
+
+    items = []
+    for item in _TORRENT_ITEMS(root):
+        href = next((a.get('href') for a in _TORRENT_LINKS(item) if _TORRENT_HREF_RE.search(a.get('href'))), None)
+        if not href:
+            continue
+
+        date_raw = None
+        for div in _DATE_DIVS(item):
+            date_match = re.search(r'Дата: (\d{2}-\d{2}-\d{4})', re.sub(r'\s+', ' ', node_text(div).strip()))
+            if date_match:
+                date_raw = date_match.group(1)
+                break
+
+        episode_div = first(_EPISODE_DIV(item))
+        items.append({
+            "href": href,
+            "date_raw": date_raw,
+            "episode_text": node_text(episode_div).strip() if episode_div is not None else None,
+        })
+
+    return {"title": node_text(title_tag).strip() if title_tag is not None else None, "items": items}
+
+
 class AstarParser:
     TIMEOUT = 10000 
     MAX_RETRIES = 3 
     RETRY_DELAY = 2
+    # threading.Event от сканера: выставляется, когда другое зеркало уже вернуло результат
+    cancel_event = None
+    # Вид последней ошибки _fetch_page_source: страница не загрузилась или на ней нет ожидаемых элементов
+    fetch_error_kind = ERROR_TRANSPORT
 
     def __init__(self, db: Database, logger: Logger):
         self.db = db
@@ -51,43 +98,49 @@ class AstarParser:
     def _fetch_page_source(self, url: str) -> Optional[str]:
         if app.debug_manager.is_debug_enabled('astar_parser'):
             self.logger.debug("astar_parser", f"Запрос страницы: {url}")
-        
+        # Флаг читается здесь: функция загрузки выполняется в потоке пула, без контекста приложения
+        debug_enabled = app.debug_manager.is_debug_enabled('astar_parser')
+
+        # Выполняется в потоке пула браузеров: контекст изолирован и закрывается пулом, браузер переиспользуется
+        def load_page(context):
+            page = context.new_page()
+            if debug_enabled:
+                self.logger.debug("astar_parser", f"Переход на URL: {url}")
+            response = page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
+            # Зеркало ответило страницей: дальнейшие таймауты ожидания элементов - ошибка разбора, а не сбой зеркала
+            page_state['loaded'] = response is None or response.status < 500
+
+            if debug_enabled:
+                self.logger.debug("astar_parser", "Ожидаем кнопку 'Все торренты'...")
+            page.wait_for_selector('span#torrent_all', state='visible', timeout=self.TIMEOUT)
+            page.click('span#torrent_all')
+
+            if debug_enabled:
+                self.logger.debug("astar_parser", "Ожидаем появления списка торрентов...")
+            page.wait_for_selector('div.list_torrent', state='visible', timeout=self.TIMEOUT)
+            return page.content()
+
+        context_options = {
+            'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
+            'viewport': {"width": 1920, "height": 1080},
+            'ignore_https_errors': True,
+        }
+        page_state = {'loaded': False}
         for attempt in range(self.MAX_RETRIES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return None
+            page_state['loaded'] = False
             try:
-                with sync_playwright() as p:
-                    if app.debug_manager.is_debug_enabled('astar_parser'):
-                        self.logger.debug("astar_parser", "Запуск браузера Firefox...")
-                    browser = p.firefox.launch(headless=True)
-                    
-                    context = browser.new_context(
-                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
-                        viewport={"width": 1920, "height": 1080},
-                        ignore_https_errors=True
-                    )
-                    page = context.new_page()
-                    
-                    if app.debug_manager.is_debug_enabled('astar_parser'):
-                        self.logger.debug("astar_parser", f"Переход на URL: {url}")
-                    page.goto(url, timeout=self.TIMEOUT, wait_until="domcontentloaded")
-                    
-                    if app.debug_manager.is_debug_enabled('astar_parser'):
-                        self.logger.debug("astar_parser", "Ожидаем кнопку 'Все торренты'...")
-                    page.wait_for_selector('span#torrent_all', state='visible', timeout=self.TIMEOUT)
-                    page.click('span#torrent_all')
-                    
-                    if app.debug_manager.is_debug_enabled('astar_parser'):
-                        self.logger.debug("astar_parser", "Ожидаем появления списка торрентов...")
-                    page.wait_for_selector('div.list_torrent', state='visible', timeout=self.TIMEOUT)
-                    
-                    html_content = page.content()
-                    browser.close()
-                    
-                    if app.debug_manager.is_debug_enabled('save_html_astar'):
-                        self._save_html_dump(html_content)
-                    
-                    self.logger.info("astar_parser", f"Страница {url} успешно загружена (попытка {attempt + 1}).")
-                    return html_content
+                get_rate_limiter(self.db, self.logger).acquire(url)
+                html_content = get_browser_pool(self.db, self.logger).run(load_page, context_options)
+
+                if app.debug_manager.is_debug_enabled('save_html_astar'):
+                    self._save_html_dump(html_content)
+
+                self.logger.info("astar_parser", f"Страница {url} успешно загружена (попытка {attempt + 1}).")
+                return html_content
             except (PlaywrightTimeoutError, Exception) as e:
+                self.fetch_error_kind = ERROR_PARSE if page_state['loaded'] else ERROR_TRANSPORT
                 error_message = str(e).splitlines()[0] if isinstance(e, PlaywrightTimeoutError) else str(e)
                 self.logger.warning("astar_parser", f"Ошибка получения страницы {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {error_message}")
                 if attempt < self.MAX_RETRIES - 1:
@@ -102,35 +155,32 @@ class AstarParser:
         if not html_content:
             return {
                 "source": "astar.bz", "title": {"ru": None, "en": None},
-                "torrents": [], "error": "Не удалось загрузить страницу"
+                "torrents": [], "error": "Не удалось загрузить страницу", "error_kind": self.fetch_error_kind
             }
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Страница отрендерена браузером, условный запрос невозможен, но неизменившийся HTML не разбирается повторно
+        page_cache = PageCache(self.db, self.logger, "astar_parser", enabled=not debug_force_replace)
+        known_key = page_cache.known_key(last_known_torrents)
+        cached_result = page_cache.lookup(url, known_key, html_content)
+        if cached_result:
+            return cached_result
+
+        page = extract_astar_page(html_content)
         parsed_url = urlparse(url)
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
-        title_tag = soup.find('h1')
-        title_ru = title_tag.text.strip() if title_tag else None
+        title_ru = page['title']
         
         torrents = []
-        torrent_items = soup.find_all('div', class_='torrent')
-        
         known_torrents_dict = {t['torrent_id']: t for t in last_known_torrents} if last_known_torrents else {}
 
-        for item in torrent_items:
-            torrent_link_tag = item.find('a', href=re.compile(r'/engine/gettorrent\.php\?id=\d+'))
-            link = f"{base_url}{torrent_link_tag['href']}" if torrent_link_tag else None
-            if not link: continue
+        for item in page['items']:
+            link = f"{base_url}{item['href']}"
 
             date_time = None
-            date_divs = item.find_all('div', class_='bord_a1')
-            for div in date_divs:
-                date_text = re.sub(r'\s+', ' ', div.text.strip())
-                date_match = re.search(r'Дата: (\d{2}-\d{2}-\d{4})', date_text)
-                if date_match:
-                    self.logger.info("RAW_DATE_DEBUG", f"[Astar] Raw date string found: '{date_match.group(1)}'")
-                    date_time = self._normalize_date(date_match.group(1))
-                    break
+            if item['date_raw']:
+                self.logger.info("RAW_DATE_DEBUG", f"[Astar] Raw date string found: '{item['date_raw']}'")
+                date_time = self._normalize_date(item['date_raw'])
             
             temp_torrent_id = generate_astar_torrent_id(link, date_time)
 
@@ -140,8 +190,7 @@ class AstarParser:
             else:
                 link_to_add = None
             
-            episode_div = item.find('div', class_='info_d1')
-            episode_text = episode_div.text.strip() if episode_div else None
+            episode_text = item['episode_text']
             episodes, quality = None, None
             if episode_text:
                 episode_text = re.sub(r'\s*END\s*', '', episode_text).strip()
@@ -183,6 +232,6 @@ class AstarParser:
                     if torrent["episodes"] == episodes and torrent["quality"] == "one":
                         torrent["quality"] = "old"
 
-        return {
+        return page_cache.store(url, known_key, html_content, {
             "source": "astar.bz", "title": {"ru": title_ru, "en": None}, "torrents": torrents
-        }
\ No newline at end of file
+        })
\ No newline at end of file
@@ -0,0 +1,80 @@
+# Файл: parsers/html_extract.py
+
+from typing import Iterator, List, Optional
+from lxml import html as lxml_html
+
+# Содержимое этих тегов BeautifulSoup не включает в get_text(), здесь - так же
+_SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def parse_html(html_content: str):
+    """Разбирает страницу тем же парсером libxml2, что и BeautifulSoup(..., 'lxml'), но без построения дерева bs4."""
+    try:
+        return lxml_html.document_fromstring(html_content)
+    except ValueError:
+        # Строка с XML-декларацией кодировки: разбираем байты с явной кодировкой
+        return lxml_html.document_fromstring(html_content.encode('utf-8'), parser=lxml_html.HTMLParser(encoding='utf-8'))
+
+
+def has_class(class_name: str) -> str:
+    """Условие XPath, эквивалентное class_='...' в BeautifulSoup (совпадение с одним из классов элемента)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def has_exact_class(class_value: str) -> str:
+    """Условие XPath, эквивалентное class_='a b' в BeautifulSoup (совпадение всего значения атрибута)."""
+    return f"normalize-space(@class)='{class_value}'"
+
+
+def class_list(element) -> List[str]:
+    return (element.get('class') or '').split()
+
+
+def _strings(element) -> Iterator[str]:
+    if element.text:
+        yield element.text
+    for child in element:
+        # Комментарии и инструкции обработки в текст не входят, их хвосты - входят
+        if isinstance(child.tag, str) and child.tag not in _SKIPPED_TEXT_TAGS:
+            yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def node_text(element) -> str:
+    """Эквивалент Tag.get_text() / Tag.text."""
+    return ''.join(_strings(element))
+
+
+def node_text_stripped(element) -> str:
+    """Эквивалент Tag.get_text(strip=True)."""
+    return ''.join(s.strip() for s in _strings(element) if s.strip())
+
+
+def first(elements: list):
+    return elements[0] if elements else None
+
+
+def single_string(element) -> Optional[str]:
+    """Эквивалент Tag.string: текст элемента, если у него единственный потомок - строка (или тег с единственной строкой)."""
+    children = list(element)
+    if element.text and not children:
+        return element.text
+    if not element.text and len(children) == 1 and not children[0].tail:
+        child = children[0]
+        if not isinstance(child.tag, str):
+            return child.text
+        return single_string(child)
+    return None
+
+
+__all__ = [
+    "parse_html",
+    "has_class",
+    "has_exact_class",
+    "class_list",
+    "node_text",
+    "node_text_stripped",
+    "first",
+    "single_string",
+]
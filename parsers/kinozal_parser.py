@@ -1,7 +1,7 @@
 import re
 import os
-from typing import Dict, Optional, List
-from bs4 import BeautifulSoup
+from typing import Callable, Dict, Optional, List
+from lxml import etree
 import requests
 from datetime import datetime, timedelta, timezone
 from db import Database
@@ -11,10 +11,70 @@ from requests.exceptions import RequestException, Timeout
 from flask import current_app as app
 from urllib.parse import urlparse
 from auth import AuthManager
+from utils.page_cache import PageCache
+from utils.rate_limiter import get_rate_limiter
+from parsers import ERROR_AUTH, ERROR_PARSE, ERROR_TRANSPORT, is_transport_error
+from parsers.html_extract import parse_html, has_class, has_exact_class, node_text, node_text_stripped, first, single_string
+
+_TITLE = etree.XPath('//title')
+_LI = etree.XPath('//li')
+_FLOATRIGHT_SPAN = etree.XPath(f".//span[{has_class('floatright')}]")
+_UPDATE_BANNER = etree.XPath(f"//div[{has_exact_class('bx1 justify')}]")
+_DOWNLOAD_LINK = etree.XPath("//a[contains(@href, 'download.php?id=')]")
+
+
+def _first_content_contains(tag, key_word: str) -> bool:
+    """Эквивалент 'key_word in tag.contents[0]' в BeautifulSoup."""
+    if tag.text:
+        return key_word in tag.text
+    if not len(tag):
+        return False
+    first_child = tag[0]
+    if not isinstance(first_child.tag, str):
+        return key_word in (first_child.text or '')
+    # Для тега 'in' проверяет равенство с одной из его непосредственных строк
+    direct_strings = [first_child.text] + [c.tail for c in first_child] + [c.text for c in first_child if not isinstance(c.tag, str)]
+    return key_word in direct_strings
+
+
+def extract_kinozal_page(html_content: str, normalize_date: Callable[[str], Optional[str]]) -> Dict:
+    """
+    Извлекает со страницы раздачи заголовок, дату обновления торрента и ссылку на .torrent.
+    Вместо полного дерева BeautifulSoup и поиска лямбдой по всему документу - скомпилированные XPath по дереву lxml.
+    """
+    root = parse_html(html_content)
+    title_tag = first(_TITLE(root))
+
+    date_text = None
+    for key_word in ['Обновлен', 'Залит']:
+        li_tag = next((li for li in _LI(root) if _first_content_contains(li, key_word)), None)
+        if li_tag is not None:
+            date_span = first(_FLOATRIGHT_SPAN(li_tag))
+            if date_span is not None:
+                date_text = normalize_date(node_text_stripped(date_span))
+                break
+
+    if not date_text:
+        banner_tag = next((div for div in _UPDATE_BANNER(root)
+                           if re.search(r'Торрент-файл обновлен', single_string(div) or '')), None)
+        if banner_tag is not None:
+            match = re.search(r'Торрент-файл обновлен\s+(.*?)\s*Чтобы', node_text_stripped(banner_tag))
+            if match:
+                date_text = normalize_date(match.group(1))
+
+    torrent_link_tag = first(_DOWNLOAD_LINK(root))
+    return {
+        "title": node_text(title_tag).strip() if title_tag is not None else None,
+        "date_text": date_text,
+        "download_href": torrent_link_tag.get('href') if torrent_link_tag is not None else None,
+    }
+
 
 class KinozalParser:
     MAX_RETRIES = 5  # <-- ИЗМЕНЕНИЕ: Увеличено количество попыток до 5
     RETRY_DELAY = 3  # <-- ИЗМЕНЕНИЕ: Немного увеличена задержка между попытками
+    # threading.Event от сканера: выставляется, когда другое зеркало уже вернуло результат
+    cancel_event = None
 
     def __init__(self, auth_manager: AuthManager, db: Database, logger: Logger):
         self.db = db
@@ -71,7 +131,7 @@ class KinozalParser:
 
         session = self.auth_manager.get_kinozal_session(url)
         if not session:
-            return {"error": f"Не удалось получить аутентифицированную сессию для {url}"}
+            return {"error": f"Не удалось получить аутентифицированную сессию для {url}", "error_kind": ERROR_AUTH}
 
         parsed_url = urlparse(url)
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
@@ -79,13 +139,27 @@ class KinozalParser:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36',
             'Referer': base_url + '/'
         }
+        page_cache = PageCache(self.db, self.logger, "kinozal_parser", enabled=not debug_force_replace)
+        known_key = page_cache.known_key(last_known_torrents)
 
+        error_kind = ERROR_PARSE
         for attempt in range(self.MAX_RETRIES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return {"error": f"Парсинг {url} отменен: другое зеркало ответило раньше"}
             try:
                 if app.debug_manager.is_debug_enabled('kinozal_parser'):
                     self.logger.debug("kinozal_parser", f"Отправка запроса на {url} (попытка {attempt + 1}/{self.MAX_RETRIES})")
                 
-                response = session.get(url, headers=headers, timeout=15)
+                # Условный запрос: при 304 используется результат прошлого разбора
+                rate_limiter = get_rate_limiter(self.db, self.logger)
+                rate_limiter.acquire(url)
+                response = session.get(url, headers={**headers, **page_cache.conditional_headers(url, known_key)}, timeout=15)
+                if response.status_code == 304:
+                    cached_result = page_cache.lookup(url, known_key, not_modified=True)
+                    if cached_result:
+                        return cached_result
+                    rate_limiter.acquire(url)
+                    response = session.get(url, headers=headers, timeout=15)
                 response.raise_for_status()
                 self.logger.info("kinozal_parser", f"Страница {url} успешно загружена (попытка {attempt + 1}).")
 
@@ -94,33 +168,19 @@ class KinozalParser:
                 if app.debug_manager.is_debug_enabled('save_html_kinozal'):
                     self._save_html_dump(html_content)
 
-                soup = BeautifulSoup(html_content, 'lxml')
+                cached_result = page_cache.lookup(url, known_key, html_content)
+                if cached_result:
+                    return cached_result
+                cache_validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+                page = extract_kinozal_page(html_content, self._normalize_date)
 
-                title_tag = soup.find('title')
-                title_text = title_tag.text.strip() if title_tag else None
+                title_text = page['title']
                 title_ru = None
                 if title_text:
                     title_ru = re.sub(r'\s*::\s*Кинозал\.(ТВ|МЕ)$', '', title_text, flags=re.IGNORECASE).strip()
 
-                date_text = None
-                for key_word in ['Обновлен', 'Залит']:
-                    li_tag = soup.find(lambda tag: tag.name == 'li' and len(tag.contents) > 0 and key_word in tag.contents[0])
-                    if li_tag:
-                        date_span = li_tag.find('span', class_='floatright')
-                        if date_span:
-                            date_str = date_span.get_text(strip=True)
-                            date_text = self._normalize_date(date_str)
-                            break
-                
-                if not date_text:
-                    banner_tag = soup.find('div', class_='bx1 justify', text=re.compile(r'Торрент-файл обновлен'))
-                    if banner_tag:
-                        full_text = banner_tag.get_text(strip=True)
-                        match = re.search(r'Торрент-файл обновлен\s+(.*?)\s*Чтобы', full_text)
-                        if match:
-                            date_str = match.group(1)
-                            date_text = self._normalize_date(date_str)
-
+                date_text = page['date_text']
                 if not date_text:
                     raise ValueError("Дата обновления торрента не найдена на странице")
 
@@ -130,31 +190,32 @@ class KinozalParser:
                 
                 if last_known_date and last_known_date == date_text and not debug_force_replace:
                     self.logger.info("kinozal_parser", "Дата на сайте совпадает с известной. Обновление не требуется.")
-                    return {"title": {"ru": title_ru, "en": None}, "torrents": [{"date_time": date_text, "link": None}]}
+                    return page_cache.store(url, known_key, html_content, {"title": {"ru": title_ru, "en": None}, "torrents": [{"date_time": date_text, "link": None}]}, *cache_validators)
 
-                torrent_link_tag = soup.find('a', href=lambda href: href and 'download.php?id=' in href)
-                if not torrent_link_tag:
+                href = page['download_href']
+                if not href:
                     raise ValueError("Ссылка на торрент не найдена")
 
-                href = torrent_link_tag['href']
                 match = re.search(r'(download\.php\?id=\d+)', href)
                 href = match.group(1) if match else href.lstrip('/')
                 
                 download_domain = f"dl.{parsed_url.netloc}"
                 torrent_link = f"{parsed_url.scheme}://{download_domain}/{href}"
 
-                return {
+                return page_cache.store(url, known_key, html_content, {
                     "title": {"ru": title_ru, "en": None},
                     "torrents": [{"link": torrent_link, "date_time": date_text, "quality": None, "episodes": None}]
-                }
+                }, *cache_validators)
 
             except (Timeout, RequestException, UnicodeDecodeError, ValueError) as e:
+                error_kind = ERROR_TRANSPORT if is_transport_error(e) else ERROR_PARSE
                 self.logger.warning("kinozal_parser", f"Ошибка при обработке {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}")
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
             except Exception as e:
+                error_kind = ERROR_PARSE
                 self.logger.error("kinozal_parser", f"Непредвиденная ошибка парсинга {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}", exc_info=True)
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
         
-        return {"error": f"Не удалось получить или распарсить страницу {url} после {self.MAX_RETRIES} попыток."}
\ No newline at end of file
+        return {"error": f"Не удалось получить или распарсить страницу {url} после {self.MAX_RETRIES} попыток.", "error_kind": error_kind}
\ No newline at end of file
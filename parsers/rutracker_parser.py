@@ -1,7 +1,7 @@
 import re
 import os
-from typing import Dict, Optional, List
-from bs4 import BeautifulSoup
+from typing import Callable, Dict, Optional, List
+from lxml import etree
 import requests
 from datetime import datetime, timedelta, timezone
 from db import Database
@@ -11,11 +11,131 @@ from requests.exceptions import RequestException, Timeout
 from flask import current_app as app
 from urllib.parse import urlparse
 from auth import AuthManager
+from utils.page_cache import PageCache
+from utils.rate_limiter import get_rate_limiter
+from parsers import ERROR_AUTH, ERROR_PARSE, ERROR_TRANSPORT, is_transport_error
+from parsers.html_extract import parse_html, has_class, has_exact_class, class_list, node_text, node_text_stripped, first
+
+_MAINTITLE = etree.XPath(f"//h1[{has_class('maintitle')}]")
+_ATTACH_TABLE = etree.XPath(f"//table[{has_class('attach')}]")
+_ROWS = etree.XPath('.//tr')
+_LI = etree.XPath('//li')
+_DL_STUB = etree.XPath(f"//a[{has_class('dl-stub')}]")
+_LINKS_WITH_HREF = etree.XPath('//a[@href]')
+_MAGNET_LINK = etree.XPath(f"//a[{has_class('magnet-link')}]")
+_SIZE = etree.XPath("//span[@id='tor-size-humn']")
+_STATS = etree.XPath(f"//div[{has_exact_class('mrg_4 pad_4')}]")
+_SEED = etree.XPath(f".//span[{has_class('seed')}]")
+_LEECH = etree.XPath(f".//span[{has_class('leech')}]")
+
+_DATE_PATTERN = r'([0-9]{2}-[а-яА-ЯёЁa-zA-Z]{3}-[0-9]{2}\s[0-9]{2}:[0-9]{2})'
+
+
+def _find_registration_date(root, normalize_date: Callable[[str], Optional[str]]) -> Optional[str]:
+    # 1. Поиск в таблице с информацией о торренте
+    attach_table = first(_ATTACH_TABLE(root))
+    if attach_table is not None:
+        for row in _ROWS(attach_table):
+            date_match = re.search(r'(Зарегистрирован|[Зз]арег\.?|Registered):\s*' + _DATE_PATTERN, node_text(row))
+            if date_match:
+                date_text = normalize_date(date_match.group(2))
+                if date_text:
+                    return date_text
+
+    # 2. Элементы списка, рядом с которыми есть упоминание о регистрации
+    for li in _LI(root):
+        li_text = node_text_stripped(li)
+        match = re.search(_DATE_PATTERN, li_text)
+        if match:
+            parent = li.getparent()
+            context_text = (node_text(parent) if parent is not None else "") + " " + li_text
+            if any(reg_keyword in context_text.lower() for reg_keyword in ['зарегистр', 'registered', 'reg', 'дата']):
+                date_text = normalize_date(match.group(1))
+                if date_text:
+                    return date_text
+
+    # 3. Любая дата на странице с ключевым словом поблизости
+    all_text = node_text(root)
+    for date_match in re.findall(_DATE_PATTERN, all_text):
+        context_start = max(0, all_text.find(date_match) - 100)
+        context_end = min(len(all_text), all_text.find(date_match) + len(date_match) + 100)
+        context = all_text[context_start:context_end]
+        if any(keyword in context.lower() for keyword in ['зарегистр', 'registered', 'reg', 'дата', 'от', 'в']):
+            date_text = normalize_date(date_match)
+            if date_text:
+                return date_text
+    return None
+
+
+def _find_torrent_link(root):
+    # ОСНОВНОЙ ПРИОРИТЕТ: .torrent-файл, а не магнет-ссылка.
+    # 1. Ссылка с классом 'dl-stub': <a href="dl.php?t=6494350" class="dl-stub dl-link dl-topic">
+    dl_stub_tag = first(_DL_STUB(root))
+    if dl_stub_tag is not None and not dl_stub_tag.get('href', '').startswith('magnet:'):
+        return dl_stub_tag
+
+    links = _LINKS_WITH_HREF(root)
+    # 2. Другие признаки торрента в адресе; магнет-ссылка имеет класс 'magnet-link'
+    for a_tag in links:
+        href = a_tag.get('href', '')
+        if not href.startswith('magnet:') and ('dl.php?' in href or '/dl.php' in href or '.torrent' in href.lower()):
+            if 'magnet-link' not in class_list(a_tag):
+                return a_tag
+
+    # 3. Текст ссылки
+    for a_tag in links:
+        href = a_tag.get('href', '')
+        link_text = node_text(a_tag).lower()
+        if (not href.startswith('magnet:') and
+            'magnet-link' not in class_list(a_tag) and
+            ('скачать .torrent' in link_text or 'скачать торрент' in link_text or
+             'download .torrent' in link_text or 'download torrent' in link_text or
+             'torrent' in link_text)):
+            return a_tag
+    return None
+
+
+def _first_number(element) -> Optional[int]:
+    if element is None:
+        return None
+    match = re.search(r'\d+', node_text(element))
+    return int(match.group()) if match else None
+
+
+def extract_rutracker_page(html_content: str, normalize_date: Callable[[str], Optional[str]]) -> Dict:
+    """
+    Извлекает со страницы темы заголовок, дату регистрации, ссылку на .torrent, magnet, размер и сиды/личи.
+    Скомпилированные XPath по дереву lxml вместо полного дерева BeautifulSoup; порядок эвристик прежний.
+    link_href - None, если ссылка на торрент не найдена.
+    """
+    root = parse_html(html_content)
+    title_tag = first(_MAINTITLE(root))
+    torrent_link_tag = _find_torrent_link(root)
+    magnet_link_tag = first(_MAGNET_LINK(root))
+    size_element = first(_SIZE(root))
+
+    seeders = leechers = None
+    stats_container = first(_STATS(root))
+    if stats_container is not None:
+        seeders = _first_number(first(_SEED(stats_container)))
+        leechers = _first_number(first(_LEECH(stats_container)))
+
+    return {
+        "title": node_text_stripped(title_tag) if title_tag is not None else None,
+        "date_text": _find_registration_date(root, normalize_date),
+        "link_href": torrent_link_tag.get('href', '') if torrent_link_tag is not None else None,
+        "magnet_link": magnet_link_tag.get('href') if magnet_link_tag is not None else None,
+        "size": node_text_stripped(size_element) if size_element is not None else None,
+        "seeders": seeders,
+        "leechers": leechers,
+    }
 
 
 class RuTrackerParser:
     MAX_RETRIES = 5
     RETRY_DELAY = 3
+    # threading.Event от сканера: выставляется, когда другое зеркало уже вернуло результат
+    cancel_event = None
 
     def __init__(self, auth_manager: AuthManager, db: Database, logger: Logger):
         self.db = db
@@ -87,7 +207,7 @@ class RuTrackerParser:
 
         session = self.auth_manager.get_rutracker_session(url)
         if not session:
-            return {"error": f"Не удалось получить аутентифицированную сессию для {url}"}
+            return {"error": f"Не удалось получить аутентифицированную сессию для {url}", "error_kind": ERROR_AUTH}
 
         parsed_url = urlparse(url)
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
@@ -95,13 +215,27 @@ class RuTrackerParser:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36',
             'Referer': base_url + '/'
         }
+        page_cache = PageCache(self.db, self.logger, "rutracker_parser", enabled=not debug_force_replace)
+        known_key = page_cache.known_key(last_known_torrents)
 
+        error_kind = ERROR_PARSE
         for attempt in range(self.MAX_RETRIES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return {"error": f"Парсинг {url} отменен: другое зеркало ответило раньше"}
             try:
                 if app.debug_manager.is_debug_enabled('rutracker_parser'):
                     self.logger.debug("rutracker_parser", f"Отправка запроса на {url} (попытка {attempt + 1}/{self.MAX_RETRIES})")
                 
-                response = session.get(url, headers=headers, timeout=15)
+                # Условный запрос: при 304 используется результат прошлого разбора
+                rate_limiter = get_rate_limiter(self.db, self.logger)
+                rate_limiter.acquire(url)
+                response = session.get(url, headers={**headers, **page_cache.conditional_headers(url, known_key)}, timeout=15)
+                if response.status_code == 304:
+                    cached_result = page_cache.lookup(url, known_key, not_modified=True)
+                    if cached_result:
+                        return cached_result
+                    rate_limiter.acquire(url)
+                    response = session.get(url, headers=headers, timeout=15)
                 response.raise_for_status()
                 self.logger.info("rutracker_parser", f"Страница {url} успешно загружена (попытка {attempt + 1}).")
 
@@ -110,64 +244,14 @@ class RuTrackerParser:
                 if app.debug_manager.is_debug_enabled('save_html_rutracker'):
                     self._save_html_dump(html_content)
 
-                soup = BeautifulSoup(html_content, 'lxml')
+                cached_result = page_cache.lookup(url, known_key, html_content)
+                if cached_result:
+                    return cached_result
+                cache_validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
 
-                # Извлекаем заголовок
-                title_tag = soup.find('h1', class_='maintitle')
-                title_text = title_tag.get_text(strip=True) if title_tag else None
-                title_ru = title_text
-
-                # Ищем дату регистрации с более гибким подходом
-                date_text = None
-                
-                # Попробуем разные возможные места и форматы для поиска даты
-                
-                # 1. Поиск в таблице с информацией о торренте
-                attach_table = soup.find('table', class_='attach')
-                if attach_table:
-                    # Ищем строку с "Зарегистрирован:" или подобным
-                    for row in attach_table.find_all('tr'):
-                        row_text = row.get_text()
-                        # Паттерн для даты в формате DD-MMM-YY HH:MM
-                        date_match = re.search(r'(Зарегистрирован|[Зз]арег\.?|Registered):\s*([0-9]{2}-[а-яА-ЯёЁa-zA-Z]{3}-[0-9]{2}\s[0-9]{2}:[0-9]{2})', row_text)
-                        if date_match:
-                            date_str = date_match.group(2)
-                            date_text = self._normalize_date(date_str)
-                            if date_text:
-                                break
-                
-                # 2. Если не нашли в таблице, ищем в других местах
-                if not date_text:
-                    # Ищем в списках, часто дата находится в элементе <li>
-                    for li in soup.find_all('li'):
-                        li_text = li.get_text(strip=True)
-                        # Ищем формат даты DD-MMM-YY HH:MM в начале или конце текста
-                        match = re.search(r'([0-9]{2}-[а-яА-ЯёЁa-zA-Z]{3}-[0-9]{2}\s[0-9]{2}:[0-9]{2})', li_text)
-                        if match:
-                            # Проверим, содержит ли родительский элемент или сам элемент упоминание о регистрации
-                            parent = li.parent
-                            context_text = (parent.get_text() if parent else "") + " " + li_text
-                            if any(reg_keyword in context_text.lower() for reg_keyword in ['зарегистр', 'registered', 'reg', 'дата']):
-                                date_str = match.group(1)
-                                date_text = self._normalize_date(date_str)
-                                if date_text:
-                                    break
-                
-                # 3. Если все еще не нашли, ищем везде по паттерну даты
-                if not date_text:
-                    # Проверим все текстовые элементы на странице для поиска даты
-                    all_text = soup.get_text()
-                    # Ищем все возможные совпадения формата даты
-                    all_date_matches = re.findall(r'([0-9]{2}-[а-яА-ЯёЁa-zA-Z]{3}-[0-9]{2}\s[0-9]{2}:[0-9]{2})', all_text)
-                    for date_match in all_date_matches:
-                        # Проверим, есть ли рядом ключевые слова
-                        context_start = max(0, all_text.find(date_match) - 100)
-                        context_end = min(len(all_text), all_text.find(date_match) + len(date_match) + 100)
-                        context = all_text[context_start:context_end]
-                        if any(keyword in context.lower() for keyword in ['зарегистр', 'registered', 'reg', 'дата', 'от', 'в']):
-                            date_text = self._normalize_date(date_match)
-                            if date_text:
-                                break
+                page = extract_rutracker_page(html_content, self._normalize_date)
+                title_ru = page['title']
+                date_text = page['date_text']
 
                 if not date_text:
                     raise ValueError("Дата регистрации торрента не найдена на странице")
@@ -179,50 +263,19 @@ class RuTrackerParser:
                 
                 if last_known_date and last_known_date == date_text and not debug_force_replace:
                     self.logger.info("rutracker_parser", "Дата на сайте совпадает с известной. Обновление не требуется.")
-                    return {"title": {"ru": title_ru, "en": None}, "torrents": [{"date_time": date_text, "link": None}]}
+                    return page_cache.store(url, known_key, html_content, {"title": {"ru": title_ru, "en": None}, "torrents": [{"date_time": date_text, "link": None}]}, *cache_validators)
 
-                # Ищем ссылку на торрент-файл - пробуем разные возможные селекторы
-                # ОСНОВНОЙ ПРИОРИТЕТ: найти .torrent файл, а не магнет-ссылку
-                torrent_link_tag = None
-                
-                # 1. Сначала ищем по классу 'dl-stub' (это обычно ссылка на торрент-файл)
-                # В дампе HTML мы видим: <a href="dl.php?t=6494350" class="dl-stub dl-link dl-topic">
-                dl_stub_tag = soup.find('a', class_='dl-stub')
-                if dl_stub_tag:
-                    # Проверяем, что это не магнет-ссылка
-                    if not dl_stub_tag.get('href', '').startswith('magnet:'):
-                        torrent_link_tag = dl_stub_tag
-                
-                if not torrent_link_tag:
-                    # 2. Ищем по другим возможным признакам торрента, но исключаем магнет-ссылки
-                    # В дампе мы видим, что магнет-ссылка имеет класс 'magnet-link'
-                    for a_tag in soup.find_all('a', href=True):
-                        href = a_tag.get('href', '')
-                        # Проверяем, что это не магнет-ссылка и содержит признак торрента
-                        if not href.startswith('magnet:') and ('dl.php?' in href or '/dl.php' in href or '.torrent' in href.lower()):
-                            # Также проверим, что это не магнет-ссылка по классу
-                            if 'magnet-link' not in a_tag.get('class', []):
-                                torrent_link_tag = a_tag
-                                break
-                
-                if not torrent_link_tag:
-                    # 3. Ищем по тексту ссылки, исключая магнет-ссылки
-                    for a_tag in soup.find_all('a', href=True):
-                        href = a_tag.get('href', '')
-                        link_text = a_tag.get_text().lower()
-                        # Проверяем, что это не магнет-ссылка по содержимому и классу
-                        if (not href.startswith('magnet:') and
-                            'magnet-link' not in a_tag.get('class', []) and
-                            ('скачать .torrent' in link_text or 'скачать торрент' in link_text or
-                             'download .torrent' in link_text or 'download torrent' in link_text or
-                             'torrent' in link_text)):
-                            torrent_link_tag = a_tag
-                            break
-                
-                if not torrent_link_tag:
+                if page['link_href'] is None:
+                    if self.auth_manager.is_logged_out_page('rutracker', html_content):
+                        # Ссылку на .torrent гость не видит: сохраненная сессия истекла, следующая попытка - после входа
+                        self.auth_manager.invalidate_session('rutracker', url, "страница раздачи открыта без авторизации")
+                        session = self.auth_manager.get_rutracker_session(url)
+                        if not session:
+                            return {"error": f"Не удалось получить аутентифицированную сессию для {url}", "error_kind": ERROR_AUTH}
+                        raise ValueError("Сессия RuTracker истекла, выполнен повторный вход")
                     raise ValueError("Ссылка на торрент не найдена")
 
-                href = torrent_link_tag.get('href', '')
+                href = page['link_href']
                 
                 # Проверяем, что это не магнет-ссылка
                 if href.startswith('magnet:'):
@@ -259,26 +312,10 @@ class RuTrackerParser:
                         # Добавим необходимые заголовки для скачивания торрента
                         pass  # Заголовки будут добавлены в qbittorrent.py при скачивании
 
-                # Ищем магнет-ссылку
-                magnet_link_tag = soup.find('a', class_='magnet-link')
-                magnet_link = magnet_link_tag.get('href') if magnet_link_tag else None
-
-                # Ищем размер торрента
-                size_element = soup.find('span', id='tor-size-humn')
-                size = size_element.get_text(strip=True) if size_element else None
-
-                # Ищем статистику (сиды/личи)
-                seeders = leechers = None
-                stats_container = soup.find('div', class_='mrg_4 pad_4')
-                if stats_container:
-                    seeders_element = stats_container.find('span', class_='seed')
-                    leechers_element = stats_container.find('span', class_='leech')
-                    if seeders_element:
-                        seeders_match = re.search(r'\d+', seeders_element.get_text())
-                        seeders = int(seeders_match.group()) if seeders_match else None
-                    if leechers_element:
-                        leechers_match = re.search(r'\d+', leechers_element.get_text())
-                        leechers = int(leechers_match.group()) if leechers_match else None
+                magnet_link = page['magnet_link']
+                size = page['size']
+                seeders = page['seeders']
+                leechers = page['leechers']
 
                 # Возвращаем информацию о торренте
                 # Согласно требованиям, основная ссылка должна быть торрент-файлом, а не магнет-ссылкой
@@ -299,18 +336,20 @@ class RuTrackerParser:
                 if leechers is not None:
                     torrent_info["leechers"] = leechers
 
-                return {
+                return page_cache.store(url, known_key, html_content, {
                     "title": {"ru": title_ru, "en": None},
                     "torrents": [torrent_info]
-                }
+                }, *cache_validators)
 
             except (Timeout, RequestException, UnicodeDecodeError, ValueError) as e:
+                error_kind = ERROR_TRANSPORT if is_transport_error(e) else ERROR_PARSE
                 self.logger.warning("rutracker_parser", f"Ошибка при обработке {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}")
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
             except Exception as e:
+                error_kind = ERROR_PARSE
                 self.logger.error("rutracker_parser", f"Непредвиденная ошибка парсинга {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}", exc_info=True)
                 if attempt < self.MAX_RETRIES - 1:
                     time.sleep(self.RETRY_DELAY)
         
-        return {"error": f"Не удалось получить или распарсить страницу {url} после {self.MAX_RETRIES} попыток."}
\ No newline at end of file
+        return {"error": f"Не удалось получить или распарсить страницу {url} после {self.MAX_RETRIES} попыток.", "error_kind": error_kind}
\ No newline at end of file
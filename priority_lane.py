@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from logger import Logger
+
+
+class PriorityLane:
+    """
+    Реестр интерактивных работ, запущенных пользователем из UI.
+    Агенты проверяют его, чтобы брать такие работы в обход плановой очереди,
+    и сообщают сюда момент фактического старта для контроля задержки.
+
+    Ключ записи - пара (kind, key):
+      ('scan', series_id)    - ручное сканирование сериала;
+      ('series', series_id)  - загрузки и переименования, порожденные ручным сканированием;
+      ('slicing', task_id)   - ручной запуск нарезки.
+    """
+    def __init__(self, logger: Logger, ttl_seconds: int = 1800, target_start_latency: float = 1.0):
+        self.logger = logger
+        self.ttl_seconds = ttl_seconds
+        self.target_start_latency = target_start_latency
+        self.lock = threading.Lock()
+        self._entries: Dict[Tuple[str, object], Dict] = {}
+        self._wakeup_callbacks: Dict[str, List[Callable]] = {}
+        self._start_latencies = deque(maxlen=200)
+
+    def register_wakeup(self, kind: str, callback: Callable):
+        """Регистрирует функцию, которая 'будит' агента при появлении приоритетной работы данного типа."""
+        with self.lock:
+            self._wakeup_callbacks.setdefault(kind, []).append(callback)
+
+    def promote(self, kind: str, key, ttl_seconds: Optional[int] = None, wake: bool = True):
+        """Ставит работу в приоритетную полосу. wake=False - агент будет разбужен вызывающим позже."""
+        now = time.time()
+        with self.lock:
+            self._entries[(kind, key)] = {
+                'requested_at': now,
+                'expires_at': now + (ttl_seconds or self.ttl_seconds),
+                'started': False,
+            }
+            callbacks = list(self._wakeup_callbacks.get(kind, [])) if wake else []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error("priority_lane", f"Ошибка при пробуждении агента для '{kind}': {e}", exc_info=True)
+
+    def is_promoted(self, kind: str, key) -> bool:
+        with self.lock:
+            entry = self._entries.get((kind, key))
+            if not entry:
+                return False
+            if time.time() > entry['expires_at']:
+                del self._entries[(kind, key)]
+                return False
+            return True
+
+    def promoted_keys(self, kind: str) -> set:
+        now = time.time()
+        with self.lock:
+            expired = [k for k, e in self._entries.items() if now > e['expires_at']]
+            for k in expired:
+                del self._entries[k]
+            return {key for (k, key) in self._entries if k == kind}
+
+    def release(self, kind: str, key):
+        with self.lock:
+            self._entries.pop((kind, key), None)
+
+    def report_start(self, kind: str, key) -> Optional[float]:
+        """Фиксирует фактический старт приоритетной работы. Возвращает задержку старта в секундах."""
+        with self.lock:
+            entry = self._entries.get((kind, key))
+            if not entry or entry['started']:
+                return None
+            entry['started'] = True
+            latency = time.time() - entry['requested_at']
+            self._start_latencies.append({'kind': kind, 'key': key, 'latency': latency, 'time': time.time()})
+
+        if latency > self.target_start_latency:
+            self.logger.warning("priority_lane", f"Приоритетная работа {kind}:{key} стартовала за {latency:.2f} с (цель {self.target_start_latency:.1f} с).")
+        else:
+            self.logger.info("priority_lane", f"Приоритетная работа {kind}:{key} стартовала за {latency:.3f} с.")
+        return latency
+
+    def get_status(self) -> dict:
+        with self.lock:
+            latencies = [s['latency'] for s in self._start_latencies]
+            recent = [{'kind': s['kind'], 'key': s['key'], 'latency_ms': round(s['latency'] * 1000, 1)} for s in list(self._start_latencies)[-20:]]
+            active = [{'kind': kind, 'key': key, 'started': e['started']} for (kind, key), e in self._entries.items()]
+
+        return {
+            'target_start_latency_ms': int(self.target_start_latency * 1000),
+            'active': active,
+            'started_count': len(latencies),
+            'max_start_latency_ms': round(max(latencies) * 1000, 1) if latencies else None,
+            'over_target_count': sum(1 for l in latencies if l > self.target_start_latency),
+            'recent': recent,
+        }
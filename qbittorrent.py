@@ -1,58 +1,178 @@
+import json
+import random
 import requests
+import threading
 import time
 import uuid
 from typing import Dict, List, Optional, Tuple
 from flask import current_app as app
 from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from requests.exceptions import Timeout
 from db import Database
 from logger import Logger
 from auth import AuthManager
 from file_cache import read_from_cache, save_to_cache
 from utils.tracker_resolver import TrackerResolver
+from utils.torrent_hash import infohash_from_torrent_bytes, infohash_from_magnet
+from utils.circuit_breaker import CircuitBreaker
+from utils.rate_limiter import get_rate_limiter, RateLimitExceeded
+
+# Имя основного экземпляра qBittorrent (auth_type в таблице auth). Дополнительные: 'qbittorrent_<имя>'
+DEFAULT_INSTANCE = 'qbittorrent'
+
+# Общий для процесса выключатель на каждый экземпляр: при недоступности qBittorrent все потоки сразу получают отказ
+qbittorrent_breaker = CircuitBreaker(DEFAULT_INSTANCE)
+_breakers = {DEFAULT_INSTANCE: qbittorrent_breaker}
+_breakers_lock = threading.Lock()
+
+# Политики размещения новых торрентов между экземплярами (настройка 'qbittorrent_placement')
+PLACEMENT_POLICIES = ('least_loaded', 'by_save_path', 'by_series')
+DEFAULT_PLACEMENT = 'least_loaded'
+
+
+def get_qbittorrent_breaker(instance: Optional[str] = None) -> CircuitBreaker:
+    instance = instance or DEFAULT_INSTANCE
+    with _breakers_lock:
+        if instance not in _breakers:
+            _breakers[instance] = CircuitBreaker(instance)
+        return _breakers[instance]
+
+
+def get_breaker_states() -> Dict[str, Dict]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.get_state() for name, breaker in breakers.items()}
+
+# Тег, которым помечаются все торренты series-tracker (настройка 'qbittorrent_tag', пустое значение отключает отбор)
+DEFAULT_SCOPE_TAG = 'series-tracker'
 
 
 class QBittorrentClient:
-    def __init__(self, auth_manager: AuthManager, db: Database, logger: Logger):
+    def __init__(self, auth_manager: AuthManager, db: Database, logger: Logger, pool_size: int = 10, instance: str = DEFAULT_INSTANCE):
         self.auth_manager = auth_manager
+        self.instance = instance
+        self.breaker = get_qbittorrent_breaker(instance)
         self.db = db
         self.logger = logger
         self.session = None
         self.base_url = None
         self.MAX_RETRIES = 5
-        self.RETRY_DELAY = 2
+        self.RETRY_DELAY = 1
+        self.MAX_RETRY_DELAY = 8
+        self.pool_size = pool_size
+        # Один адаптер с пулом keep-alive соединений на все время жизни клиента (переживает повторные логины)
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.auth_lock = threading.Lock()
+        self.metrics_lock = threading.Lock()
+        self.metrics = {'logins': 0, 'relogins': 0, 'requests': 0, 'auth_failures': 0, 'last_auth_error': None,
+                        'maindata_polls': 0, 'maindata_bytes_last': 0, 'maindata_bytes_total': 0, 'maindata_bytes_max': 0}
         if app.debug_manager.is_debug_enabled('auth'):
             self.logger.debug("auth", f"[QBittorrentClient] Инициализирован с AuthManager ID: {id(self.auth_manager)}")
 
+    def _increment_metric(self, name: str):
+        with self.metrics_lock:
+            self.metrics[name] += 1
+
     def _ensure_authenticated(self) -> bool:
         if self.session:
             return True
-        auth_result = self.auth_manager.authenticate("qbittorrent")
-        if not auth_result.get("success"):
-            self.logger.error("qbittorrent", f"Ошибка авторизации: {auth_result.get('error')}")
-            return False
-        self.session = auth_result["session"]
-        creds = self.auth_manager.get_credentials("qbittorrent")
-        self.base_url = creds.url if creds else None
-        return True
+        with self.auth_lock:
+            # Пока ждали блокировку, другой поток мог уже авторизоваться
+            if self.session:
+                return True
+            auth_result = self.auth_manager.authenticate(self.instance)
+            self._increment_metric('logins')
+            if not auth_result.get("success"):
+                if auth_result.get("unreachable"):
+                    # Экземпляр не ответил на вход - это сбой доступности, как таймаут обычного запроса
+                    self._record_breaker_failure(f"Ошибка подключения при авторизации: {auth_result.get('error')}")
+                else:
+                    # Неверные учетные данные - ошибка настройки: выключатель не размыкается, иначе она выглядела бы
+                    # как недоступность qBittorrent и блокировала бы все запросы
+                    with self.metrics_lock:
+                        self.metrics['auth_failures'] += 1
+                        self.metrics['last_auth_error'] = auth_result.get('error')
+                    self.logger.error("qbittorrent", f"Ошибка авторизации в {self.instance} (проверьте учетные данные): {auth_result.get('error')}")
+                return False
+            session = auth_result["session"]
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            creds = self.auth_manager.get_credentials(self.instance)
+            self.base_url = creds.url if creds else None
+            self.session = session
+            return True
+
+    def _reauthenticate(self, failed_session) -> bool:
+        """Повторный логин после 403. Выполняется один раз, даже если 403 получили несколько потоков сразу."""
+        with self.auth_lock:
+            if self.session is failed_session:
+                self.session = None
+                self._increment_metric('relogins')
+        return self._ensure_authenticated()
+
+    def _record_maindata_payload(self, size: int):
+        with self.metrics_lock:
+            self.metrics['maindata_polls'] += 1
+            self.metrics['maindata_bytes_last'] = size
+            self.metrics['maindata_bytes_total'] += size
+            self.metrics['maindata_bytes_max'] = max(self.metrics['maindata_bytes_max'], size)
+
+    def get_scope_tag(self) -> Optional[str]:
+        """Тег торрентов series-tracker из настроек. None, если отбор по тегу отключен."""
+        return self.db.get_setting('qbittorrent_tag', DEFAULT_SCOPE_TAG).strip() or None
+
+    def _connection_count(self) -> int:
+        try:
+            pools = self.adapter.poolmanager.pools
+            return sum(pools[key].num_connections for key in list(pools.keys()))
+        except Exception:
+            return 0
+
+    def get_metrics(self) -> Dict:
+        with self.metrics_lock:
+            metrics = dict(self.metrics)
+        metrics['connections_created'] = self._connection_count()
+        metrics['pool_size'] = self.pool_size
+        metrics['instance'] = self.instance
+        metrics['base_url'] = self.base_url
+        metrics['breaker'] = self.breaker.get_state()
+        return metrics
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Экспоненциальная задержка с джиттером: случайное значение в [base/2, base], base = RETRY_DELAY * 2^attempt."""
+        base = min(self.RETRY_DELAY * (2 ** attempt), self.MAX_RETRY_DELAY)
+        return random.uniform(base / 2, base)
 
     def _request_with_retries(self, method: str, endpoint: str, request_timeout: int = 20, **kwargs) -> Optional[requests.Response]:
+        if not self.breaker.allow_request():
+            if app.debug_manager.is_debug_enabled('qbittorrent'):
+                self.logger.debug("qbittorrent", f"Запрос к {endpoint} отклонен: {self.instance} недоступен (выключатель разомкнут).")
+            return None
         if not self._ensure_authenticated():
             return None
         url = f"{self.base_url}/{endpoint}"
         for attempt in range(self.MAX_RETRIES):
+            if attempt > 0 and not self.breaker.allow_request():
+                self.logger.warning("qbittorrent", f"Повторные попытки запроса к {url} прерваны: qBittorrent недоступен (выключатель разомкнут).")
+                return None
             try:
                 is_polling_endpoint = 'sync/maindata' in endpoint or 'torrents/info' in endpoint
                 if app.debug_manager.is_debug_enabled('qbittorrent') and not is_polling_endpoint:
                     self.logger.debug("qbittorrent", f"Запрос {method.upper()} к {url} (попытка {attempt + 1})")
                 
-                response = self.session.request(method, url, timeout=request_timeout, **kwargs)
+                session = self.session
+                self._increment_metric('requests')
+                response = session.request(method, url, timeout=request_timeout, **kwargs)
+
+                # Сервер ответил (кроме 5xx) - он доступен, даже если ответ содержит ошибку
+                if response.status_code < 500:
+                    self.breaker.record_success()
 
                 # Обработка 403 Forbidden (проблема с авторизацией) -> Повторяем попытку
                 if response.status_code == 403:
                     self.logger.warning("qbittorrent", "Получен статус 403 (Forbidden). Попытка повторной аутентификации.")
-                    self.session = None
-                    if not self._ensure_authenticated(): return None
+                    if not self._reauthenticate(session): return None
                     continue
 
                 # --- НАЧАЛО ИЗМЕНЕНИЙ ---
@@ -69,32 +189,49 @@ class QBittorrentClient:
                 if 'sync/maindata' in endpoint:
                     if app.debug_manager.is_debug_enabled('qbittorrent'):
                         self.logger.debug("qbittorrent", f"Таймаут long-polling запроса к {url}, это ожидаемо.")
+                    # Повтор не нужен, но сбой учитывается: иначе пробный запрос в полуоткрытом состоянии не завершится
+                    self._record_breaker_failure("Таймаут long-polling")
                     return None
                 self.logger.warning("qbittorrent", f"Таймаут запроса к {url} (попытка {attempt + 1}/{self.MAX_RETRIES})")
+                self._record_breaker_failure("Таймаут запроса")
             except requests.RequestException as e:
                 self.logger.warning("qbittorrent", f"Ошибка запроса к {url} (попытка {attempt + 1}/{self.MAX_RETRIES}): {e}")
+                status_code = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if status_code is None or status_code >= 500:
+                    self._record_breaker_failure(str(e))
             
             if attempt < self.MAX_RETRIES - 1:
-                time.sleep(self.RETRY_DELAY)
+                time.sleep(self._backoff_delay(attempt))
         
         self.logger.error("qbittorrent", f"Не удалось выполнить запрос к {url} после {self.MAX_RETRIES} попыток.")
         return None
 
-    def add_torrent(self, link: str, save_path: str, torrent_id: str) -> Tuple[Optional[str], Optional[str]]:
+    def _record_breaker_failure(self, error: str):
+        if self.breaker.record_failure(error):
+            state = self.breaker.get_state()
+            self.logger.error("qbittorrent", f"{self.instance} недоступен: выключатель разомкнут на {state['retry_in_seconds']} с. Последняя ошибка: {error}")
+
+    def add_torrent(self, link: str, save_path: str, torrent_id: str, auth_manager: Optional[AuthManager] = None) -> Tuple[Optional[str], Optional[str]]:
+        # Сессии трекеров для скачивания .torrent берутся из AuthManager вызывающего кода (например, сканера),
+        # чтобы не авторизоваться на трекере повторно
+        tracker_auth = auth_manager or self.auth_manager
         self.logger.info("qbittorrent", f"Добавление торрента ID: {torrent_id} в qBittorrent.")
         
         final_tag = torrent_id
+        scope_tag = self.get_scope_tag()
         
-        payload = {'savepath': save_path, 'tags': final_tag, 'paused': 'true'}
+        payload = {'savepath': save_path, 'tags': f"{final_tag},{scope_tag}" if scope_tag else final_tag, 'paused': 'true'}
         add_params = {'data': payload}
         files_payload = None
         link_type = None
+        expected_hash = None
 
         if link.startswith('magnet:'):
             if app.debug_manager.is_debug_enabled('qbittorrent'):
                 self.logger.debug("qbittorrent", f"Подготовка magnet-ссылки для {torrent_id}.")
             payload['urls'] = link
             link_type = 'magnet'
+            expected_hash = infohash_from_magnet(link)
         else:
             link_type = 'file'
             file_content = read_from_cache(torrent_id)
@@ -108,15 +245,15 @@ class QBittorrentClient:
                     self.logger.info("qbittorrent", f"Определен тип аутентификации для ссылки '{link}': {auth_type}")
 
                     if auth_type == 'kinozal':
-                        session = self.auth_manager.get_kinozal_session(link)
+                        session = tracker_auth.get_kinozal_session(link)
                         if app.debug_manager.is_debug_enabled('auth') and session:
                             self.logger.debug("auth", f"[QBittorrentClient] Получена сессия ID: {id(session)} от AuthManager")
                     elif auth_type == 'rutracker':
-                        session = self.auth_manager.get_rutracker_session(link)
+                        session = tracker_auth.get_rutracker_session(link)
                         if app.debug_manager.is_debug_enabled('auth') and session:
                             self.logger.debug("auth", f"[QBittorrentClient] Получена сессия ID: {id(session)} от AuthManager для RuTracker")
                     elif auth_type == 'astar':
-                        session = self.auth_manager.get_scraper()
+                        session = tracker_auth.get_scraper()
                     else:
                         session = requests.Session()
                     
@@ -152,10 +289,23 @@ class QBittorrentClient:
                             'X-Requested-With': 'XMLHttpRequest'
                         })
                     
+                    # Скачивания .torrent ограничиваются отдельно от страниц трекера (корзина '<трекер>:download')
+                    get_rate_limiter(self.db, self.logger).acquire(link, purpose='download')
                     response = session.get(link, **request_kwargs)
                     response.raise_for_status()
                     
                     content_type = response.headers.get('Content-Type', '')
+                    if 'text/html' in content_type and tracker_auth.is_logged_out_page(auth_type, response.text):
+                        # Сохраненная сессия истекла на стороне трекера: один повтор после нового входа
+                        tracker_auth.invalidate_session(auth_type, link, "трекер вернул страницу входа вместо .torrent файла")
+                        session = tracker_auth.get_kinozal_session(link) if auth_type == 'kinozal' else tracker_auth.get_rutracker_session(link)
+                        if not session:
+                            raise Exception("Не удалось повторно авторизоваться для скачивания .torrent файла.")
+                        get_rate_limiter(self.db, self.logger).acquire(link, purpose='download')
+                        response = session.get(link, **request_kwargs)
+                        response.raise_for_status()
+                        content_type = response.headers.get('Content-Type', '')
+
                     if 'text/html' in content_type:
                         error_reason = "Неизвестная ошибка: трекер вернул HTML страницу."
                         if "Вы использовали доступное Вам количество торрент-файлов в сутки" in response.text:
@@ -168,15 +318,30 @@ class QBittorrentClient:
                     file_content = response.content
                     save_to_cache(torrent_id, file_content)
 
+                except RateLimitExceeded as e:
+                    self.logger.warning("qbittorrent", f"Скачивание .torrent файла {link} отложено ограничителем запросов: {e}")
+                    return None, None
                 except Exception as e:
                     self.logger.error("qbittorrent", f"Не удалось скачать .torrent файл {link}: {e}", exc_info=True)
                     return None, None
             
             files_payload = {'torrents': ('file.torrent', file_content, 'application/x-bittorrent')}
+            expected_hash = infohash_from_torrent_bytes(file_content)
         
         if files_payload:
             add_params['files'] = files_payload
 
+        if expected_hash:
+            # Хеш известен заранее: временный тег и его опрос не нужны
+            if scope_tag:
+                payload['tags'] = scope_tag
+            else:
+                del payload['tags']
+            if app.debug_manager.is_debug_enabled('qbittorrent'):
+                self.logger.debug("qbittorrent", f"Хеш торрента {torrent_id} вычислен локально: {expected_hash}")
+            return self._add_torrent_with_known_hash(add_params, expected_hash, torrent_id, link_type)
+
+        self.logger.warning("qbittorrent", f"Не удалось вычислить хеш торрента {torrent_id} локально. Используется поиск по временному тегу.")
         response = self._request_with_retries("post", "api/v2/torrents/add", **add_params)
         
         # --- НАЧАЛО ИЗМЕНЕНИЯ ---
@@ -188,6 +353,7 @@ class QBittorrentClient:
             if qb_hash:
                 self.logger.info("qbittorrent", f"Торрент {torrent_id} уже существует в qBittorrent. Используем его хеш: {qb_hash}")
                 self._remove_tag(final_tag, qb_hash) # Просто удаляем тег
+                self._tag_existing_torrent(qb_hash, torrent_id)
                 return qb_hash, link_type
             else:
                 # Если хеш не нашелся, то это реальная ошибка
@@ -209,6 +375,35 @@ class QBittorrentClient:
         return None, None
 
 
+    def _add_torrent_with_known_hash(self, add_params: Dict, expected_hash: str, torrent_id: str, link_type: str) -> Tuple[Optional[str], Optional[str]]:
+        response = self._request_with_retries("post", "api/v2/torrents/add", **add_params)
+
+        if response and response.status_code == 200 and "Ok." in response.text:
+            self.logger.info("qbittorrent", f"Торрент {torrent_id} успешно добавлен на паузе, qb_hash: {expected_hash}")
+            return expected_hash, link_type
+
+        # "Fails." обычно означает, что такой торрент уже есть в qBittorrent - проверяем по хешу
+        if response and response.status_code == 200 and "Fails." in response.text:
+            existing = self.get_torrents_info([expected_hash])
+            if existing:
+                self.logger.info("qbittorrent", f"Торрент {torrent_id} уже существует в qBittorrent. Используем его хеш: {expected_hash}")
+                self._tag_existing_torrent(expected_hash, torrent_id)
+                return expected_hash, link_type
+
+        error_text = response.text if response else 'No response'
+        status_code = response.status_code if response else 'N/A'
+        self.logger.error("qbittorrent", f"Не удалось добавить торрент {torrent_id} в qBittorrent. Статус: {status_code}, Ответ: {error_text}")
+        return None, None
+
+    def _tag_existing_torrent(self, qb_hash: str, torrent_id: str):
+        """
+        При 'Fails.' qBittorrent не применяет теги запроса к уже существующему торренту. Тег series-tracker
+        ставится отдельно, иначе зеркало состояния с отбором по тегу считает торрент чужим.
+        """
+        scope_tag = self.get_scope_tag()
+        if scope_tag and not self.add_tags([qb_hash], scope_tag):
+            self.logger.warning("qbittorrent", f"Не удалось пометить тегом '{scope_tag}' уже существующий торрент {torrent_id} ({qb_hash[:8]}).")
+
     def _get_torrent_hash_by_tag(self, tag: str, retries: int = 3, delay: int = 1) -> Optional[str]:
         for i in range(retries):
             if app.debug_manager.is_debug_enabled('qbittorrent'):
@@ -227,6 +422,11 @@ class QBittorrentClient:
             self.logger.debug("qbittorrent", f"Удаление временного тега '{tag}' с торрента {qb_hash[:8]}")
         self._request_with_retries("post", "api/v2/torrents/removeTags", data={"hashes": qb_hash, "tags": tag})
 
+    def add_tags(self, hashes: List[str], tag: str) -> bool:
+        if not hashes: return True
+        response = self._request_with_retries("post", "api/v2/torrents/addTags", data={"hashes": '|'.join(hashes), "tags": tag})
+        return bool(response and response.status_code == 200)
+
     def get_torrents_info(self, hashes: List[str]) -> Optional[List[Dict]]:
         if not hashes: return []
         hashes_str = '|'.join(hashes)
@@ -249,6 +449,29 @@ class QBittorrentClient:
             self.logger.error("qbittorrent", f"Не удалось получить список файлов для хэша {torrent_hash}")
             return None
 
+    def get_torrent_files(self, torrent_hash: str) -> Optional[List[Dict]]:
+        """Полные записи файлов торрента (index, name, size, priority, progress)."""
+        if not torrent_hash:
+            return None
+        response = self._request_with_retries("get", "api/v2/torrents/files", params={"hash": torrent_hash})
+        if not response or response.status_code != 200:
+            self.logger.error("qbittorrent", f"Не удалось получить список файлов для хэша {torrent_hash}")
+            return None
+        files_data = response.json()
+        # Поле 'index' есть начиная с WebAPI 2.8.2; в старых версиях индекс - позиция в списке
+        for position, file_data in enumerate(files_data):
+            file_data.setdefault('index', position)
+        return files_data
+
+    def set_file_priority(self, torrent_hash: str, file_indexes: List[int], priority: int) -> bool:
+        """Устанавливает приоритет файлов торрента (0 - не скачивать, 1 - обычный)."""
+        if not file_indexes: return True
+        response = self._request_with_retries(
+            "post", "api/v2/torrents/filePrio",
+            data={"hash": torrent_hash, "id": '|'.join(str(i) for i in file_indexes), "priority": priority}
+        )
+        return bool(response and response.status_code == 200)
+
     def rename_file(self, torrent_hash: str, old_path: str, new_path: str) -> bool:
         self.logger.info("qbittorrent", f"Переименование файла в торренте {torrent_hash}: '{old_path}' -> '{new_path}'")
         response = self._request_with_retries(
@@ -264,27 +487,42 @@ class QBittorrentClient:
             self.logger.error(f"qbittorrent", f"Ошибка переименования файла. Статус: {status}, Ответ: {text}")
             return False
             
+    def rename_folder(self, torrent_hash: str, old_path: str, new_path: str) -> bool:
+        self.logger.info("qbittorrent", f"Переименование каталога в торренте {torrent_hash}: '{old_path}' -> '{new_path}'")
+        response = self._request_with_retries(
+            "post", "api/v2/torrents/renameFolder", data={"hash": torrent_hash, "oldPath": old_path, "newPath": new_path}
+        )
+        if response and response.status_code == 200:
+            return True
+        status = response.status_code if response is not None else 'N/A'
+        text = response.text if response is not None else 'No response'
+        self.logger.error("qbittorrent", f"Ошибка переименования каталога. Статус: {status}, Ответ: {text}")
+        return False
+
     def sync_main_data(self, rid: int) -> Optional[Dict]:
         response = self._request_with_retries(
             "get", "api/v2/sync/maindata", 
             request_timeout=30,
             params={"rid": rid}
         )
-        return response.json() if response and response.status_code == 200 else None
+        if not response or response.status_code != 200:
+            return None
+        self._record_maindata_payload(len(response.content))
+        return response.json()
 
     def recheck_torrents(self, hashes: List[str]):
         if not hashes: return
-        self.logger.info("qbittorrent", f"Запуск recheck для торрентов: {', '.join(h[:8] for h in hashes)}")
+        self.logger.info("qbittorrent", f"Запуск recheck для торрентов ({len(hashes)}): {_format_hashes(hashes)}")
         self._request_with_retries("post", "api/v2/torrents/recheck", data={"hashes": '|'.join(hashes)})
 
     def resume_torrents(self, hashes: List[str]):
         if not hashes: return
-        self.logger.info("qbittorrent", f"Запуск resume для торрентов: {', '.join(h[:8] for h in hashes)}")
+        self.logger.info("qbittorrent", f"Запуск resume для торрентов ({len(hashes)}): {_format_hashes(hashes)}")
         self._request_with_retries("post", "api/v2/torrents/resume", data={"hashes": '|'.join(hashes)})
         
     def pause_torrents(self, hashes: List[str]):
         if not hashes: return
-        self.logger.info("qbittorrent", f"Постановка на паузу торрентов: {', '.join(h[:8] for h in hashes)}")
+        self.logger.info("qbittorrent", f"Постановка на паузу торрентов ({len(hashes)}): {_format_hashes(hashes)}")
         self._request_with_retries("post", "api/v2/torrents/pause", data={"hashes": '|'.join(hashes)})
 
     def delete_torrents(self, hashes: List[str], delete_files: bool):
@@ -306,4 +544,103 @@ class QBittorrentClient:
             status = response.status_code if response is not None else 'N/A'
             text = response.text if response is not None else 'No response'
             self.logger.error(f"qbittorrent", f"Ошибка перемещения торрента. Статус: {status}, Ответ: {text}")
-            return False
\ No newline at end of file
+            return False
+
+def _format_hashes(hashes: List[str], limit: int = 10) -> str:
+    """Короткие хеши для лога; при пакетной команде перечисляются только первые limit."""
+    shown = ', '.join(h[:8] for h in hashes[:limit])
+    return f"{shown} и еще {len(hashes) - limit}" if len(hashes) > limit else shown
+
+_shared_clients: Dict[str, QBittorrentClient] = {}
+_shared_client_lock = threading.Lock()
+
+
+def get_qbittorrent_client(db: Database, logger: Logger, instance: Optional[str] = None) -> QBittorrentClient:
+    """
+    Возвращает общий для процесса клиент экземпляра qBittorrent: один SID, один пул keep-alive соединений.
+    Без instance - основной экземпляр. Размер пула задается настройкой 'qbittorrent_pool_size'. Требует контекста приложения.
+    """
+    instance = instance or DEFAULT_INSTANCE
+    client = _shared_clients.get(instance)
+    if client is None:
+        with _shared_client_lock:
+            client = _shared_clients.get(instance)
+            if client is None:
+                try:
+                    pool_size = int(db.get_setting('qbittorrent_pool_size', 10))
+                except (ValueError, TypeError):
+                    pool_size = 10
+                client = QBittorrentClient(AuthManager(db, logger), db, logger, pool_size=max(1, pool_size), instance=instance)
+                _shared_clients[instance] = client
+                logger.info("qbittorrent", f"Создан общий клиент {instance} с пулом на {pool_size} соединений.")
+    return client
+
+
+def reset_qbittorrent_client(instance: str):
+    """Сбрасывает клиент экземпляра после изменения его адреса или учетных данных."""
+    with _shared_client_lock:
+        _shared_clients.pop(instance, None)
+
+
+def list_qbittorrent_instances(db: Database) -> List[str]:
+    """Имена настроенных экземпляров. Основной возвращается всегда, даже если еще не настроен."""
+    names = [i['name'] for i in db.get_qbittorrent_instances()]
+    if DEFAULT_INSTANCE not in names:
+        names.insert(0, DEFAULT_INSTANCE)
+    return names
+
+
+def _get_path_map(db: Database) -> Dict[str, List[str]]:
+    try:
+        path_map = json.loads(db.get_setting('qbittorrent_path_map', '{}') or '{}')
+    except (ValueError, TypeError):
+        return {}
+    return {name: ([prefixes] if isinstance(prefixes, str) else list(prefixes)) for name, prefixes in path_map.items()}
+
+
+def choose_qbittorrent_instance(db: Database, logger: Logger, save_path: Optional[str] = None, series_id: Optional[int] = None) -> str:
+    """
+    Выбирает экземпляр для нового торрента по политике 'qbittorrent_placement':
+    least_loaded - меньше всего активных торрентов; by_save_path - по префиксу пути из 'qbittorrent_path_map'
+    ({"qbittorrent_nas": ["/mnt/nas"]}); by_series - туда же, где уже лежат торренты сериала.
+    Если политика не дала ответа, используется least_loaded.
+    """
+    instances = list_qbittorrent_instances(db)
+    if len(instances) == 1:
+        return instances[0]
+    policy = db.get_setting('qbittorrent_placement', DEFAULT_PLACEMENT)
+
+    if policy == 'by_save_path' and save_path:
+        best_name, best_len = None, -1
+        normalized = save_path.replace('\\', '/')
+        for name, prefixes in _get_path_map(db).items():
+            if name not in instances:
+                continue
+            for prefix in prefixes:
+                prefix = prefix.replace('\\', '/').rstrip('/')
+                if (normalized == prefix or normalized.startswith(prefix + '/')) and len(prefix) > best_len:
+                    best_name, best_len = name, len(prefix)
+        if best_name:
+            return best_name
+
+    if policy == 'by_series' and series_id is not None:
+        for torrent in db.get_torrents(series_id):
+            instance = torrent.get('qb_instance') or DEFAULT_INSTANCE
+            if torrent.get('qb_hash') and instance in instances:
+                return instance
+
+    counts = db.get_active_torrent_counts_by_instance()
+    counts[DEFAULT_INSTANCE] = counts.pop(DEFAULT_INSTANCE, 0) + counts.pop(None, 0)
+    chosen = min(instances, key=lambda name: (counts.get(name, 0), instances.index(name)))
+    if app.debug_manager.is_debug_enabled('qbittorrent'):
+        logger.debug("qbittorrent", f"Размещение ({policy}): выбран {chosen}, нагрузка {counts}")
+    return chosen
+
+
+def group_hashes_by_instance(db: Database, hashes: List[str]) -> Dict[str, List[str]]:
+    """Раскладывает хеши по экземплярам qBittorrent, которым принадлежат торренты."""
+    owners = db.get_torrent_instances_by_hashes(hashes)
+    groups: Dict[str, List[str]] = {}
+    for torrent_hash in hashes:
+        groups.setdefault(owners.get(torrent_hash) or DEFAULT_INSTANCE, []).append(torrent_hash)
+    return groups
@@ -0,0 +1,202 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+from logger import Logger
+
+DEFAULT_INSTANCE = 'qbittorrent'
+
+
+class QBittorrentStateMirror:
+    """
+    Зеркало состояния qBittorrent в памяти процесса.
+    Поддерживается инкрементальными дельтами sync/maindata (по rid), которые
+    получает единственный цикл опроса (StatefulAgent). Все остальные компоненты
+    читают состояние торрентов отсюда, не обращаясь к torrents/info.
+
+    Если задан scope_tag, полные записи хранятся только для торрентов с этим тегом
+    (и для явно принятых через adopt хешей); для остальных запоминается только хеш.
+
+    При нескольких экземплярах qBittorrent rid и время синхронизации ведутся для каждого
+    экземпляра отдельно, а для каждого хеша запоминается экземпляр, который его прислал.
+    """
+    def __init__(self, logger: Logger, max_age_seconds: int = 60, scope_tag: Optional[str] = None):
+        self.logger = logger
+        self.max_age_seconds = max_age_seconds
+        self.lock = threading.RLock()
+        self.rids: Dict[str, int] = {DEFAULT_INSTANCE: 0}
+        self.last_sync_times: Dict[str, float] = {DEFAULT_INSTANCE: 0}
+        self.torrents: Dict[str, Dict] = {}
+        self.hash_instances: Dict[str, str] = {}
+        self.server_state: Dict = {}
+        self.scope_tag = scope_tag or None
+        # Хеши, которые отслеживаются независимо от тега (торренты из нашей БД)
+        self.owned_hashes: Set[str] = set()
+        # Чужие торренты: данные не хранятся, нужен только факт их существования
+        self.foreign_hashes: Set[str] = set()
+
+    def _in_scope(self, torrent_hash: str, torrent_data: Dict) -> bool:
+        if not self.scope_tag or torrent_hash in self.owned_hashes:
+            return True
+        tags = torrent_data.get('tags') or ''
+        return self.scope_tag in [t.strip() for t in tags.split(',')]
+
+    @property
+    def rid(self) -> int:
+        return self.get_rid(DEFAULT_INSTANCE)
+
+    def get_rid(self, instance: str = DEFAULT_INSTANCE) -> int:
+        with self.lock:
+            return self.rids.get(instance, 0)
+
+    def set_instances(self, instances: List[str]):
+        """Задает список опрашиваемых экземпляров. Данные удаленных экземпляров выбрасываются."""
+        with self.lock:
+            for instance in list(self.rids):
+                if instance not in instances:
+                    self._drop_instance(instance)
+                    del self.rids[instance]
+                    self.last_sync_times.pop(instance, None)
+            for instance in instances:
+                self.rids.setdefault(instance, 0)
+                self.last_sync_times.setdefault(instance, 0)
+
+    def _drop_instance(self, instance: str) -> Set[str]:
+        dropped = {h for h, owner in self.hash_instances.items() if owner == instance}
+        for torrent_hash in dropped:
+            del self.hash_instances[torrent_hash]
+            self.torrents.pop(torrent_hash, None)
+            self.foreign_hashes.discard(torrent_hash)
+        return dropped
+
+    def get_instance(self, torrent_hash: str) -> Optional[str]:
+        """Экземпляр qBittorrent, в котором зеркало видело торрент."""
+        with self.lock:
+            return self.hash_instances.get(torrent_hash)
+
+    def apply_update(self, updates: Dict, instance: str = DEFAULT_INSTANCE) -> Set[str]:
+        """
+        Применяет ответ sync/maindata экземпляра instance к зеркалу.
+        Возвращает множество хешей, которые изменились (включая удаленные).
+        """
+        with self.lock:
+            changed = set()
+            needs_full_resync = False
+            if updates.get('full_update'):
+                changed.update(h for h, owner in self.hash_instances.items() if owner == instance and h in self.torrents)
+                self._drop_instance(instance)
+                if instance == DEFAULT_INSTANCE:
+                    self.server_state = {}
+
+            for torrent_hash, torrent_data in updates.get('torrents', {}).items():
+                self.hash_instances[torrent_hash] = instance
+                entry = self.torrents.get(torrent_hash)
+                if entry is None:
+                    if torrent_hash in self.foreign_hashes:
+                        # Чужой торрент получил наш тег: в дельте только измененные поля, нужен полный снимок
+                        if 'tags' in torrent_data and self._in_scope(torrent_hash, torrent_data):
+                            needs_full_resync = True
+                        continue
+                    if not self._in_scope(torrent_hash, torrent_data):
+                        self.foreign_hashes.add(torrent_hash)
+                        continue
+                    entry = {'hash': torrent_hash}
+                    self.torrents[torrent_hash] = entry
+                elif 'tags' in torrent_data and not self._in_scope(torrent_hash, torrent_data):
+                    # С торрента сняли наш тег - перестаем хранить его данные
+                    del self.torrents[torrent_hash]
+                    self.foreign_hashes.add(torrent_hash)
+                    changed.add(torrent_hash)
+                    continue
+                entry.update(torrent_data)
+                changed.add(torrent_hash)
+
+            for torrent_hash in updates.get('torrents_removed', []):
+                if self.hash_instances.get(torrent_hash, instance) != instance:
+                    # Торрент переехал в другой экземпляр - его запись принадлежит уже не этому
+                    continue
+                self.hash_instances.pop(torrent_hash, None)
+                self.torrents.pop(torrent_hash, None)
+                self.foreign_hashes.discard(torrent_hash)
+                changed.add(torrent_hash)
+
+            if instance == DEFAULT_INSTANCE:
+                self.server_state.update(updates.get('server_state', {}))
+            self.rids[instance] = 0 if needs_full_resync else updates.get('rid', self.rids.get(instance, 0))
+            self.last_sync_times[instance] = time.time()
+            return changed
+
+    def reset(self, instance: Optional[str] = None):
+        """Сбрасывает rid (одного экземпляра или всех): следующий запрос получит полный снимок состояния."""
+        with self.lock:
+            for name in ([instance] if instance else list(self.rids)):
+                self.rids[name] = 0
+                self.last_sync_times[name] = 0
+
+    def set_scope(self, scope_tag: Optional[str]):
+        """Меняет тег отбора торрентов. Зеркало перестраивается при следующем полном снимке."""
+        with self.lock:
+            scope_tag = scope_tag or None
+            if scope_tag != self.scope_tag:
+                self.scope_tag = scope_tag
+                self.reset()
+
+    def adopt(self, hashes: List[str]):
+        """Отслеживает указанные хеши независимо от тега (например, торренты, добавленные до введения тега)."""
+        with self.lock:
+            new_hashes = set(hashes) - self.owned_hashes
+            self.owned_hashes.update(new_hashes)
+            for torrent_hash in new_hashes & self.foreign_hashes:
+                # Данные этих торрентов не хранились - нужен полный снимок их экземпляра
+                self.reset(self.hash_instances.get(torrent_hash, DEFAULT_INSTANCE))
+
+    def is_synced(self, instances: Optional[Set[str]] = None) -> bool:
+        """Зеркало считается актуальным, если каждый экземпляр (или каждый из указанных) синхронизировался недавно."""
+        with self.lock:
+            now = time.time()
+            times = [self.last_sync_times.get(i, 0) for i in instances] if instances else self.last_sync_times.values()
+            return all(t > 0 and (now - t) <= self.max_age_seconds for t in times)
+
+    def get_torrent(self, torrent_hash: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.torrents.get(torrent_hash)
+            return dict(entry) if entry else None
+
+    def read_torrent(self, torrent_hash: str, reader: Callable[[Dict], None]) -> bool:
+        """Передает запись торрента в reader под блокировкой зеркала, без копирования. False, если торрента нет."""
+        with self.lock:
+            entry = self.torrents.get(torrent_hash)
+            if entry is None:
+                return False
+            reader(entry)
+            return True
+
+    def get_torrents_info(self, hashes: List[str]) -> Optional[List[Dict]]:
+        """
+        Аналог QBittorrentClient.get_torrents_info, работающий по зеркалу.
+        Возвращает None, если зеркало еще не синхронизировано или устарело.
+        Проверяется свежесть только тех экземпляров, где лежат запрошенные торренты:
+        недоступный второй экземпляр не мешает читать торренты первого.
+        """
+        with self.lock:
+            owners = {self.hash_instances.get(h) for h in hashes}
+            if not self.is_synced(None if None in owners else owners):
+                return None
+            foreign = [h for h in hashes if h in self.foreign_hashes]
+            if foreign:
+                # Торрент из БД без нашего тега: принимаем его и отвечаем после полного снимка
+                self.logger.warning("qbittorrent", f"{len(foreign)} торрент(ов) из запроса не имеют тега '{self.scope_tag}'. Они будут отслеживаться после полной синхронизации.")
+                self.adopt(foreign)
+                return None
+            return [dict(self.torrents[h]) for h in hashes if h in self.torrents]
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                'scope_tag': self.scope_tag,
+                'rid': self.get_rid(DEFAULT_INSTANCE),
+                'rids': dict(self.rids),
+                'tracked_torrents': len(self.torrents),
+                'foreign_torrents': len(self.foreign_hashes),
+                'owned_hashes': len(self.owned_hashes),
+                'synced': self.is_synced(),
+            }
@@ -9,6 +9,11 @@ from filename_formatter import FilenameFormatter
 
 media_bp = Blueprint('media_api', __name__, url_prefix='/api')
 
+def _promote_slicing_task(task_id: int):
+    # Агент будится после коммита задачи: до него он ее еще не увидит
+    app.priority_lane.promote('slicing', task_id, wake=False)
+
+
 @media_bp.route('/series/<int:series_id>/media-items', methods=['GET'])
 def get_media_items_for_series(series_id):
     """Возвращает все медиа-элементы для указанного сериала."""
@@ -131,10 +136,13 @@ def create_slice_task(unique_id):
         app.db.delete_slicing_task_by_uid(unique_id)
 
         # Создаем новую задачу в очереди и обновляем статус
-        app.db.create_slicing_task(unique_id, item['series_id'])
+        # Ручной запуск нарезки идет в приоритетной полосе, в обход плановой очереди. Задача попадает
+        # в полосу до коммита, иначе агент мог бы успеть взять ее в обычную очередь
+        app.db.create_slicing_task(unique_id, item['series_id'], before_commit=_promote_slicing_task)
         app.db.update_media_item_slicing_status(unique_id, 'pending')
         
         app.slicing_agent._broadcast_queue_update()
+        app.slicing_agent.wake()
         
         return jsonify({"success": True, "message": "Задача на нарезку успешно создана."})
     except Exception as e:
@@ -440,10 +448,11 @@ def create_slice_task_with_filter(unique_id):
         app.db.delete_slicing_task_by_uid(unique_id)
 
         # Создаем новую задачу в очереди и обновляем статус
-        app.db.create_slicing_task(unique_id, item['series_id'])
+        app.db.create_slicing_task(unique_id, item['series_id'], before_commit=_promote_slicing_task)
         app.db.update_media_item_slicing_status(unique_id, 'pending')
         
         app.slicing_agent._broadcast_queue_update()
+        app.slicing_agent.wake()
         
         return jsonify({
             "success": True,
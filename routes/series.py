@@ -5,8 +5,7 @@ import threading
 import time
 from flask import Blueprint, jsonify, request, current_app as app
 
-from auth import AuthManager
-from qbittorrent import QBittorrentClient
+from qbittorrent import get_qbittorrent_client, group_hashes_by_instance
 from scanner import perform_series_scan, generate_media_item_id
 from file_cache import delete_from_cache
 from rule_engine import RuleEngine
@@ -198,7 +197,8 @@ def reprocess_vk_files_route(series_id):
         task_created = app.db.create_renaming_task(task_data)
         
         if task_created:
-            app.renaming_agent.trigger()
+            # Ручная переобработка идет в приоритетной полосе (promote пробуждает агента переименования)
+            app.priority_lane.promote('series', series_id)
             return jsonify({"success": True, "message": "Задача на переобработку файлов VK-сериала создана."})
         else:
             return jsonify({"success": False, "error": "Активная задача на переобработку уже выполняется."}), 409
@@ -415,8 +415,8 @@ def reprocess_series_torrents_route(series_id):
         task_created = app.db.create_renaming_task(task_data)
         
         if task_created:
-            # "Пробуждаем" агента, чтобы он немедленно начал работу
-            app.renaming_agent.trigger()
+            # Ставим сериал в приоритетную полосу: это "пробуждает" агента, и он немедленно начинает работу
+            app.priority_lane.promote('series', series_id)
             return jsonify({"success": True, "message": "Задача на переобработку файлов создана и запущена в фоновом режиме."})
         else:
             return jsonify({"success": False, "error": "Задача на переобработку уже выполняется."}), 409
@@ -514,8 +514,8 @@ def delete_series(series_id):
         app.logger.warning("routes", f"Удаление записей торрентов для сериала {series_id} из qBittorrent.")
         hashes_to_delete = [t['qb_hash'] for t in torrents_to_delete if t.get('qb_hash')]
         if hashes_to_delete:
-            qb_client = QBittorrentClient(AuthManager(app.db, app.logger), app.db, app.logger)
-            qb_client.delete_torrents(hashes_to_delete, delete_files=False)
+            for instance, instance_hashes in group_hashes_by_instance(app.db, hashes_to_delete).items():
+                get_qbittorrent_client(app.db, app.logger, instance).delete_torrents(instance_hashes, delete_files=False)
             app.logger.info("routes", f"Удалено {len(hashes_to_delete)} записей торрентов из qBittorrent для сериала {series_id}.")
 
     if torrents_to_delete:
@@ -545,6 +545,15 @@ def viewing_heartbeat(series_id):
 @series_bp.route('/<int:series_id>/scan', methods=['POST'])
 def scan_series_route(series_id):
     debug_force_replace = app.db.get_setting('debug_force_replace', 'false') == 'true'
+
+    # По умолчанию сканирование уходит в приоритетную полосу и ответ возвращается сразу после старта.
+    # ?wait=true сохраняет прежнее поведение: ответ после завершения сканирования.
+    if request.args.get('wait', 'false') != 'true':
+        result = app.scanner_agent.trigger_priority_scan(series_id, debug_force_replace=debug_force_replace)
+        if result["success"]:
+            return jsonify(result), 202
+        return jsonify(result), 409
+
     result = perform_series_scan(series_id, app.status_manager, app, debug_force_replace=debug_force_replace)
     if result["success"]:
         return jsonify(result)
@@ -633,8 +642,8 @@ def reset_torrents(series_id):
         # 2. Удаляем из qBittorrent
         hashes_to_delete = [t['qb_hash'] for t in torrents_to_delete if t.get('qb_hash')]
         if hashes_to_delete:
-            qb_client = QBittorrentClient(AuthManager(app.db, app.logger), app.db, app.logger)
-            qb_client.delete_torrents(hashes_to_delete, delete_files=True)
+            for instance, instance_hashes in group_hashes_by_instance(app.db, hashes_to_delete).items():
+                get_qbittorrent_client(app.db, app.logger, instance).delete_torrents(instance_hashes, delete_files=True)
             app.logger.info("series_api", f"Удалено {len(hashes_to_delete)} торрентов из qBittorrent для series_id {series_id}.")
 
         # 3. Очищаем кэш .torrent файлов
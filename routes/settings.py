@@ -4,12 +4,11 @@ import json
 from flask import Blueprint, jsonify, request, current_app as app
 
 from auth import AuthManager
-from parsers.kinozal_parser import KinozalParser
-from parsers.anilibria_parser import AnilibriaParser
-from parsers.astar_parser import AstarParser
-from parsers.anilibria_tv_parser import AnilibriaTvParser
-from parsers.rutracker_parser import RuTrackerParser
+from qbittorrent import DEFAULT_SCOPE_TAG, DEFAULT_INSTANCE, DEFAULT_PLACEMENT, PLACEMENT_POLICIES, reset_qbittorrent_client
+from parsers import create_parser
 from utils.tracker_resolver import TrackerResolver
+from utils.rate_limiter import DEFAULT_LIMITS, get_rate_limiter
+from scrapers.vk_scraper import VKScraper
 
 settings_bp = Blueprint('settings_api', __name__, url_prefix='/api')
 
@@ -29,6 +28,8 @@ LOGGING_MODULES = {
         {'name': 'scanner', 'description': 'Каждый этап сканирования сериала.'},
         {'name': 'agent', 'description': 'Жизненный цикл обработки торрента.'},
         {'name': 'monitoring_agent', 'description': 'Работа в фоновом режиме (плановые сканы, обновления).'},
+        {'name': 'mirror_health', 'description': 'Статистика зеркал трекеров и фоновая проверка упавших зеркал.'},
+        {'name': 'rate_limiter', 'description': 'Задержки запросов к трекерам, VK и TMDB общим ограничителем.'},
         {'name': 'downloader_agent', 'description': 'Управление очередью и загрузкой видео.'},
     ],
     "API и Обработка запросов": [
@@ -99,23 +100,10 @@ def parse_url():
             return jsonify({"error": f"Не удалось определить трекер для URL: {url}"}), 400
 
         parser_class_name = tracker_info['parser_class']
-        parser_classes = {
-            'KinozalParser': KinozalParser,
-            'AnilibriaParser': AnilibriaParser,
-            'AnilibriaTvParser': AnilibriaTvParser,
-            'AstarParser': AstarParser,
-            'RuTrackerParser': RuTrackerParser
-        }
-        
-        parser_class = parser_classes.get(parser_class_name)
-        if not parser_class:
+        # Модуль парсера импортируется при первом обращении; Kinozal и RuTracker получают AuthManager
+        parser = create_parser(parser_class_name, auth_manager, app.db, app.logger)
+        if not parser:
             return jsonify({"error": f"Парсер с классом '{parser_class_name}' не найден"}), 500
-        
-        # Создаем экземпляр парсера, УЧИТЫВАЯ РАЗНЫЕ АРГУМЕНТЫ
-        if parser_class_name in ['KinozalParser', 'RuTrackerParser']:
-            parser = parser_class(auth_manager, app.db, app.logger)
-        else:
-            parser = parser_class(app.db, app.logger)
 
     except Exception as e:
          return jsonify({"error": f"Ошибка при инициализации парсера: {e}"}), 500
@@ -190,6 +178,129 @@ def handle_parallel_downloads():
     value = app.db.get_setting('max_parallel_downloads', 2)
     return jsonify({"value": int(value)})
 
+@settings_bp.route('/settings/parallel_slicing', methods=['GET', 'POST'])
+def handle_parallel_slicing():
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'value' in data:
+            app.db.set_setting('max_parallel_slicing', str(data['value']))
+        if 'per_device' in data:
+            app.db.set_setting('max_slicing_per_device', str(data['per_device']))
+        return jsonify({"success": True})
+    
+    value = app.db.get_setting('max_parallel_slicing', 2)
+    per_device = app.db.get_setting('max_slicing_per_device', 1)
+    return jsonify({"value": int(value), "per_device": int(per_device)})
+
+@settings_bp.route('/settings/parallel_renaming', methods=['GET', 'POST'])
+def handle_parallel_renaming():
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'value' in data:
+            app.db.set_setting('max_parallel_renaming', str(data['value']))
+            app.renaming_agent.trigger()
+        return jsonify({"success": True})
+    
+    value = app.db.get_setting('max_parallel_renaming', 3)
+    return jsonify({"value": int(value)})
+
+@settings_bp.route('/settings/qbittorrent_tag', methods=['GET', 'POST'])
+def handle_qbittorrent_tag():
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'value' in data:
+            tag = str(data['value']).strip()
+            app.db.set_setting('qbittorrent_tag', tag)
+            # Новые торренты получают тег сразу; перенос старых выполнит агент при следующем запуске
+            app.qb_state.set_scope(tag)
+            app.qb_state.adopt(app.db.get_all_torrent_hashes())
+        return jsonify({"success": True})
+
+    return jsonify({"value": app.db.get_setting('qbittorrent_tag', DEFAULT_SCOPE_TAG)})
+
+@settings_bp.route('/settings/qbittorrent_instances', methods=['GET', 'POST'])
+def handle_qbittorrent_instances():
+    """Список экземпляров qBittorrent. Основной - 'qbittorrent', дополнительные - 'qbittorrent_<имя>'."""
+    if request.method == 'POST':
+        data = request.get_json()
+        name = str(data.get('name', '')).strip()
+        if name != DEFAULT_INSTANCE and not re.fullmatch(r'qbittorrent_[A-Za-z0-9_-]+', name):
+            return jsonify({"success": False, "error": "Имя экземпляра должно иметь вид 'qbittorrent_<имя>'"}), 400
+        if data.get('delete'):
+            if name == DEFAULT_INSTANCE:
+                return jsonify({"success": False, "error": "Основной экземпляр удалить нельзя"}), 400
+            app.db.delete_auth(name)
+        else:
+            app.db.add_auth(name, data.get('username'), data.get('password'), data.get('url'))
+        # Клиент с новыми адресом или учетными данными создается при следующем обращении
+        reset_qbittorrent_client(name)
+        return jsonify({"success": True})
+
+    return jsonify(app.db.get_qbittorrent_instances())
+
+@settings_bp.route('/settings/qbittorrent_placement', methods=['GET', 'POST'])
+def handle_qbittorrent_placement():
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'policy' in data:
+            if data['policy'] not in PLACEMENT_POLICIES:
+                return jsonify({"success": False, "error": f"Неизвестная политика размещения: {data['policy']}"}), 400
+            app.db.set_setting('qbittorrent_placement', data['policy'])
+        if 'path_map' in data:
+            app.db.set_setting('qbittorrent_path_map', json.dumps(data['path_map'], ensure_ascii=False))
+        return jsonify({"success": True})
+
+    return jsonify({
+        "policy": app.db.get_setting('qbittorrent_placement', DEFAULT_PLACEMENT),
+        "path_map": json.loads(app.db.get_setting('qbittorrent_path_map', '{}') or '{}'),
+    })
+
+@settings_bp.route('/settings/vk_full_rescan', methods=['GET', 'POST'])
+def handle_vk_full_rescan():
+    """Как часто VK-каналы в режиме get_all сканируются полностью, в часах; между ними - только до известных видео. 0 - всегда полностью."""
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'hours' in data:
+            try:
+                hours = float(data['hours'])
+            except (TypeError, ValueError):
+                return jsonify({"success": False, "error": "Период должен быть числом часов"}), 400
+            if hours < 0:
+                return jsonify({"success": False, "error": "Период не может быть отрицательным"}), 400
+            app.db.set_setting('vk_full_rescan_hours', str(hours))
+        return jsonify({"success": True})
+
+    return jsonify({"hours": float(app.db.get_setting('vk_full_rescan_hours', VKScraper.DEFAULT_FULL_RESCAN_HOURS))})
+
+@settings_bp.route('/settings/rate_limits', methods=['GET', 'POST'])
+def handle_rate_limits():
+    """
+    Пределы запросов к внешним хостам: {"<трекер|трекер:download|хост>": {"rate": в секунду, "burst": N, "daily": N}}.
+    Сохраняются только переопределения; ключ со значением null возвращает предел по умолчанию.
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        overrides = json.loads(app.db.get_setting('rate_limits', '{}') or '{}')
+        for key, value in data.items():
+            if value is None:
+                overrides.pop(key, None)
+                continue
+            try:
+                limit = {'rate': float(value['rate']), 'burst': int(value.get('burst', 1))}
+                if value.get('daily'):
+                    limit['daily'] = int(value['daily'])
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"success": False, "error": f"Некорректный предел для '{key}'"}), 400
+            if limit['rate'] <= 0 or limit['burst'] < 1:
+                return jsonify({"success": False, "error": f"Для '{key}' rate должен быть больше 0, burst - не меньше 1"}), 400
+            overrides[key] = limit
+        app.db.set_setting('rate_limits', json.dumps(overrides))
+        get_rate_limiter(app.db, app.logger).invalidate_config()
+        return jsonify({"success": True})
+
+    overrides = json.loads(app.db.get_setting('rate_limits', '{}') or '{}')
+    return jsonify({"defaults": DEFAULT_LIMITS, "overrides": overrides})
+
 @settings_bp.route('/settings/less_strict_scan', methods=['GET', 'POST'])
 def handle_less_strict_scan_setting():
     setting_key = 'debug_less_strict_scan'
@@ -202,6 +313,18 @@ def handle_less_strict_scan_setting():
     enabled = app.db.get_setting(setting_key, 'false') == 'true'
     return jsonify({"enabled": enabled})
 
+@settings_bp.route('/settings/rolling_selective_download', methods=['GET', 'POST'])
+def handle_rolling_selective_download():
+    setting_key = 'rolling_selective_download'
+    if request.method == 'POST':
+        data = request.get_json()
+        if 'enabled' in data:
+            app.db.set_setting(setting_key, str(data['enabled']).lower())
+        return jsonify({"success": True})
+    
+    enabled = app.db.get_setting(setting_key, 'false') == 'true'
+    return jsonify({"enabled": enabled})
+
 @settings_bp.route('/settings/slicing_delete_source', methods=['GET', 'POST'])
 def handle_slicing_delete_source():
     setting_key = 'slicing_delete_source_file'
@@ -1,6 +1,11 @@
 import json
 import os
 from flask import Blueprint, jsonify, request, Response, current_app as app
+from qbittorrent import get_qbittorrent_client, list_qbittorrent_instances
+from browser_pool import get_browser_pool
+from utils.mirror_hedging import hedging_stats
+from utils.rate_limiter import get_rate_limiter
+from utils.session_store import get_session_store
 
 system_bp = Blueprint('system_api', __name__, url_prefix='/api')
 
@@ -150,10 +155,52 @@ def reset_agent():
     app.logger.info("agent_api", f"Сброс завершен. Очищена очередь агента, сброшено {reset_count} статусов сериалов в БД.")
     return jsonify({"success": True, "message": f"Очередь очищена, статусы {reset_count} сериалов сброшены."})
     
+@system_bp.route('/renaming/metrics', methods=['GET'])
+def get_renaming_metrics():
+    """Возвращает метрики ожидания и выполнения задач переименования по типам."""
+    if not hasattr(app, 'renaming_agent'): return jsonify({})
+    return jsonify(app.renaming_agent.get_metrics())
+
+@system_bp.route('/priority/status', methods=['GET'])
+def get_priority_lane_status():
+    """Возвращает активные приоритетные работы и задержки их старта."""
+    return jsonify(app.priority_lane.get_status())
+
+@system_bp.route('/qbittorrent/metrics', methods=['GET'])
+def get_qbittorrent_metrics():
+    """
+    Возвращает счетчики общего клиента qBittorrent (логины, запросы, соединения, объем maindata) и состояние зеркала.
+    Метрики дополнительных экземпляров - в 'instances'.
+    """
+    metrics = get_qbittorrent_client(app.db, app.logger).get_metrics()
+    metrics['instances'] = {name: get_qbittorrent_client(app.db, app.logger, name).get_metrics() for name in list_qbittorrent_instances(app.db)}
+    metrics['state_mirror'] = app.qb_state.get_status()
+    return jsonify(metrics)
+
+@system_bp.route('/browser_pool/status', methods=['GET'])
+def get_browser_pool_status():
+    """Возвращает состояние пула браузеров парсеров: запуски, перезапуски, ожидание и длительность загрузок, RSS."""
+    return jsonify(get_browser_pool(app.db, app.logger).get_status())
+
+@system_bp.route('/rate_limiter/metrics', methods=['GET'])
+def get_rate_limiter_metrics():
+    """Возвращает по каждому хосту/трекеру: предел, число запросов, отложенные и отклоненные, ожидание (среднее, p95, максимум)."""
+    return jsonify(get_rate_limiter(app.db, app.logger).get_metrics())
+
+@system_bp.route('/tracker_sessions/status', methods=['GET'])
+def get_tracker_sessions_status():
+    """Возвращает сохраненные сессии трекеров (без cookies): действительность, время входа и использования, число входов."""
+    return jsonify(get_session_store(app.db, app.logger).get_status())
+
 @system_bp.route('/scanner/status', methods=['GET'])
 def get_scanner_status():
     return jsonify(app.scanner_agent.get_status())
 
+@system_bp.route('/scanner/mirror_metrics', methods=['GET'])
+def get_scanner_mirror_metrics():
+    """Возвращает время до результата сканирования по трекерам, число хеджированных запросов и победы зеркал."""
+    return jsonify(hedging_stats.get_metrics())
+
 @system_bp.route('/scanner/settings', methods=['POST'])
 def update_scanner_settings():
     data = request.get_json()
@@ -161,6 +208,11 @@ def update_scanner_settings():
         app.db.set_setting('scanner_agent_enabled', str(data['enabled']).lower())
     if 'interval' in data:
         app.db.set_setting('scan_interval_minutes', str(data['interval']))
+    if 'mirror_hedge_delay' in data:
+        try:
+            app.db.set_setting('scan_mirror_hedge_delay', str(max(0.0, float(data['mirror_hedge_delay']))))
+        except (ValueError, TypeError):
+            return jsonify({"success": False, "error": "Задержка хеджирования должна быть числом"}), 400
     
     if 'interval' in data and app.scanner_agent.get_status()['scanner_enabled']:
          app.scanner_agent.trigger_scan_all()
@@ -1,4 +1,5 @@
 from flask import Blueprint, jsonify, request, current_app as app
+from utils.mirror_health import summarize_mirror_health
 
 trackers_bp = Blueprint('trackers_api', __name__, url_prefix='/api/trackers')
 
@@ -7,6 +8,9 @@ def get_trackers():
     """Возвращает список всех трекеров и их настроек."""
     try:
         trackers = app.db.get_all_trackers()
+        for tracker in trackers:
+            # Вместо сырой истории исходов отдается сводка: доля успехов, p50/p95 задержки, последний сбой
+            tracker['mirror_health'] = summarize_mirror_health(tracker)
         return jsonify(trackers)
     except Exception as e:
         app.logger.error("trackers_api", f"Ошибка получения списка трекеров: {e}", exc_info=True)
@@ -16,6 +16,9 @@ from agents.renaming_agent import RenamingAgent
 from routes import init_all_routes
 from debug_manager import DebugManager
 from status_manager import StatusManager
+from qbittorrent_state import QBittorrentStateMirror
+from priority_lane import PriorityLane
+from browser_pool import shutdown_browser_pool
 
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -29,6 +32,8 @@ set_db_for_logging(app.db)
 app.debug_manager = DebugManager(app.db)
 app.sse_broadcaster = sse_broadcaster
 app.status_manager = StatusManager(app, app.db, app.sse_broadcaster, app.logger)
+app.qb_state = QBittorrentStateMirror(app.logger)
+app.priority_lane = PriorityLane(app.logger)
 
 init_all_routes(app)
 
@@ -77,6 +82,7 @@ def on_exit(server):
     app.downloader_agent.shutdown()
     app.slicing_agent.shutdown()
     app.renaming_agent.shutdown()
+    shutdown_browser_pool()
     
     # Даем агентам немного времени на завершение.
     # Так как CHECK_INTERVAL = 10, дадим им 11 секунд.
@@ -97,6 +103,7 @@ def shutdown_agents():
     monitoring_agent.shutdown()
     downloader_agent.shutdown()
     slicing_agent.shutdown()
+    shutdown_browser_pool()
 
 # Регистрируем обработчик для сигналов завершения
 signal.signal(signal.SIGTERM, signal_handler)
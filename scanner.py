@@ -8,21 +8,20 @@ from urllib.parse import urlparse
 
 from auth import AuthManager
 from db import Database
-from qbittorrent import QBittorrentClient
-from parsers.kinozal_parser import KinozalParser
-from parsers.anilibria_parser import AnilibriaParser
-from parsers.astar_parser import AstarParser
-from parsers.anilibria_tv_parser import AnilibriaTvParser
-from parsers.rutracker_parser import RuTrackerParser
+from qbittorrent import get_qbittorrent_client, choose_qbittorrent_instance, DEFAULT_INSTANCE
+from parsers import create_parser, get_parser_class, ERROR_PARSE, ERROR_TRANSPORT
 from scrapers.vk_scraper import VKScraper
 from rule_engine import RuleEngine
 from smart_collector import SmartCollector
 from filename_formatter import FilenameFormatter
 from status_manager import StatusManager
 from logic.task_creator import create_renaming_tasks_for_series
+from logic.renaming_processor import build_inherited_file_records
 from logic.metadata_processor import build_final_metadata
 from logic.metadata_processor import build_final_metadata
 from utils.tracker_resolver import TrackerResolver
+from utils.mirror_hedging import fetch_with_hedging, get_hedge_delay
+from utils.mirror_health import order_scan_urls, record_mirror_result, record_mirror_parse_error
 from utils.tmdb_client import TMDBClient
 
 def generate_torrent_id(link, date_time):
@@ -126,7 +125,7 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                 channel_url, query = series['url'].split('|', 1)
                 search_mode = series.get('vk_search_mode', 'search')
                 scraper = VKScraper(flask_app.db, flask_app.logger)
-                scraped_videos = scraper.scrape_video_data(channel_url, query, search_mode)
+                scraped_videos = scraper.scrape_video_data(channel_url, query, search_mode, series_id=series_id)
 
                 engine = RuleEngine(flask_app.db, flask_app.logger)
                 profile_id = series.get('parser_profile_id')
@@ -167,7 +166,8 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     candidates_to_save.append(db_item)
                 
                 if candidates_to_save:
-                    flask_app.db.add_or_update_media_items(candidates_to_save)
+                    # После инкрементального сканирования в списке только новые видео: старые записи не удаляются
+                    flask_app.db.add_or_update_media_items(candidates_to_save, keep_missing=scraper.incremental)
                     flask_app.logger.info("scanner", f"Сохранено/обновлено {len(candidates_to_save)} кандидатов в БД.")
 
                 flask_app.logger.info("scanner", f"VK-Сериал ID {series_id}: Этап 2 - Запуск SmartCollector для обновления плана.")
@@ -208,7 +208,7 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                 create_renaming_tasks_for_series(series_id, flask_app)
 
                 status_manager.sync_vk_statuses(series_id)
-                return {"success": True, "message": "Сканирование и планирование для VK-сериала завершены."}
+                return {"success": True, "tasks_created": tasks_created, "message": "Сканирование и планирование для VK-сериала завершены."}
             
             else:
                 auth_manager = AuthManager(flask_app.db, flask_app.logger)
@@ -222,41 +222,25 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     raise Exception(f"Не удалось определить трекер для URL: {series['url']}")
 
                 parser_class_name = tracker_info['parser_class']
-                parser_classes = {
-                    'KinozalParser': KinozalParser,
-                    'AnilibriaParser': AnilibriaParser,
-                    'AnilibriaTvParser': AnilibriaTvParser,
-                    'AstarParser': AstarParser,
-                    'RuTrackerParser': RuTrackerParser
-                }
-
-                parser_class = parser_classes.get(parser_class_name)
-                if not parser_class:
+                if not get_parser_class(parser_class_name):
                     raise Exception(f"Парсер с классом '{parser_class_name}' не найден")
 
-                if parser_class_name in ['KinozalParser', 'RuTrackerParser']:
-                    parser = parser_class(auth_manager, flask_app.db, flask_app.logger)
-                else:
-                    parser = parser_class(flask_app.db, flask_app.logger)
-
-                qb_client = QBittorrentClient(auth_manager, flask_app.db, flask_app.logger)
-
                 files_in_db = flask_app.db.get_torrent_files_for_series(series_id)
                 missing_files = [f for f in files_in_db if f.get('status') == 'missing']
 
                 if missing_files:
                     hashes_to_recheck = {f['qb_hash'] for f in missing_files if f.get('qb_hash')}
+                    recheck_torrents = []
                     for qb_hash in hashes_to_recheck:
                         torrent_db_entry = flask_app.db.get_torrent_by_hash(qb_hash)
                         if torrent_db_entry:
                             flask_app.logger.info("scanner", f"Обнаружен отсутствующий файл для торрента {qb_hash[:8]}. Создание задачи для Агента на перепроверку.")
-                            flask_app.agent.add_recheck_task(
-                                torrent_hash=qb_hash,
-                                series_id=series_id,
-                                torrent_id=torrent_db_entry['torrent_id']
-                            )
+                            recheck_torrents.append((qb_hash, torrent_db_entry['torrent_id']))
                         else:
                             flask_app.logger.warning("scanner", f"Не удалось найти торрент в БД по хешу {qb_hash} для создания задачи на recheck.")
+                    # Все задачи добавляются разом: агент отправит recheck для них одним запросом
+                    if recheck_torrents:
+                        flask_app.agent.add_recheck_tasks(series_id, recheck_torrents)
                 
                 task_id = None
                 task_data_torrents = []
@@ -272,39 +256,53 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     
                     all_db_torrents = flask_app.db.get_torrents(series_id)
                     db_hashes = [t['qb_hash'] for t in all_db_torrents if t.get('qb_hash')]
-                    torrents_in_qb = qb_client.get_torrents_info(db_hashes) if db_hashes else []
+                    # Наличие торрентов в qBittorrent берется из общего зеркала; прямой запрос - только если зеркало не синхронизировано
+                    torrents_in_qb = flask_app.qb_state.get_torrents_info(db_hashes) if db_hashes else []
+                    if torrents_in_qb is None:
+                        torrents_in_qb = []
+                        for instance in {t.get('qb_instance') or DEFAULT_INSTANCE for t in all_db_torrents if t.get('qb_hash')}:
+                            instance_hashes = [t['qb_hash'] for t in all_db_torrents if t.get('qb_hash') and (t.get('qb_instance') or DEFAULT_INSTANCE) == instance]
+                            torrents_in_qb.extend(get_qbittorrent_client(flask_app.db, flask_app.logger, instance).get_torrents_info(instance_hashes) or [])
                     hashes_in_qb = {t['hash'] for t in torrents_in_qb} if torrents_in_qb else set()
                     active_db_torrents = [t for t in all_db_torrents if t.get('qb_hash') in hashes_in_qb]
                     
-                    primary_url = series['url']
-                    flask_app.logger.info("scanner", f"Попытка парсинга основного URL: {primary_url}")
-                    
-                    parsed_data = parser.parse_series(primary_url, last_known_torrents=active_db_torrents, debug_force_replace=debug_force_replace)
-                    
-                    if parsed_data.get('error'):
-                        flask_app.logger.warning(f"scanner", f"Основной URL не сработал: {parsed_data.get('error')}. Пробуем зеркала...")
-                        
-                        original_parsed_url = urlparse(primary_url)
-                        failed_domain = original_parsed_url.netloc
-                        
-                        all_mirrors = tracker_info.get('mirrors', [])
-                        fallback_mirrors = [m for m in all_mirrors if m != failed_domain]
-                        
-                        if not fallback_mirrors:
-                            flask_app.logger.warning("scanner", "Других зеркал для переключения не найдено.")
-                        else:
-                            for mirror in fallback_mirrors:
-                                new_url = original_parsed_url._replace(netloc=mirror).geturl()
-                                flask_app.logger.info("scanner", f"Попытка парсинга зеркала: {new_url}")
-                                
-                                current_result = parser.parse_series(new_url, last_known_torrents=active_db_torrents, debug_force_replace=debug_force_replace)
-                                
-                                if not current_result.get('error'):
-                                    parsed_data = current_result
-                                    flask_app.logger.info("scanner", f"Зеркало {mirror} успешно распарсено.")
-                                    break
-                                else:
-                                    flask_app.logger.warning("scanner", f"Ошибка парсинга зеркала {mirror}: {current_result.get('error')}")
+                    series_url = series['url']
+                    series_domain = urlparse(series_url).netloc
+                    # URL переписывается на зеркала в порядке их здоровья: первым идет предпочитаемое зеркало трекера
+                    scan_urls = order_scan_urls(tracker_info, series_url)
+                    primary_url = scan_urls[0]
+                    if primary_url != series_url:
+                        flask_app.logger.info("scanner", f"URL сериала переписан на предпочитаемое зеркало: {primary_url}")
+                    flask_app.logger.info("scanner", f"Попытка парсинга основного URL: {primary_url}" + (f" (зеркал в резерве: {len(scan_urls) - 1})" if len(scan_urls) > 1 else ""))
+
+                    def parse_mirror(url, cancel_event):
+                        # Свой экземпляр парсера на каждое зеркало: попытки идут параллельно и отменяются через cancel_event
+                        mirror_parser = create_parser(parser_class_name, auth_manager, flask_app.db, flask_app.logger)
+                        mirror_parser.cancel_event = cancel_event
+                        started_at = time.time()
+                        result = mirror_parser.parse_series(url, last_known_torrents=active_db_torrents, debug_force_replace=debug_force_replace)
+                        # Попытка, отмененная из-за ответа другого зеркала, не считается сбоем
+                        if not cancel_event.is_set():
+                            mirror = urlparse(url).netloc
+                            error_kind = result.get('error_kind')
+                            if not result.get('error') or error_kind == ERROR_TRANSPORT:
+                                # Здоровье зеркала меняют только успех и сбой доставки (таймаут, соединение, 5xx)
+                                record_mirror_result(flask_app.db, tracker_info['id'], mirror, not result.get('error'),
+                                                     time.time() - started_at, result.get('error'))
+                            elif error_kind == ERROR_PARSE:
+                                flask_app.logger.warning("scanner", f"Зеркало {mirror} доступно, но страница не разобрана: {result['error']}")
+                                record_mirror_parse_error(flask_app.db, tracker_info['id'], mirror, result['error'])
+                        return result
+
+                    # Хеджирование: если основной адрес не ответил за scan_mirror_hedge_delay секунд или упал,
+                    # параллельно запускается следующее зеркало; берется первый успешный результат
+                    parsed_data, winner_url = fetch_with_hedging(flask_app, parse_mirror, scan_urls,
+                                                                 get_hedge_delay(flask_app.db), tracker_info.get('canonical_name', ''))
+                    winner_domain = urlparse(winner_url).netloc if winner_url else None
+                    if winner_url and winner_url != primary_url:
+                        flask_app.logger.info("scanner", f"Зеркало {winner_domain} успешно распарсено.")
+                    elif not winner_url and len(scan_urls) == 1:
+                        flask_app.logger.warning("scanner", "Других зеркал для переключения не найдено.")
 
                     if parsed_data.get('error'):
                         raise Exception(f"Ошибка парсера: {parsed_data['error']}")
@@ -312,6 +310,9 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     all_site_torrents = []
                     for t in parsed_data.get("torrents", []):
                         link_for_id = t.get('raw_link_for_id_gen', t.get('link'))
+                        # ID торрента считается по домену из URL сериала: смена зеркала не должна делать известные торренты новыми
+                        if link_for_id and winner_domain and winner_domain != series_domain and winner_domain in urlparse(link_for_id).netloc:
+                            link_for_id = link_for_id.replace(winner_domain, series_domain, 1)
                         if link_for_id:
                             t["torrent_id"] = generate_torrent_id(link_for_id, t.get("date_time"))
                         all_site_torrents.append(t)
@@ -334,8 +335,8 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                         flask_app.logger.warning("scanner", "РЕЖИМ ОТЛАДКИ: Все активные торренты будут принудительно заменены.")
                         hashes_to_delete = [t['qb_hash'] for t in active_db_torrents]
                         if hashes_to_delete:
-                            qb_client.delete_torrents(hashes_to_delete, delete_files=False)
                             for t in active_db_torrents:
+                                get_qbittorrent_client(flask_app.db, flask_app.logger, t.get('qb_instance')).delete_torrents([t['qb_hash']], delete_files=False)
                                 flask_app.db.update_torrent_by_id(t['id'], {'is_active': False})
                         active_db_torrents = []
 
@@ -370,10 +371,17 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     if str(index) in results_data:
                         continue
                     
-                    new_hash, link_type = qb_client.add_torrent(site_torrent['link'], series['save_path'], site_torrent['torrent_id'])
+                    # Замена остается в экземпляре qBittorrent старого торрента, новый торрент размещается по политике
+                    old_torrent_to_replace = task_item['old_torrent_to_replace']
+                    if old_torrent_to_replace:
+                        instance = old_torrent_to_replace.get('qb_instance') or DEFAULT_INSTANCE
+                    else:
+                        instance = choose_qbittorrent_instance(flask_app.db, flask_app.logger, series['save_path'], series_id)
+                    instance_client = get_qbittorrent_client(flask_app.db, flask_app.logger, instance)
+                    new_hash, link_type = instance_client.add_torrent(site_torrent['link'], series['save_path'], site_torrent['torrent_id'], auth_manager=auth_manager)
 
                     if new_hash:
-                        results_data[str(index)] = {"hash": new_hash, "link_type": link_type}
+                        results_data[str(index)] = {"hash": new_hash, "link_type": link_type, "instance": instance}
                         flask_app.db.update_scan_task_results(task_id, results_data)
                     else:
                         flask_app.logger.warning("scanner", f"Не удалось добавить торрент {site_torrent['torrent_id']} в рамках задачи {task_id}. Пропуск.")
@@ -390,16 +398,27 @@ def perform_series_scan(series_id: int, status_manager: StatusManager, flask_app
                     old_torrent_to_replace = task_item['old_torrent_to_replace']
                     new_hash = result_item['hash']
                     link_type = result_item['link_type']
+                    instance = result_item.get('instance') or DEFAULT_INSTANCE
+                    qb_instance = None if instance == DEFAULT_INSTANCE else instance
                     
                     existing_db_entry = next((t for t in flask_app.db.get_torrents(series_id) if t['torrent_id'] == site_torrent['torrent_id']), None)
                     if existing_db_entry:
-                        flask_app.db.update_torrent_by_id(existing_db_entry['id'], {'is_active': True, 'qb_hash': new_hash})
+                        flask_app.db.update_torrent_by_id(existing_db_entry['id'], {'is_active': True, 'qb_hash': new_hash, 'qb_instance': qb_instance})
                     else:
-                        flask_app.db.add_torrent(series_id, site_torrent, is_active=True, qb_hash=new_hash)
+                        flask_app.db.add_torrent(series_id, site_torrent, is_active=True, qb_hash=new_hash, qb_instance=qb_instance)
 
                     if old_torrent_to_replace:
+                        inherited_files = []
+                        is_rolling = 'astar' not in tracker_info.get('canonical_name', '')
+                        if is_rolling and flask_app.db.get_setting('rolling_selective_download', 'false') == 'true':
+                            # Сведения об уже имеющихся сериях переносятся на новый торрент до очистки старого:
+                            # по ним обработчик переименования снимет эти серии с загрузки
+                            inherited_files = build_inherited_file_records(flask_app.db, old_torrent_to_replace['id'])
                         flask_app.db.deactivate_torrent_and_clear_files(old_torrent_to_replace['id'])
-                        qb_client.delete_torrents([old_torrent_to_replace['qb_hash']], delete_files=False)
+                        get_qbittorrent_client(flask_app.db, flask_app.logger, old_torrent_to_replace.get('qb_instance')).delete_torrents([old_torrent_to_replace['qb_hash']], delete_files=False)
+                        new_torrent_entry = flask_app.db.get_torrent_by_hash(new_hash) if inherited_files else None
+                        if new_torrent_entry:
+                            flask_app.db.add_or_update_torrent_files(new_torrent_entry['id'], inherited_files)
 
                     flask_app.agent.add_task(
                         torrent_hash=new_hash, 
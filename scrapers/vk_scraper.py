@@ -1,19 +1,27 @@
 import requests
 import json
 import os
+import time
 from urllib.parse import urlparse
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from flask import current_app as app
+from utils.rate_limiter import get_rate_limiter
 
 class VKScraper:
     API_VERSION = '5.199'
     BASE_URL = 'https://api.vk.com/method/'
+    # Полное сканирование канала в режиме get_all - не реже раза в столько часов (настройка 'vk_full_rescan_hours')
+    DEFAULT_FULL_RESCAN_HOURS = 24
+    # Сколько id самых новых видео запоминается: по ним пагинация узнает, что дошла до известных видео
+    KNOWN_IDS_LIMIT = 20
 
     def __init__(self, db, logger):
         self.db = db
         self.logger = logger
         self.access_token = self._get_token()
+        # True, если последний scrape_video_data вернул только новые видео (инкрементальное сканирование)
+        self.incremental = False
 
     def _get_token(self) -> str | None:
         vk_auth = self.db.get_auth('vk')
@@ -31,6 +39,7 @@ class VKScraper:
             'v': self.API_VERSION
         }
         try:
+            get_rate_limiter(self.db, self.logger).acquire(self.BASE_URL)
             response = requests.get(f"{self.BASE_URL}utils.resolveScreenName", params=params).json()
             if 'error' in response:
                 self.logger.error(f"vk_scraper", f"Ошибка API: {response['error']['error_msg']}")
@@ -48,20 +57,27 @@ class VKScraper:
             self.logger.error(f"vk_scraper", f"Сетевая ошибка: {e}")
             return None
 
-    def _execute_vk_paginated_request(self, method: str, params: dict) -> list:
-        """Универсальный метод для выполнения запросов к VK API с пагинацией."""
+    def _execute_vk_paginated_request(self, method: str, params: dict, known: Optional[Dict] = None) -> Tuple[list, bool]:
+        """
+        Универсальный метод для выполнения запросов к VK API с пагинацией. Возвращает видео и признак того,
+        что выборка получена без ошибок. known={'date': ..., 'ids': {...}} останавливает пагинацию на странице,
+        где встретилось уже известное видео: видео возвращаются от новых к старым.
+        """
         all_items = []
         offset = 0
         count = 200
+        complete = True
 
         while True:
             params['offset'] = offset
             params['count'] = count
             
             try:
+                get_rate_limiter(self.db, self.logger).acquire(self.BASE_URL)
                 response = requests.get(f"{self.BASE_URL}{method}", params=params).json()
                 if 'error' in response:
                     self.logger.error(f"vk_scraper", f"Ошибка API ({method}): {response['error']['error_msg']}")
+                    complete = False
                     break
 
                 items = response.get('response', {}).get('items', [])
@@ -70,15 +86,59 @@ class VKScraper:
                 
                 all_items.extend(items)
                 self.logger.info("vk_scraper", f"  ...загружено {len(all_items)} видео...")
+                if known and any(item.get('id') in known['ids'] or item.get('date', 0) < known['date'] for item in items):
+                    self.logger.info("vk_scraper", "  ...дальше идут уже известные видео, пагинация остановлена.")
+                    break
                 offset += count
+                # Последняя страница: лишний запрос за пустой страницей не нужен
+                total = response.get('response', {}).get('count')
+                if isinstance(total, int) and offset >= total:
+                    break
                 
             except requests.exceptions.RequestException as e:
                 self.logger.error(f"vk_scraper", f"Сетевая ошибка при вызове {method}: {e}")
+                complete = False
                 break
         
-        return all_items
+        return all_items, complete
 
-    def scrape_video_data(self, channel_url: str, query: str, search_mode: str = 'search') -> List[Dict[str, Any]]:
+    def _get_known_videos(self, series_id: Optional[int], state_key: str) -> Optional[Dict]:
+        """
+        Самые новые видео канала с прошлого сканирования сериала или None, если нужно полное сканирование:
+        состояния нет, сменились канал или запрос, либо с последнего полного сканирования прошло больше
+        'vk_full_rescan_hours' (0 - всегда полное).
+        """
+        if not series_id:
+            return None
+        try:
+            rescan_hours = float(self.db.get_setting('vk_full_rescan_hours', self.DEFAULT_FULL_RESCAN_HOURS))
+        except (TypeError, ValueError):
+            rescan_hours = self.DEFAULT_FULL_RESCAN_HOURS
+        state = self.db.get_series_vk_scan_state(series_id)
+        if rescan_hours <= 0 or state.get('key') != state_key or not state.get('newest_ids'):
+            return None
+        if time.time() - state.get('last_full_scan', 0) >= rescan_hours * 3600:
+            return None
+        return {'date': state['newest_date'], 'ids': set(state['newest_ids']), 'last_full_scan': state['last_full_scan']}
+
+    def _save_known_videos(self, series_id: int, state_key: str, items: list, known: Optional[Dict]):
+        newest = sorted(items, key=lambda item: item.get('date', 0), reverse=True)[:self.KNOWN_IDS_LIMIT]
+        if not newest and known:
+            return
+        self.db.set_series_vk_scan_state(series_id, {
+            'key': state_key,
+            'newest_date': newest[0].get('date', 0) if newest else 0,
+            # Известные id остаются в списке, пока не вытеснены более новыми видео
+            'newest_ids': list(dict.fromkeys([item.get('id') for item in newest] + list(known['ids'] if known else [])))[:self.KNOWN_IDS_LIMIT],
+            'last_full_scan': known['last_full_scan'] if known else time.time(),
+        })
+
+    def scrape_video_data(self, channel_url: str, query: str, search_mode: str = 'search', series_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Видео канала по запросу. С series_id режим get_all инкрементальный: запрашиваются только страницы
+        до уже известных видео, полное сканирование - раз в 'vk_full_rescan_hours'. Тогда результат содержит
+        лишь новые видео и соседние с ними (self.incremental=True): их нужно добавить к сохраненным, а не заменить.
+        """
         if not self.access_token:
             raise ValueError("Токен доступа VK не настроен.")
             
@@ -118,7 +178,8 @@ class VKScraper:
                 search_params = base_params.copy()
                 search_params['q'] = term
                 self.logger.info("vk_scraper", f"Выполняю поиск по запросу: '{term}'...")
-                all_found_videos.extend(self._execute_vk_paginated_request('video.search', search_params))
+                found_videos, _ = self._execute_vk_paginated_request('video.search', search_params)
+                all_found_videos.extend(found_videos)
             
             seen_ids = set()
             for video in all_found_videos:
@@ -127,8 +188,17 @@ class VKScraper:
                     seen_ids.add(video.get('id'))
 
         else: # search_mode == 'get_all'
-            self.logger.info("vk_scraper", f"Режим: ПОЛНОЕ СКАНИРОВАНИЕ (video.get). Фильтры: {query_terms}")
-            all_channel_videos = self._execute_vk_paginated_request('video.get', base_params)
+            state_key = f"{owner_id}|{query}"
+            known = self._get_known_videos(series_id, state_key)
+            if known:
+                self.logger.info("vk_scraper", f"Режим: ИНКРЕМЕНТАЛЬНОЕ СКАНИРОВАНИЕ (video.get) до известных видео. Фильтры: {query_terms}")
+            else:
+                self.logger.info("vk_scraper", f"Режим: ПОЛНОЕ СКАНИРОВАНИЕ (video.get). Фильтры: {query_terms}")
+            all_channel_videos, complete = self._execute_vk_paginated_request('video.get', base_params, known)
+            self.incremental = known is not None
+            # Неполная выборка не должна сдвигать границу известных видео и время полного сканирования
+            if series_id and complete:
+                self._save_known_videos(series_id, state_key, all_channel_videos, known)
             
             if not query_terms:
                 videos = all_channel_videos
@@ -189,6 +189,13 @@ const app = createApp({
                 }
             });
 
+            this.eventSource.addEventListener('scan_finished', (event) => {
+                const data = JSON.parse(event.data);
+                const series = this.series.find(s => s.id === data.series_id);
+                const prefix = series ? `${series.name}: ` : '';
+                this.showToast(prefix + data.message, data.success ? 'success' : 'danger');
+            });
+
             this.eventSource.addEventListener('renaming_complete', (event) => {
                 const data = JSON.parse(event.data);
                 this.loadInitialSeries();
@@ -389,11 +396,8 @@ const app = createApp({
                 if (!scanResponse.ok) {
                     throw new Error(scanData.error || `Ошибка сканирования (статус ${scanResponse.status})`);
                 }
-                let message = "Сканирование завершено.";
-                if (scanData.tasks_created > 0) {
-                    message = `Создано задач для агента: ${scanData.tasks_created}.`;
-                }
-                this.showToast(message, 'success');
+                // Сканирование выполняется в фоне: итог придет событием scan_finished
+                this.showToast(scanData.message || "Сканирование запущено.", 'info');
             } catch (error) {
                 this.showToast(error.message, 'danger');
             } finally { this.activeSeriesId = null; }
@@ -0,0 +1,76 @@
+import os
+import re
+import sys
+
+import pytest
+from flask import Flask
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'benchmarks'))
+
+from auth import AuthManager
+from db import Database
+from debug_manager import DebugManager
+from fake_qbittorrent import FakeQBittorrentServer, SimulatorConfig
+from logic import renaming_processor
+from logic.renaming_processor import process_and_rename_torrent_files
+from qbittorrent import QBittorrentClient
+
+
+class _QuietLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    warning = error = debug = info
+
+
+def _process_videos(self, profile_id, videos):
+    results = []
+    for video in videos:
+        match = re.search(r'E(\d+)', video['title'])
+        results.append({'result': {'extracted': {'episode': int(match.group(1))} if match else {}}})
+    return results
+
+
+@pytest.fixture
+def qb_server():
+    server = FakeQBittorrentServer(config=SimulatorConfig(files_per_torrent=4)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, qb_server):
+    monkeypatch.setattr(renaming_processor.RuleEngine, 'process_videos', _process_videos)
+    flask_app = Flask('test')
+    flask_app.logger = _QuietLogger()
+    flask_app.db = Database(f"sqlite:///{tmp_path / 'test.db'}", logger=flask_app.logger)
+    flask_app.debug_manager = DebugManager(flask_app.db)
+    config = qb_server.sim.config
+    flask_app.db.add_auth('qbittorrent', config.username, config.password, qb_server.url)
+    return flask_app
+
+
+def test_files_are_renamed_through_real_client(app, qb_server):
+    """Переименование идет из пула потоков: настоящий клиент qBittorrent требует в них контекст приложения."""
+    db = app.db
+    qb_hash = 'ab' * 20
+    qb_server.sim.add([], [f"magnet:?xt=urn:btih:{qb_hash}"], {'savepath': '/downloads/show'})
+    original_names = [f['name'] for f in qb_server.sim.torrent_files(qb_hash)]
+
+    with app.app_context():
+        profile_id = db.create_parser_profile('rename')
+        series_id = db.add_series({'name': 'Шоу', 'name_en': 'Show', 'url': 'https://tracker/series', 'site': 'tracker',
+                                   'save_path': '/downloads/show', 'season': 's01', 'parser_profile_id': profile_id})
+        db.add_torrent(series_id, {'torrent_id': '1', 'link': 'https://tracker/1'}, qb_hash=qb_hash)
+        qb_client = QBittorrentClient(AuthManager(db, app.logger), db, app.logger)
+        process_and_rename_torrent_files(app, series_id, qb_hash, qb_client=qb_client)
+
+    renamed_names = [f['name'] for f in qb_server.sim.torrent_files(qb_hash)]
+    assert len(renamed_names) == len(original_names)
+    assert not set(renamed_names) & set(original_names)
+    requests = qb_server.sim.get_stats()['requests']
+    assert requests.get('/api/v2/torrents/renameFile', 0) + requests.get('/api/v2/torrents/renameFolder', 0) > 0
+    statuses = {f['status'] for f in db.get_torrent_files_for_torrent(db.get_torrent_by_hash(qb_hash)['id'])}
+    assert statuses == {'renamed'}
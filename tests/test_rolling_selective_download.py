@@ -0,0 +1,94 @@
+import os
+import re
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import Database
+from logic import renaming_processor
+from logic.renaming_processor import build_inherited_file_records, process_and_rename_torrent_files
+
+
+class _QuietLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+    warning = error = debug = info
+
+
+class _FakeQbClient:
+    """Файлы торрентов и приоритеты в памяти вместо qBittorrent."""
+    def __init__(self):
+        self.files = {}
+        self.priorities = {}
+
+    def get_torrent_files(self, qb_hash):
+        return [{'name': name, 'index': index} for index, name in enumerate(self.files[qb_hash])]
+
+    def rename_file(self, qb_hash, old_path, new_path):
+        files = self.files[qb_hash]
+        files[files.index(old_path)] = new_path
+        return True
+
+    def rename_folder(self, qb_hash, old_path, new_path):
+        self.files[qb_hash] = [new_path + name[len(old_path):] if name.startswith(old_path + '/') else name
+                               for name in self.files[qb_hash]]
+        return True
+
+    def set_file_priority(self, qb_hash, indexes, priority):
+        self.priorities.setdefault(qb_hash, {}).update({index: priority for index in indexes})
+        return True
+
+
+def _process_videos(self, profile_id, videos):
+    results = []
+    for video in videos:
+        match = re.search(r'E(\d+)', video['title'])
+        results.append({'result': {'extracted': {'episode': int(match.group(1))} if match else {}}})
+    return results
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(renaming_processor.RuleEngine, 'process_videos', _process_videos)
+    flask_app = Flask('test')
+    flask_app.logger = _QuietLogger()
+    flask_app.db = Database(f"sqlite:///{tmp_path / 'test.db'}", logger=flask_app.logger)
+    flask_app.db.set_setting('rolling_selective_download', 'true')
+    return flask_app
+
+
+def _add_rolling_torrent(app, qb_client, series_id, number, episodes, old_torrent=None):
+    """Повторяет замену rolling-торрента в сканере и обработку его файлов."""
+    db = app.db
+    qb_hash = f"{number:040x}"
+    db.add_torrent(series_id, {'torrent_id': str(number), 'link': f"https://tracker/{number}"}, qb_hash=qb_hash)
+    qb_client.files[qb_hash] = [f"Show/Show.E{episode:02d}.mkv" for episode in episodes]
+    if old_torrent:
+        inherited_files = build_inherited_file_records(db, old_torrent['id'])
+        db.deactivate_torrent_and_clear_files(old_torrent['id'])
+        db.add_or_update_torrent_files(db.get_torrent_by_hash(qb_hash)['id'], inherited_files)
+    process_and_rename_torrent_files(app, series_id, qb_hash, qb_client=qb_client)
+    return db.get_torrent_by_hash(qb_hash)
+
+
+def test_second_rolling_replacement_keeps_skipped_episodes(app):
+    db = app.db
+    qb_client = _FakeQbClient()
+    profile_id = db.create_parser_profile('rolling')
+    series_id = db.add_series({'name': 'Шоу', 'name_en': 'Show', 'url': 'https://tracker/series', 'site': 'tracker',
+                               'save_path': '/downloads/show', 'season': 's01', 'parser_profile_id': profile_id})
+
+    first = _add_rolling_torrent(app, qb_client, series_id, 1, [1, 2])
+    second = _add_rolling_torrent(app, qb_client, series_id, 2, [1, 2, 3, 4], old_torrent=first)
+    assert qb_client.priorities[second['qb_hash']] == {0: 0, 1: 0}
+
+    third = _add_rolling_torrent(app, qb_client, series_id, 3, [1, 2, 3, 4, 5, 6], old_torrent=second)
+    # Серии 1-2 пропущены при первой замене, но по-прежнему считаются имеющимися
+    assert qb_client.priorities[third['qb_hash']] == {0: 0, 1: 0, 2: 0, 3: 0}
+    statuses = [f['status'] for f in sorted(db.get_torrent_files_for_torrent(third['id']), key=lambda f: f['original_path'])]
+    assert statuses == ['skipped'] * 4 + ['renamed'] * 2
+    assert db.get_downloaded_episode_count(series_id) == 6
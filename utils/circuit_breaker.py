@@ -0,0 +1,95 @@
+# Файл: utils/circuit_breaker.py
+
+import threading
+import time
+from typing import Dict, Optional
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для внешнего сервиса, общий для всех потоков процесса.
+
+    closed    - запросы идут как обычно, считаются подряд идущие сбои;
+    open      - после failure_threshold сбоев подряд запросы сразу отклоняются;
+    half_open - по истечении reset_timeout пропускается один пробный запрос:
+                успех закрывает выключатель, сбой снова открывает его с удвоенным таймаутом.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 15, max_reset_timeout: float = 300):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.reset_timeout = reset_timeout
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.last_failure_time: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.rejected_count = 0
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at >= self.reset_timeout:
+                    self.state = self.HALF_OPEN
+                    self.probe_in_flight = True
+                    return True
+                self.rejected_count += 1
+                return False
+            # HALF_OPEN: одновременно выполняется только один пробный запрос
+            if self.probe_in_flight:
+                self.rejected_count += 1
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self, error: str = None) -> bool:
+        """Регистрирует сбой. Возвращает True, если выключатель только что открылся."""
+        with self.lock:
+            self.last_failure_time = time.time()
+            self.last_error = error
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self._open_unsafe()
+                return True
+            if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open_unsafe()
+                return True
+            return False
+
+    def _open_unsafe(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.probe_in_flight = False
+
+    def get_state(self) -> Dict:
+        with self.lock:
+            retry_in = None
+            if self.state == self.OPEN and self.opened_at:
+                retry_in = max(0.0, round(self.reset_timeout - (time.time() - self.opened_at), 1))
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in_seconds': retry_in,
+                'rejected_count': self.rejected_count,
+                'last_error': self.last_error,
+                'last_failure_time': self.last_failure_time,
+            }
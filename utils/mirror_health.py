@@ -0,0 +1,194 @@
+# Файл: utils/mirror_health.py
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from utils.rate_limiter import get_rate_limiter
+
+# Последние исходы парсинга на зеркало, по которым считаются доля успехов и перцентили задержки
+RECENT_OUTCOMES = 20
+# Экспоненциальная пауза до следующей проверки упавшего зеркала
+PROBE_BASE_BACKOFF = 60
+PROBE_MAX_BACKOFF = 6 * 3600
+PROBE_TIMEOUT = 10
+# Предпочитаемое зеркало меняется, только если другое заметно надежнее: иначе порядок "скачет" между сканированиями
+STICKY_MARGIN = 0.2
+# Доля успехов зеркала без истории
+UNKNOWN_SUCCESS_RATE = 0.5
+
+_health_lock = threading.Lock()
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * percent))], 3)
+
+
+def mirror_stats(entry: Optional[Dict], now: Optional[float] = None) -> Dict:
+    """
+    Сводка по одному зеркалу: доля успехов, p50/p95 задержки, последний сбой и пауза до проверки.
+    Ошибки разбора доступной страницы учитываются отдельно и на порядок зеркал не влияют.
+    """
+    entry = entry or {}
+    now = now or time.time()
+    recent = entry.get('recent', [])
+    latencies = [latency for ok, latency in recent if ok and latency is not None]
+    next_probe_at = entry.get('next_probe_at')
+    return {
+        'success_rate': round(sum(ok for ok, _ in recent) / len(recent), 3) if recent else None,
+        'p50_latency': _percentile(latencies, 0.5),
+        'p95_latency': _percentile(latencies, 0.95),
+        'samples': len(recent),
+        'consecutive_failures': entry.get('consecutive_failures', 0),
+        'last_success': entry.get('last_success'),
+        'last_failure': entry.get('last_failure'),
+        'last_error': entry.get('last_error'),
+        'backoff_until': datetime.fromtimestamp(next_probe_at, timezone.utc).isoformat() if next_probe_at else None,
+        'in_backoff': bool(next_probe_at and next_probe_at > now),
+        'parse_errors': entry.get('parse_errors', 0),
+        'last_parse_error': entry.get('last_parse_error'),
+        'last_parse_error_at': entry.get('last_parse_error_at'),
+    }
+
+
+def summarize_mirror_health(tracker: Dict) -> Dict:
+    health = tracker.get('mirror_health') or {}
+    mirrors = health.get('mirrors', {})
+    return {
+        'preferred': health.get('preferred'),
+        'mirrors': {mirror: mirror_stats(mirrors.get(mirror)) for mirror in tracker.get('mirrors', [])},
+    }
+
+
+def _rank_key(stats: Dict, index: int):
+    success_rate = stats['success_rate'] if stats['success_rate'] is not None else UNKNOWN_SUCCESS_RATE
+    latency = stats['p50_latency'] if stats['p50_latency'] is not None else float('inf')
+    return (stats['in_backoff'], -success_rate, latency, index)
+
+
+def order_mirrors(tracker: Dict, current_domain: Optional[str] = None) -> List[str]:
+    """
+    Зеркала трекера от самого здорового к самому проблемному. Зеркала на паузе после сбоев идут последними,
+    но не исключаются. Предпочитаемое зеркало остается первым, пока не уходит на паузу или не отстает
+    по доле успехов больше чем на STICKY_MARGIN. При равенстве выигрывает домен из URL сериала.
+    """
+    mirrors = list(tracker.get('mirrors') or [])
+    if current_domain:
+        # Зеркала хранятся без 'www.', как их сравнивает TrackerResolver
+        stripped_domain = current_domain.replace('www.', '')
+        current_domain = stripped_domain if stripped_domain in mirrors else current_domain
+        if current_domain in mirrors:
+            mirrors.remove(current_domain)
+        mirrors.insert(0, current_domain)
+    health = tracker.get('mirror_health') or {}
+    now = time.time()
+    stats = {mirror: mirror_stats(health.get('mirrors', {}).get(mirror), now) for mirror in mirrors}
+    positions = {mirror: index for index, mirror in enumerate(mirrors)}
+    ordered = sorted(mirrors, key=lambda m: _rank_key(stats[m], positions[m]))
+
+    preferred = health.get('preferred')
+    if preferred in stats and ordered and ordered[0] != preferred and not stats[preferred]['in_backoff']:
+        best_rate = stats[ordered[0]]['success_rate']
+        best_rate = best_rate if best_rate is not None else UNKNOWN_SUCCESS_RATE
+        preferred_rate = stats[preferred]['success_rate']
+        if preferred_rate is not None and best_rate - preferred_rate <= STICKY_MARGIN:
+            ordered.remove(preferred)
+            ordered.insert(0, preferred)
+    return ordered
+
+
+def order_scan_urls(tracker: Dict, url: str) -> List[str]:
+    """URL сериала, переписанный на каждое зеркало трекера, в порядке убывания здоровья зеркал."""
+    parsed_url = urlparse(url)
+    return [parsed_url._replace(netloc=mirror).geturl() for mirror in order_mirrors(tracker, parsed_url.netloc)]
+
+
+def _apply_outcome(entry: Dict, success: bool, latency: Optional[float], error: Optional[str], probe: bool):
+    if not probe:
+        entry['recent'] = (entry.get('recent', []) + [[1 if success else 0, round(latency, 3) if success and latency is not None else None]])[-RECENT_OUTCOMES:]
+    if success:
+        entry['last_success'] = _now_iso()
+        entry['consecutive_failures'] = 0
+        entry['next_probe_at'] = None
+    else:
+        entry['last_failure'] = _now_iso()
+        entry['last_error'] = (error or '')[:300]
+        entry['consecutive_failures'] = entry.get('consecutive_failures', 0) + 1
+        backoff = min(PROBE_MAX_BACKOFF, PROBE_BASE_BACKOFF * 2 ** (entry['consecutive_failures'] - 1))
+        entry['next_probe_at'] = time.time() + backoff
+
+
+def record_mirror_result(db, tracker_id: int, mirror: str, success: bool, latency: Optional[float] = None,
+                         error: Optional[str] = None, probe: bool = False):
+    """
+    Учитывает исход запроса к зеркалу. Исходы парсинга попадают в статистику доли успехов и задержки;
+    пробы (probe=True) только снимают или продлевают паузу. Успех парсинга делает зеркало предпочитаемым,
+    если текущее предпочитаемое на паузе или не задано.
+    """
+    with _health_lock:
+        health = db.get_tracker_mirror_health(tracker_id)
+        mirrors = health.setdefault('mirrors', {})
+        entry = mirrors.setdefault(mirror, {})
+        _apply_outcome(entry, success, latency, error, probe)
+        preferred = health.get('preferred')
+        if success and not probe:
+            if not preferred or mirror_stats(mirrors.get(preferred))['in_backoff']:
+                health['preferred'] = mirror
+        elif not success and preferred == mirror:
+            # Предпочитаемое зеркало уступает место лучшему из остальных
+            health['preferred'] = None
+        db.set_tracker_mirror_health(tracker_id, health)
+
+
+def record_mirror_parse_error(db, tracker_id: int, mirror: str, error: Optional[str]):
+    """
+    Учитывает ошибку разбора страницы, которую зеркало отдало: изменилась разметка или на странице нет
+    ожидаемых элементов. Это не сбой зеркала - доля успехов, пауза и предпочитаемое зеркало не меняются.
+    """
+    with _health_lock:
+        health = db.get_tracker_mirror_health(tracker_id)
+        entry = health.setdefault('mirrors', {}).setdefault(mirror, {})
+        entry['parse_errors'] = entry.get('parse_errors', 0) + 1
+        entry['last_parse_error'] = (error or '')[:300]
+        entry['last_parse_error_at'] = _now_iso()
+        db.set_tracker_mirror_health(tracker_id, health)
+
+
+def probe_due_mirrors(db, logger) -> int:
+    """Проверяет зеркала, у которых истекла пауза после сбоев. Возвращает число проверенных зеркал."""
+    now = time.time()
+    probed = 0
+    for tracker in db.get_all_trackers():
+        mirrors_health = (tracker.get('mirror_health') or {}).get('mirrors', {})
+        for mirror in tracker.get('mirrors', []):
+            next_probe_at = mirrors_health.get(mirror, {}).get('next_probe_at')
+            if not next_probe_at or next_probe_at > now:
+                continue
+            get_rate_limiter(db, logger).acquire(f"https://{mirror}/")
+            started_at = time.time()
+            try:
+                response = requests.get(f"https://{mirror}/", timeout=PROBE_TIMEOUT,
+                                        headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36'})
+                # Антибот-страница или 403 тоже означают, что зеркало отвечает; недоступность - 5xx и сетевые ошибки
+                success = response.status_code < 500
+                error = None if success else f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                success, error = False, str(e)
+            record_mirror_result(db, tracker['id'], mirror, success, time.time() - started_at, error, probe=True)
+            probed += 1
+            if success:
+                logger.info("mirror_health", f"Зеркало {mirror} ({tracker['canonical_name']}) снова доступно.")
+            else:
+                logger.warning("mirror_health", f"Зеркало {mirror} ({tracker['canonical_name']}) по-прежнему недоступно: {error}")
+    return probed
@@ -0,0 +1,137 @@
+# Файл: utils/mirror_hedging.py
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_HEDGE_DELAY = 8
+
+
+def get_hedge_delay(db) -> float:
+    """Задержка перед запуском следующего зеркала (настройка 'scan_mirror_hedge_delay'). 0 - зеркала только по очереди."""
+    try:
+        return max(0.0, float(db.get_setting('scan_mirror_hedge_delay', DEFAULT_HEDGE_DELAY)))
+    except (ValueError, TypeError):
+        return DEFAULT_HEDGE_DELAY
+
+
+class HedgingStats:
+    """Время до результата сканирования по трекерам: сколько зеркал понадобилось и какое ответило первым."""
+    def __init__(self, maxlen: int = 200):
+        self.lock = threading.Lock()
+        self.maxlen = maxlen
+        self.trackers: Dict[str, Dict] = {}
+
+    def record(self, tracker_name: str, elapsed: float, launched: int, winner: Optional[str]):
+        with self.lock:
+            stats = self.trackers.setdefault(tracker_name, {
+                'scans': 0, 'hedged': 0, 'failed': 0, 'wins': {}, 'times': deque(maxlen=self.maxlen), 'degraded_times': deque(maxlen=self.maxlen)})
+            stats['scans'] += 1
+            stats['times'].append(elapsed)
+            if launched > 1:
+                stats['hedged'] += 1
+                stats['degraded_times'].append(elapsed)
+            if winner:
+                stats['wins'][winner] = stats['wins'].get(winner, 0) + 1
+            else:
+                stats['failed'] += 1
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict:
+        if not values:
+            return {'avg': 0, 'p50': 0, 'p95': 0}
+        values = sorted(values)
+        return {
+            'avg': round(sum(values) / len(values), 3),
+            'p50': round(values[len(values) // 2], 3),
+            'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        }
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            snapshot = {name: (dict(stats), list(stats['times']), list(stats['degraded_times'])) for name, stats in self.trackers.items()}
+        metrics = {}
+        for name, (stats, times, degraded_times) in snapshot.items():
+            metrics[name] = {
+                'scans': stats['scans'],
+                'hedged': stats['hedged'],
+                'failed': stats['failed'],
+                'wins': dict(stats['wins']),
+                'time_to_result': self._percentiles(times),
+                # Только сканирования, где основной адрес не ответил вовремя
+                'degraded_time_to_result': self._percentiles(degraded_times),
+            }
+        return metrics
+
+
+hedging_stats = HedgingStats()
+
+
+def _run_in_app_context(flask_app, attempt, url, cancel_event):
+    with flask_app.app_context():
+        return attempt(url, cancel_event)
+
+
+def fetch_with_hedging(flask_app, attempt: Callable[[str, threading.Event], Dict], urls: List[str],
+                       hedge_delay: float, tracker_name: str = '') -> Tuple[Dict, Optional[str]]:
+    """
+    Получает результат парсера с первого ответившего зеркала.
+
+    Первый адрес запускается сразу; если за hedge_delay секунд он не вернул результат,
+    параллельно запускается следующий, и так далее. Ошибка зеркала запускает следующее сразу.
+    Берется первый результат без ключа 'error'; остальным попыткам выставляется cancel_event,
+    и они завершаются на ближайшей проверке. attempt(url, cancel_event) выполняется в контексте приложения.
+    Возвращает (результат, адрес победителя); если все зеркала вернули ошибку - (последняя ошибка, None).
+    """
+    logger = flask_app.logger
+    cancel_event = threading.Event()
+    started_at = time.time()
+    executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix='mirror_hedge')
+    pending = {}
+    launched = 0
+    last_result: Dict = {"error": "Нет адресов для парсинга"}
+
+    def launch_next():
+        nonlocal launched
+        url = urls[launched]
+        launched += 1
+        pending[executor.submit(_run_in_app_context, flask_app, attempt, url, cancel_event)] = url
+
+    try:
+        launch_next()
+        while pending:
+            has_more = launched < len(urls)
+            done, _ = wait(list(pending), timeout=hedge_delay if has_more and hedge_delay > 0 else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info("scanner", f"Нет ответа за {hedge_delay:g} с, параллельно запускается зеркало {urls[launched]}")
+                launch_next()
+                continue
+
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": str(e)}
+                if not result.get('error'):
+                    elapsed = time.time() - started_at
+                    hedging_stats.record(tracker_name, elapsed, launched, urlparse(url).netloc)
+                    if launched > 1:
+                        logger.info("scanner", f"Результат получен с {url} за {elapsed:.1f} с (запущено адресов: {launched}).")
+                    return result, url
+                last_result = result
+                logger.warning("scanner", f"Ошибка парсинга {url}: {result.get('error')}")
+
+            # Упавшее зеркало освобождает место следующему, не дожидаясь задержки
+            if launched < len(urls):
+                launch_next()
+
+        hedging_stats.record(tracker_name, time.time() - started_at, launched, None)
+        return last_result, None
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,97 @@
+# Файл: utils/page_cache.py
+
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional
+from db import Database
+from logger import Logger
+
+# Фрагменты страницы, которые меняются при каждой загрузке и не влияют на результат парсинга
+_VOLATILE_PATTERNS = [
+    re.compile(r'<script\b.*?</script\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<style\b.*?</style\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<noscript\b.*?</noscript\s*>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<!--.*?-->', re.DOTALL),
+    # Значения скрытых полей - как правило, одноразовые токены форм
+    re.compile(r'(<input\b[^>]*type=["\']?hidden["\']?[^>]*?)\svalue=("[^"]*"|\'[^\']*\'|\S+)', re.IGNORECASE),
+]
+_WHITESPACE = re.compile(r'\s+')
+_TAG_WHITESPACE = re.compile(r'\s*([<>])\s*')
+
+
+class PageCache:
+    """
+    Кэш страниц трекеров для пропуска разбора неизменившихся страниц.
+
+    Для каждого URL хранятся ETag/Last-Modified, хеш нормализованного HTML и результат парсера.
+    Результат парсера зависит от страницы и от уже известных торрентов (им ставится link=None),
+    поэтому сохраненный результат возвращается, только если совпадает и отпечаток известных торрентов.
+    С enabled=False (принудительная замена торрентов) кэш не читается и не пишется.
+    """
+    def __init__(self, db: Database, logger: Logger, log_group: str, enabled: bool = True):
+        self.db = db
+        self.logger = logger
+        self.log_group = log_group
+        self.enabled = enabled
+
+    @staticmethod
+    def known_key(last_known_torrents: Optional[List[Dict]]) -> str:
+        items = sorted(f"{t.get('torrent_id')}|{t.get('date_time')}" for t in (last_known_torrents or []))
+        return hashlib.sha1('\n'.join(items).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def content_hash(html_content: str) -> str:
+        normalized = html_content
+        for pattern in _VOLATILE_PATTERNS:
+            normalized = pattern.sub(r'\1' if pattern.groups else '', normalized)
+        normalized = _TAG_WHITESPACE.sub(r'\1', _WHITESPACE.sub(' ', normalized)).strip()
+        return hashlib.sha1(normalized.encode('utf-8', errors='replace')).hexdigest()
+
+    def conditional_headers(self, url: str, known_key: str) -> Dict[str, str]:
+        """Заголовки условного запроса. Пустые, если сохраненный результат не подходит к текущим известным торрентам."""
+        entry = self.db.get_page_cache(url) if self.enabled else None
+        if not entry or entry.get('known_key') != known_key or not entry.get('result'):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def lookup(self, url: str, known_key: str, html_content: Optional[str] = None, not_modified: bool = False) -> Optional[Dict]:
+        """
+        Возвращает сохраненный результат, если сервер ответил 304 (not_modified) или нормализованный HTML
+        не изменился. Результат помечается ключом 'not_modified'. None - страницу нужно разобрать.
+        """
+        entry = self.db.get_page_cache(url) if self.enabled else None
+        if not entry or not entry.get('result') or entry.get('known_key') != known_key:
+            return None
+        if not not_modified and (html_content is None or self.content_hash(html_content) != entry.get('content_hash')):
+            return None
+        try:
+            result = json.loads(entry['result'])
+        except (ValueError, TypeError):
+            return None
+        result['not_modified'] = True
+        reason = "304 Not Modified" if not_modified else "хеш содержимого совпал"
+        self.logger.info(self.log_group, f"Страница {url} не изменилась ({reason}), разбор пропущен.")
+        return result
+
+    def store(self, url: str, known_key: str, html_content: str, result: Dict,
+              etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict:
+        """Сохраняет результат разбора страницы и возвращает его без изменений. Результаты с ошибкой не сохраняются."""
+        if not self.enabled or result.get('error'):
+            return result
+        try:
+            self.db.set_page_cache(url, {
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_hash': self.content_hash(html_content),
+                'known_key': known_key,
+                'result': json.dumps(result, ensure_ascii=False),
+            })
+        except Exception as e:
+            self.logger.warning(self.log_group, f"Не удалось сохранить кэш страницы {url}: {e}")
+        return result
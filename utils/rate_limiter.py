@@ -0,0 +1,197 @@
+# Файл: utils/rate_limiter.py
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# Пределы по умолчанию: rate - запросов в секунду в среднем, burst - сколько можно отправить подряд,
+# daily - необязательный лимит за скользящие сутки (суточный лимит .torrent-файлов трекера).
+# Ключ - имя трекера (для всех его зеркал), '<трекер>:download' для скачивания .torrent или хост.
+DEFAULT_LIMITS = {
+    'default': {'rate': 2, 'burst': 5},
+    'kinozal': {'rate': 0.5, 'burst': 2},
+    'kinozal:download': {'rate': 0.1, 'burst': 2},
+    'rutracker': {'rate': 0.5, 'burst': 2},
+    'rutracker:download': {'rate': 0.2, 'burst': 2},
+    'astar': {'rate': 0.5, 'burst': 2},
+    'anilibria': {'rate': 1, 'burst': 3},
+    'anilibria_tv': {'rate': 0.5, 'burst': 2},
+    'api.vk.com': {'rate': 3, 'burst': 3},
+    'api.themoviedb.org': {'rate': 10, 'burst': 20},
+}
+CONFIG_REFRESH_INTERVAL = 60
+
+
+class RateLimitExceeded(Exception):
+    """Суточный лимит исчерпан или ожидание превысило max_wait: запрос не должен отправляться."""
+
+
+class TokenBucket:
+    """
+    Маркерная корзина с резервированием: каждый вызов сразу забирает маркер (баланс может уйти в минус)
+    и получает время ожидания своей очереди. Так ожидающие потоки обслуживаются в порядке прихода.
+    """
+    def __init__(self, rate: float, burst: int, daily: Optional[int] = None):
+        self.rate = max(rate, 0.001)
+        self.burst = max(1, burst)
+        self.daily = daily
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.day_window = deque()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.daily:
+                while self.day_window and now - self.day_window[0] >= 86400:
+                    self.day_window.popleft()
+                if len(self.day_window) >= self.daily:
+                    raise RateLimitExceeded(f"суточный лимит {self.daily} запросов исчерпан")
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(f"ожидание {wait:.1f} с превышает {max_wait:g} с")
+            self.tokens -= 1
+            if self.daily:
+                self.day_window.append(now + wait)
+            return wait
+
+
+class HostRateLimiter:
+    """
+    Общий для процесса ограничитель запросов к внешним хостам. Все сетевые вызовы (парсеры, скачивание
+    .torrent, VK API, TMDB, вход на трекеры) проходят через acquire(url), который ждет своей очереди в корзине хоста.
+    Хосты зеркал одного трекера делят одну корзину. Пределы из DEFAULT_LIMITS переопределяются
+    настройкой 'rate_limits' (JSON вида {"kinozal:download": {"rate": 0.05, "burst": 1, "daily": 50}}).
+    """
+    def __init__(self, db, logger):
+        self.db = db
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.limits: Dict[str, Dict] = dict(DEFAULT_LIMITS)
+        self.mirror_to_tracker: Dict[str, str] = {}
+        self.config_loaded_at = 0.0
+        self.metrics: Dict[str, Dict] = {}
+
+    def _refresh_config(self):
+        if time.time() - self.config_loaded_at < CONFIG_REFRESH_INTERVAL:
+            return
+        self.config_loaded_at = time.time()
+        try:
+            overrides = json.loads(self.db.get_setting('rate_limits', '{}') or '{}')
+            mirror_to_tracker = {mirror: t['canonical_name'] for t in self.db.get_all_trackers() for mirror in t.get('mirrors', [])}
+        except Exception as e:
+            self.logger.warning("rate_limiter", f"Не удалось загрузить настройки ограничения запросов: {e}")
+            return
+        limits = dict(DEFAULT_LIMITS)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and value.get('rate'):
+                limits[key] = value
+        with self.lock:
+            # Корзины с изменившимися пределами пересоздаются при следующем запросе
+            for key in [k for k in self.buckets if self.limits.get(k) != limits.get(k)]:
+                del self.buckets[key]
+            self.limits = limits
+            self.mirror_to_tracker = mirror_to_tracker
+
+    def invalidate_config(self):
+        """Перечитывает пределы и зеркала трекеров при следующем запросе (после изменения настроек)."""
+        self.config_loaded_at = 0.0
+
+    def resolve_key(self, url: str, purpose: Optional[str] = None) -> str:
+        """Ключ корзины для URL: имя трекера по его зеркалам, иначе хост."""
+        self._refresh_config()
+        host = (urlparse(url).hostname or url).lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        tracker = self.mirror_to_tracker.get(host[3:] if host.startswith('dl.') else host)
+        if not tracker:
+            return host
+        if purpose and f"{tracker}:{purpose}" in self.limits:
+            return f"{tracker}:{purpose}"
+        return tracker
+
+    def _bucket(self, key: str) -> TokenBucket:
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                limits = self.limits.get(key) or self.limits['default']
+                bucket = TokenBucket(float(limits['rate']), int(limits.get('burst', 1)), limits.get('daily'))
+                self.buckets[key] = bucket
+                self.metrics.setdefault(key, {'requests': 0, 'delayed': 0, 'rejected': 0, 'waiting': 0,
+                                              'total_wait': 0.0, 'max_wait': 0.0, 'waits': deque(maxlen=200)})
+            return bucket
+
+    def acquire(self, url: str, purpose: Optional[str] = None, max_wait: Optional[float] = None) -> float:
+        """
+        Ждет разрешения на запрос к хосту url и возвращает время ожидания в секундах.
+        purpose='download' выбирает отдельную корзину '<трекер>:download', если она задана.
+        RateLimitExceeded - суточный лимит исчерпан или ждать пришлось бы дольше max_wait.
+        """
+        key = self.resolve_key(url, purpose)
+        bucket = self._bucket(key)
+        try:
+            wait = bucket.reserve(max_wait)
+        except RateLimitExceeded:
+            with self.lock:
+                self.metrics[key]['rejected'] += 1
+            raise
+        with self.lock:
+            stats = self.metrics[key]
+            stats['requests'] += 1
+            stats['waits'].append(wait)
+            stats['total_wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+            if wait > 0:
+                stats['delayed'] += 1
+                stats['waiting'] += 1
+        if wait > 0:
+            if wait >= 1:
+                self.logger.info("rate_limiter", f"Запрос к {key} отложен на {wait:.1f} с.")
+            try:
+                time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.metrics[key]['waiting'] -= 1
+        return wait
+
+    def get_metrics(self) -> Dict:
+        with self.lock:
+            snapshot = {key: (dict(stats), sorted(stats['waits'])) for key, stats in self.metrics.items()}
+            limits = dict(self.limits)
+        result = {}
+        for key, (stats, waits) in snapshot.items():
+            result[key] = {
+                'limit': limits.get(key) or limits['default'],
+                'requests': stats['requests'],
+                'delayed': stats['delayed'],
+                'rejected': stats['rejected'],
+                'waiting': stats['waiting'],
+                'avg_wait': round(stats['total_wait'] / stats['requests'], 3) if stats['requests'] else 0,
+                'p95_wait': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0,
+                'max_wait': round(stats['max_wait'], 3),
+            }
+        return result
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(db, logger) -> HostRateLimiter:
+    """
+    Возвращает общий для процесса ограничитель запросов. Пределы по умолчанию - DEFAULT_LIMITS,
+    переопределения - настройка 'rate_limits'.
+    """
+    global _shared_limiter
+    if _shared_limiter is None:
+        with _shared_limiter_lock:
+            if _shared_limiter is None:
+                _shared_limiter = HostRateLimiter(db, logger)
+    return _shared_limiter
@@ -0,0 +1,167 @@
+# Файл: utils/session_store.py
+
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.cookies import create_cookie
+
+# Ключ шифрования cookies: переменная окружения или файл рядом с базой. Ключ не хранится в самой базе,
+# иначе копия app.db раскрывала бы сессии трекеров.
+KEY_ENV_VAR = 'SESSION_STORE_KEY'
+KEY_FILE = 'session_store.key'
+
+
+def _load_or_create_key() -> bytes:
+    from cryptography.fernet import Fernet
+
+    env_key = os.environ.get(KEY_ENV_VAR)
+    if env_key:
+        return env_key.encode()
+    if os.path.exists(KEY_FILE):
+        with open(KEY_FILE, 'rb') as f:
+            return f.read().strip()
+    key = Fernet.generate_key()
+    fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def credentials_fingerprint(credentials: Dict) -> str:
+    """Отпечаток логина и пароля: сохраненная сессия не используется после смены учетных данных."""
+    return hashlib.sha256(f"{credentials.get('username')}\0{credentials.get('password')}".encode('utf-8')).hexdigest()
+
+
+def _serialize_cookies(session: requests.Session) -> list:
+    return [{
+        'name': cookie.name,
+        'value': cookie.value,
+        'domain': cookie.domain,
+        'path': cookie.path,
+        'expires': cookie.expires,
+        'secure': cookie.secure,
+        'rest': {'HttpOnly': None} if cookie.has_nonstandard_attr('HttpOnly') else {},
+    } for cookie in session.cookies]
+
+
+def _restore_session(cookies: list) -> requests.Session:
+    session = requests.Session()
+    for cookie in cookies:
+        session.cookies.set_cookie(create_cookie(**cookie))
+    session.cookies.clear_expired_cookies()
+    return session
+
+
+class SessionStore:
+    """
+    Общее для процесса хранилище авторизованных сессий трекеров. Сессия ищется в памяти, затем в таблице
+    tracker_sessions (cookies зашифрованы Fernet), и только потом выполняется вход. Вход для одного ключа
+    выполняет один поток, остальные ждут его результата. Сессия сбрасывается только через invalidate(),
+    когда трекер ответил страницей входа.
+    """
+    def __init__(self, db, logger):
+        self.db = db
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, tuple] = {} # ключ -> (отпечаток учетных данных, сессия)
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.fernet = None
+        self.stats = {'memory_hits': 0, 'restored': 0, 'logins': 0, 'invalidations': 0}
+
+    def _get_fernet(self):
+        if self.fernet is None:
+            from cryptography.fernet import Fernet
+            self.fernet = Fernet(_load_or_create_key())
+        return self.fernet
+
+    def _count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _restore(self, key: str, fingerprint: str) -> Optional[requests.Session]:
+        entry = self.db.get_tracker_session(key)
+        if not entry or not entry['is_valid'] or not entry['payload']:
+            return None
+        try:
+            from cryptography.fernet import InvalidToken
+            data = json.loads(self._get_fernet().decrypt(entry['payload'].encode()))
+        except (InvalidToken, ValueError) as e:
+            self.logger.warning("auth", f"Сохраненная сессия {key} не расшифрована (сменился ключ?): {type(e).__name__}")
+            return None
+        if data.get('credentials') != fingerprint:
+            self.logger.info("auth", f"Учетные данные для {key} изменились, сохраненная сессия не используется.")
+            return None
+        session = _restore_session(data.get('cookies', []))
+        if not len(session.cookies):
+            self.logger.info("auth", f"Cookies сохраненной сессии {key} истекли.")
+            return None
+        self.db.touch_tracker_session(key)
+        return session
+
+    def get(self, auth_type: str, domain: str, credentials: Dict,
+            login: Callable[[], Optional[requests.Session]]) -> Optional[requests.Session]:
+        """Возвращает сессию для домена трекера: из памяти, из базы или после входа через login()."""
+        key = f"{auth_type}:{domain}"
+        fingerprint = credentials_fingerprint(credentials)
+        cached = self.sessions.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self._count('memory_hits')
+            return cached[1]
+        with self._key_lock(key):
+            # Пока поток ждал блокировку, вход мог выполнить другой поток
+            cached = self.sessions.get(key)
+            if cached is not None and cached[0] == fingerprint:
+                self._count('memory_hits')
+                return cached[1]
+            session = self._restore(key, fingerprint)
+            if session is not None:
+                self._count('restored')
+                self.logger.info("auth", f"Восстановлена сохраненная сессия для {domain}, вход не требуется.")
+            else:
+                session = login()
+                if session is None:
+                    return None
+                self._count('logins')
+                payload = json.dumps({'credentials': fingerprint, 'cookies': _serialize_cookies(session)})
+                self.db.save_tracker_session(key, auth_type, domain, self._get_fernet().encrypt(payload.encode()).decode())
+            self.sessions[key] = (fingerprint, session)
+            return session
+
+    def invalidate(self, auth_type: str, domain: str, reason: str):
+        """Сбрасывает сессию после отказа в авторизации: следующий get() выполнит вход заново."""
+        key = f"{auth_type}:{domain}"
+        with self.lock:
+            self.sessions.pop(key, None)
+            self.stats['invalidations'] += 1
+        self.db.invalidate_tracker_session(key, reason)
+        self.logger.warning("auth", f"Сессия {key} недействительна: {reason}")
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            'sessions': [{**entry, 'in_memory': entry['key'] in self.sessions} for entry in self.db.get_all_tracker_sessions()],
+        }
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_session_store(db, logger) -> SessionStore:
+    """Возвращает общее для процесса хранилище сессий трекеров."""
+    global _shared_store
+    if _shared_store is None:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = SessionStore(db, logger)
+    return _shared_store
@@ -2,6 +2,7 @@ import requests
 import time
 from typing import Optional, Dict, List, Any
 from flask import current_app
+from utils.rate_limiter import get_rate_limiter
 
 class TMDBClient:
     def __init__(self, db, logger):
@@ -37,6 +38,7 @@ class TMDBClient:
         }
         
         try:
+            get_rate_limiter(self.db, self.logger).acquire(url)
             response = requests.get(url, headers=self.headers, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
@@ -53,6 +55,7 @@ class TMDBClient:
         params = {"language": "ru-RU"}
         
         try:
+            get_rate_limiter(self.db, self.logger).acquire(url)
             response = requests.get(url, headers=self.headers, params=params, timeout=10)
             response.raise_for_status()
             return response.json()
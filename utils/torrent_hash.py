@@ -0,0 +1,112 @@
+# Файл: utils/torrent_hash.py
+
+import base64
+import hashlib
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+
+class BencodeError(ValueError):
+    pass
+
+
+def _skip_value(data: bytes, pos: int) -> int:
+    """Пропускает одно bencode-значение, начинающееся с pos, и возвращает позицию сразу после него."""
+    if pos >= len(data):
+        raise BencodeError("Неожиданный конец данных")
+    token = data[pos:pos + 1]
+
+    if token == b'i':
+        end = data.index(b'e', pos)
+        return end + 1
+    if token in (b'l', b'd'):
+        pos += 1
+        while data[pos:pos + 1] != b'e':
+            pos = _skip_value(data, pos)
+        return pos + 1
+    if token.isdigit():
+        colon = data.index(b':', pos)
+        length = int(data[pos:colon])
+        end = colon + 1 + length
+        if end > len(data):
+            raise BencodeError("Строка выходит за границы данных")
+        return end
+    raise BencodeError(f"Неизвестный токен bencode в позиции {pos}")
+
+
+def _read_string(data: bytes, pos: int) -> Tuple[bytes, int]:
+    colon = data.index(b':', pos)
+    length = int(data[pos:colon])
+    start = colon + 1
+    return data[start:start + length], start + length
+
+
+def _extract_info_dict(torrent_bytes: bytes) -> bytes:
+    """Возвращает исходные байты словаря 'info' без перекодирования (хеш считается именно по ним)."""
+    if not torrent_bytes or torrent_bytes[:1] != b'd':
+        raise BencodeError("Данные не являются bencode-словарем")
+    pos = 1
+    while torrent_bytes[pos:pos + 1] != b'e':
+        key, pos = _read_string(torrent_bytes, pos)
+        value_end = _skip_value(torrent_bytes, pos)
+        if key == b'info':
+            return torrent_bytes[pos:value_end]
+        pos = value_end
+    raise BencodeError("В .torrent файле отсутствует словарь 'info'")
+
+
+def _dict_keys(dict_bytes: bytes) -> set:
+    """Возвращает ключи верхнего уровня bencode-словаря."""
+    keys = set()
+    pos = 1
+    while dict_bytes[pos:pos + 1] != b'e':
+        key, pos = _read_string(dict_bytes, pos)
+        keys.add(key)
+        pos = _skip_value(dict_bytes, pos)
+    return keys
+
+
+def infohash_from_torrent_bytes(torrent_bytes: bytes) -> Optional[str]:
+    """
+    Вычисляет хеш торрента в том виде, в котором его возвращает qBittorrent (поле 'hash'):
+    SHA-1 словаря info для v1 и гибридных торрентов, усеченный до 20 байт SHA-256 для чистых v2.
+    Возвращает None, если файл не удалось разобрать.
+    """
+    try:
+        info = _extract_info_dict(torrent_bytes)
+    except (BencodeError, ValueError, IndexError):
+        return None
+
+    # Чистый v2 торрент не содержит 'pieces' (только 'meta version' 2 и 'file tree')
+    try:
+        info_keys = _dict_keys(info)
+    except (BencodeError, ValueError, IndexError):
+        return None
+    if b'pieces' not in info_keys and b'file tree' in info_keys:
+        return hashlib.sha256(info).hexdigest()[:40]
+    return hashlib.sha1(info).hexdigest()
+
+
+def infohash_from_magnet(magnet_link: str) -> Optional[str]:
+    """Извлекает хеш из magnet-ссылки (xt=urn:btih в hex или base32, либо xt=urn:btmh для v2)."""
+    try:
+        params = parse_qs(urlparse(magnet_link).query)
+    except ValueError:
+        return None
+
+    v2_hash = None
+    for xt in params.get('xt', []):
+        xt_lower = xt.lower()
+        if xt_lower.startswith('urn:btih:'):
+            value = xt[len('urn:btih:'):]
+            if re.fullmatch(r'[0-9a-fA-F]{40}', value):
+                return value.lower()
+            if re.fullmatch(r'[A-Za-z2-7]{32}', value):
+                return base64.b32decode(value.upper()).hex()
+        elif xt_lower.startswith('urn:btmh:1220'):
+            # multihash: 0x12 (sha2-256), 0x20 (32 байта)
+            value = xt[len('urn:btmh:1220'):]
+            if re.fullmatch(r'[0-9a-fA-F]{64}', value):
+                v2_hash = value.lower()[:40]
+    return v2_hash